@@ -0,0 +1,238 @@
+import json
+import os
+import pickle
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from adapters.IRNet.constants import PATH_TO_CONCEPTNET
+from api.atomic_dir import new_directory, store_lock
+from api.embeddings import source_signature
+from api.mmap_index import MappedKeyIndex, write_key_index
+
+# the graphs of ConceptNet used for schema linking
+GRAPH_NAMES = ["english_IsA", "english_RelatedTo"]
+
+STORE_DIR = Path(PATH_TO_CONCEPTNET) / "store"
+
+# file names inside the directory of a graph
+KEYS_INDEX_NAME = "keys"
+TARGETS_INDEX_NAME = "targets"
+INDPTR_FILENAME = "indptr.bin"
+EDGES_FILENAME = "edges.bin"
+SOURCES_INDPTR_FILENAME = "sources_indptr.bin"
+SOURCES_FILENAME = "sources.bin"
+META_FILENAME = "meta.json"
+
+STORE_FORMAT_VERSION = 2
+
+
+def pickle_file(name):
+    return Path(PATH_TO_CONCEPTNET) / (name + ".pkl")
+
+
+def convert_graph(source_file, graph_dir, if_outdated=False):
+    """
+        Convert a pickled ConceptNet graph (dict from key to targets) into a read-only store:
+        a key index that maps to rows of a CSR table whose entries are ids of interned targets,
+        and the inverse table from target id to the rows of the keys.
+        Concurrent conversions of processes into the same graph_dir are done one after the other,
+        the store is replaced as a whole once it is complete.
+
+        Args:
+            source_file: path of the pickle file
+            graph_dir: directory the store is written to
+            if_outdated: skip the conversion if the store is current, e.g. because another process just converted it
+    """
+    graph_dir = Path(graph_dir)
+    with store_lock(graph_dir):
+        if if_outdated and is_graph_current(source_file, graph_dir):
+            return
+
+        print('Converting ConceptNet graph from %s to %s' % (source_file, graph_dir))
+        with new_directory(graph_dir) as directory:
+            _write_graph_store(source_file, directory)
+
+
+def _write_graph_store(source_file, graph_dir):
+    with open(str(source_file), 'rb') as f:
+        graph = pickle.load(f)
+
+    # the id of a target is its position in the sorted target index, so ids can be mapped back to strings
+    targets = sorted({str(t) for values in graph.values() for t in values}, key=lambda t: t.encode('utf-8'))
+    target_ids = {t: i for i, t in enumerate(targets)}
+    write_key_index(graph_dir / TARGETS_INDEX_NAME, targets, range(len(targets)))
+
+    keys = list(graph)
+    indptr = np.zeros(len(keys) + 1, dtype=np.int64)
+    edges = []
+    for row, key in enumerate(keys):
+        # sorted for the binary search in ConceptTargets.__contains__
+        ids = sorted({target_ids[str(t)] for t in graph[key]})
+        edges.extend(ids)
+        indptr[row + 1] = len(edges)
+    write_key_index(graph_dir / KEYS_INDEX_NAME, keys, range(len(keys)))
+
+    indptr.tofile(str(graph_dir / INDPTR_FILENAME))
+    edges = np.array(edges, dtype=np.int32)
+    edges.tofile(str(graph_dir / EDGES_FILENAME))
+
+    # inverse table, the rows of each target are in ascending order
+    rows = np.repeat(np.arange(len(keys), dtype=np.int32), np.diff(indptr))
+    order = np.argsort(edges, kind='stable')
+    sources_indptr = np.zeros(len(targets) + 1, dtype=np.int64)
+    sources_indptr[1:] = np.cumsum(np.bincount(edges, minlength=len(targets)))
+    sources_indptr.tofile(str(graph_dir / SOURCES_INDPTR_FILENAME))
+    rows[order].tofile(str(graph_dir / SOURCES_FILENAME))
+
+    # written last, a store without meta data is incomplete
+    with open(str(graph_dir / META_FILENAME), 'w') as f:
+        json.dump({"format": STORE_FORMAT_VERSION, "source": source_signature(source_file),
+                   "keys": len(keys), "targets": len(targets)}, f, indent=4)
+
+
+def is_graph_current(source_file, graph_dir):
+    meta_file = Path(graph_dir) / META_FILENAME
+    if not meta_file.exists():
+        return False
+    with open(str(meta_file)) as f:
+        meta = json.load(f)
+    if meta.get("format") != STORE_FORMAT_VERSION:
+        return False
+    # the pickle files may be removed after the conversion
+    return not Path(source_file).exists() or meta["source"] == source_signature(source_file)
+
+
+def _map(path, dtype):
+    if os.path.getsize(str(path)) == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.asarray(np.memmap(str(path), dtype=dtype, mode='r'))
+
+
+class ConceptTargets:
+    """
+    Read-only set of the targets of a key, supports `in` like the lists of the pickled graph
+    """
+
+    __slots__ = ("graph", "ids")
+
+    def __init__(self, graph, ids):
+        self.graph = graph
+        self.ids = ids
+
+    def __contains__(self, target):
+        target_id = self.graph.target_index.get(target)
+        if target_id is None:
+            return False
+        position = int(self.ids.searchsorted(target_id))
+        return position < len(self.ids) and self.ids[position] == target_id
+
+    def __iter__(self):
+        for target_id in self.ids:
+            yield self.graph.target_index._key_at(int(target_id)).decode('utf-8')
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class ConceptGraph:
+    """
+    Read-only ConceptNet graph whose tables are memory-mapped, so that all workers share one copy.
+    Offers `in` and `[]` like the pickled dict.
+    """
+
+    def __init__(self, graph_dir):
+        graph_dir = Path(graph_dir)
+        self.key_index = MappedKeyIndex(graph_dir / KEYS_INDEX_NAME)
+        self.target_index = MappedKeyIndex(graph_dir / TARGETS_INDEX_NAME)
+        self.indptr = _map(graph_dir / INDPTR_FILENAME, np.int64)
+        self.edges = _map(graph_dir / EDGES_FILENAME, np.int32)
+        self.sources_indptr = _map(graph_dir / SOURCES_INDPTR_FILENAME, np.int64)
+        self.sources = _map(graph_dir / SOURCES_FILENAME, np.int32)
+
+    def __contains__(self, key):
+        return key in self.key_index
+
+    def __getitem__(self, key):
+        row = self.key_index.get(key)
+        if row is None:
+            raise KeyError(key)
+        return ConceptTargets(self, self.edges[self.indptr[row]:self.indptr[row + 1]])
+
+    def __len__(self):
+        return len(self.key_index)
+
+    def source_rows(self, target):
+        """
+            Returns the rows of all keys that have target among their targets
+        """
+        target_id = self.target_index.get(target)
+        if target_id is None:
+            return self.sources[:0]
+        return self.sources[self.sources_indptr[target_id]:self.sources_indptr[target_id + 1]]
+
+
+class ConceptColumnIndex:
+    """
+    Maps the keys of a graph to the first column of a schema that is among the targets of the key,
+    i.e. the result of ColumnScan, computed once for all keys
+    """
+
+    def __init__(self, graph, col_set):
+        """
+        Args:
+            graph: the ConceptGraph
+            col_set: the column names of the schema, earlier columns win
+        """
+        self.graph = graph
+        self.columns = dict()
+        for col in col_set:
+            for row in graph.source_rows(col).tolist():
+                self.columns.setdefault(row, col)
+
+    def get(self, key):
+        if not self.columns:
+            return None
+        row = self.graph.key_index.get(key)
+        if row is None:
+            return None
+        return self.columns.get(row)
+
+
+class ColumnScan:
+    """
+    Lookup of the first column that is among the targets of a key by scanning the columns,
+    as done by the original preprocessing of IRNet. Works for the pickled graphs as well.
+    """
+
+    def __init__(self, graph, col_set):
+        self.graph = graph
+        self.col_set = col_set
+
+    def get(self, key):
+        if key in self.graph:
+            targets = self.graph[key]
+            for col in self.col_set:
+                if col in targets:
+                    return col
+        return None
+
+
+_graphs = dict()
+_graphs_lock = threading.Lock()
+
+
+def load_concept_graph(name):
+    """
+        Returns the graph with the given name, converting the pickle file first if the store is outdated.
+        Each graph is opened once per process.
+    """
+    with _graphs_lock:
+        if name not in _graphs:
+            graph_dir = STORE_DIR / name
+            if not is_graph_current(pickle_file(name), graph_dir):
+                # the other worker processes wait for the first one to convert it
+                convert_graph(pickle_file(name), graph_dir, if_outdated=True)
+            _graphs[name] = ConceptGraph(graph_dir)
+        return _graphs[name]
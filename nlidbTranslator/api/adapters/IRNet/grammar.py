@@ -0,0 +1,64 @@
+import sys
+import types
+
+# names of the grammar module of IRNet, depending on whether it is imported from the IRNet package or from src
+IRNET_GRAMMAR_MODULES = {"src.rule.semQL", "IRNet.src.rule.semQL"}
+
+
+def grammar_namespace(module, grammar_module):
+    """
+        Returns a copy of the global names of module, in which the grammar module of IRNet and its classes
+        are replaced by grammar_module and its classes of the same names
+    """
+    namespace = dict(vars(module))
+    for name, value in vars(module).items():
+        if isinstance(value, types.ModuleType) and value.__name__ in IRNET_GRAMMAR_MODULES:
+            namespace[name] = grammar_module
+        elif isinstance(value, type) and value.__module__ in IRNET_GRAMMAR_MODULES \
+                and hasattr(grammar_module, value.__name__):
+            namespace[name] = getattr(grammar_module, value.__name__)
+    return namespace
+
+
+def with_grammar(cls, grammar_module, **names):
+    """
+        Creates a subclass of a class of IRNet whose methods create and compare the actions through the classes
+        of grammar_module instead of the grammar module of IRNet. The module of cls and the other users of the
+        grammar module of IRNet (e.g. sem2SQL) are not changed. Only the names the module of cls imports are
+        replaced, IRNet imports the grammar module or its classes by name and does not reach them through a package.
+
+        Args:
+            cls: class of IRNet, e.g. the model or the beams of its beam search
+            grammar_module: module with the same classes as the grammar module of IRNet, e.g. the adapter's semQL
+            names: further global names to replace in the methods, e.g. with classes created by with_grammar
+
+        Returns:
+            the subclass, with the name of cls
+    """
+    namespace = grammar_namespace(sys.modules[cls.__module__], grammar_module)
+    namespace.update(names)
+
+    def rebind(function):
+        method = types.FunctionType(function.__code__, namespace, function.__name__, function.__defaults__,
+                                    function.__closure__)
+        method.__kwdefaults__ = function.__kwdefaults__
+        method.__qualname__ = function.__qualname__
+        method.__doc__ = function.__doc__
+        return method
+
+    methods = dict()
+    for name, value in vars(cls).items():
+        if isinstance(value, types.FunctionType):
+            methods[name] = rebind(value)
+        elif isinstance(value, (staticmethod, classmethod)) and isinstance(value.__func__, types.FunctionType):
+            methods[name] = type(value)(rebind(value.__func__))
+    return type(cls.__name__, (cls,), dict(methods, __module__=cls.__module__))
+
+
+def grammar_model(model_cls, grammar_module):
+    """
+        Returns the subclass of the model of IRNet (see with_grammar) whose beam search also uses grammar_module
+    """
+    beams = vars(sys.modules[model_cls.__module__]).get("Beams")
+    names = {"Beams": with_grammar(beams, grammar_module)} if isinstance(beams, type) else {}
+    return with_grammar(model_cls, grammar_module, **names)
@@ -1,15 +1,43 @@
-from adapters.IRNet.irnet_adapter import IRNetAdapter
-from api.setup_util import no_stdout
+from api.batching import MicroBatcher
+from api.setup_util import get_setting, no_stdout
 
 iRNetAdapter = None
 
+# concurrent questions are encoded in batches if IRNET_BATCH_SIZE is larger than 1
+batcher = MicroBatcher(lambda requests: iRNetAdapter.translate_batch(requests),
+                       max_size=get_setting("IRNET_BATCH_SIZE", 1),
+                       max_wait=get_setting("IRNET_BATCH_WAIT_MS", 5) / 1000, name="irnet-batcher")
+
 
 @no_stdout
 def setup():
     global iRNetAdapter
+    # imported here, so that importing the interface does not load IRNet
+    from adapters.IRNet.irnet_adapter import IRNetAdapter
+
     iRNetAdapter = IRNetAdapter()
 
 
+def model_files():
+    # cached translations are invalidated when the checkpoint changes
+    from adapters.IRNet.parse_args import init_arg_parser
+
+    return [init_arg_parser().load_model]
+
+
+def teardown():
+    global iRNetAdapter
+    batcher.stop()
+    iRNetAdapter = None
+
+
 @no_stdout
 def translate(nl_question, db_id):
+    if batcher.max_size > 1:
+        return batcher.submit((nl_question, db_id))
     return iRNetAdapter.translate(nl_question, db_id)
+
+
+@no_stdout
+def translate_batch(requests):
+    return iRNetAdapter.translate_batch(requests)
@@ -1,13 +1,12 @@
-import pickle
+import threading
+
 import nltk
-import numpy as np
 import torch
-import os
-import copy
 
 from IRNet.preprocess import utils
-from src.rule import semQL
-from api.adapters.IRNet.constants import PATH_TO_CONCEPTNET
+from adapters.IRNet.concept_store import GRAPH_NAMES, ConceptColumnIndex, load_concept_graph
+from adapters.IRNet.grammar import grammar_model
+from api.analysis import schema_versions
 from api.paths import SCHEMAS_DIR
 from api.setup_util import schemas, no_stdout
 from IRNet.sem2SQL import transform
@@ -16,6 +15,54 @@ from IRNet.src.models.model import IRNet
 from IRNet.src.rule.sem_utils import wordnet_lemmatizer
 from IRNet.src.utils import to_batch_seq
 from api import setup_util
+from api.snapshot import open_snapshot, state_dict_to_arrays, arrays_to_state_dict, assign_state_dict
+from adapters.IRNet.src.rule import semQL
+
+def tokenize_name(name):
+    # tokenization of column and table names in to_batch_seq
+    return [wordnet_lemmatizer.lemmatize(v).lower() for v in name.split(' ')]
+
+
+def header_key(names):
+    return tuple(tuple(tokens) for tokens in names)
+
+
+class PreparedSchema:
+    """
+    Everything IRNet derives from a schema independently of the question, computed once per schema
+    """
+
+    def __init__(self, schema, version, concept_graphs):
+        self.schema = schema
+        # version of the schema file the schema was loaded from
+        self.version = version
+        self.col_set = [column[1] for column in schema['column_names']]
+        self.table_names = schema['table_names']
+
+        # the column and table names as to_batch_seq passes them to the model
+        col_set_iter = [tokenize_name(x) for x in self.col_set]
+        col_set_iter[0] = ['count', 'number', 'many']
+        self.header_keys = [header_key(col_set_iter), header_key([tokenize_name(x) for x in self.table_names])]
+        # header key to the embedding matrix of the names, computed at the first question
+        self.header_embeddings = dict()
+
+        self.concept_graphs = concept_graphs
+        # graph name to ConceptColumnIndex, built at the first question
+        self.column_indexes = dict()
+
+    def header_embedding(self, key, compute):
+        embedding = self.header_embeddings.get(key)
+        if embedding is None:
+            embedding = compute()
+            self.header_embeddings[key] = embedding
+        return embedding
+
+    def concept_columns(self, name):
+        index = self.column_indexes.get(name)
+        if index is None:
+            index = ConceptColumnIndex(self.concept_graphs[name], self.col_set)
+            self.column_indexes[name] = index
+        return index
 
 
 class IRNetAdapter:
@@ -23,21 +70,23 @@ class IRNetAdapter:
         self.params = init_arg_parser()
         self.params.schemas_dir = SCHEMAS_DIR
 
-        # load model
+        # load model, with the precompiled grammar of this adapter instead of the grammar of IRNet
         grammar = semQL.Grammar()
-        self.model = IRNet(self.params, grammar)
+        self.model = grammar_model(IRNet, semQL)(self.params, grammar)
         if self.params.cuda:
             self.model.cuda()
-            pretrained_model = torch.load(self.params.load_model, map_location=lambda storage, loc: storage)
-        else:
-            pretrained_model = torch.load(self.params.load_model, map_location='cpu')
 
-        pretrained_modeled = copy.deepcopy(pretrained_model)
-        for k in pretrained_model.keys():
-            if k not in self.model.state_dict().keys():
-                del pretrained_modeled[k]
-
-        self.model.load_state_dict(pretrained_modeled)
+        # restore the filtered state dict of an earlier start if the checkpoint did not change since
+        snapshot = open_snapshot("IRNet", [self.params.load_model], extra=vars(self.params))
+        if snapshot is not None and snapshot.is_current():
+            arrays, _ = snapshot.load()
+            # the memory-mapped tensors become the parameters instead of being copied
+            assign_state_dict(self.model, arrays_to_state_dict(arrays))
+        else:
+            pretrained_modeled = self.load_pretrained_state()
+            self.model.load_state_dict(pretrained_modeled)
+            if snapshot is not None:
+                snapshot.save(state_dict_to_arrays(pretrained_modeled))
 
         #   load glove
         self.model.word_emb = setup_util.glove_embeddings
@@ -45,14 +94,116 @@ class IRNetAdapter:
         # load table data
         self.schemas = schemas
 
+        # ConceptNet graphs used for schema linking, opened once per process
+        self.concept_graphs = {name: load_concept_graph(name) for name in GRAPH_NAMES}
+
+        # db_id to PreparedSchema and header key to the PreparedSchema that embeds it
+        self.prepared_schemas = dict()
+        self.header_owners = dict()
+        self.model_gen_x_batch = self.model.gen_x_batch
+        self.model.gen_x_batch = self.gen_x_batch
+
+        # encodings of the questions of the batch this thread parses, see encode_batch()
+        self.batch_state = threading.local()
+        self.model_encode = self.model.encode
+        self.model.encode = self.encode
+
+    def prepare_schema(self, db_id):
+        """
+            Returns the PreparedSchema of the database, which is created again if the schema was loaded
+            from another version of its file
+        """
+        version = schema_versions.get(db_id)
+        prepared = self.prepared_schemas.get(db_id)
+        if prepared is None or prepared.version != version:
+            prepared = PreparedSchema(self.schemas[db_id], version, self.concept_graphs)
+            for key in prepared.header_keys:
+                self.header_owners[key] = prepared
+            self.prepared_schemas[db_id] = prepared
+        return prepared
+
+    def gen_x_batch(self, q):
+        """
+            Embedding of the model, reusing the embeddings of the column and table names of prepared schemas
+        """
+        if len(q) == 1 and q[0] and type(q[0][0]) == list:
+            key = header_key(q[0])
+            owner = self.header_owners.get(key)
+            if owner is not None:
+                return owner.header_embedding(key, lambda: self.model_gen_x_batch(q))
+        return self.model_gen_x_batch(q)
+
+    def encode(self, src_sents_var, src_sents_len, q_onehot_project=None):
+        """
+            Encoder of the model, returning the encoding of a question of the current batch if it was computed already
+        """
+        encodings = getattr(self.batch_state, "encodings", None)
+        if encodings is not None and q_onehot_project is None and len(src_sents_var) == 1:
+            encoding = encodings.get(header_key(src_sents_var[0]))
+            if encoding is not None:
+                return encoding
+        return self.model_encode(src_sents_var, src_sents_len, q_onehot_project)
+
+    def encode_batch(self, examples):
+        """
+            Encode the questions of the examples in one pass of the encoder
+
+            Returns:
+                dict from the question tokens to the encoding of the question,
+                as the encoder of the model returns it for the question alone
+        """
+        # the packed sequences of the encoder need decreasing lengths
+        src_sents = sorted((e.src_sent for e in examples), key=len, reverse=True)
+        lengths = [len(s) for s in src_sents]
+        src_encodings, (last_state, last_cell) = self.model_encode(src_sents, lengths, None)
+        return {header_key(s): (src_encodings[i:i + 1, :lengths[i]], (last_state[i:i + 1], last_cell[i:i + 1]))
+                for i, s in enumerate(src_sents)}
+
+    def load_pretrained_state(self):
+        """
+            Returns the entries of the checkpoint that belong to the state dict of the model
+        """
+        if self.params.cuda:
+            pretrained_model = torch.load(self.params.load_model, map_location=lambda storage, loc: storage)
+        else:
+            pretrained_model = torch.load(self.params.load_model, map_location='cpu')
+
+        model_keys = self.model.state_dict().keys()
+        return {k: v for k, v in pretrained_model.items() if k in model_keys}
+
     def epoch_acc(self, batch_size, sql_data, table_data, beam_size=3):
+        """
+            Parse preprocessed questions. The questions of a batch are converted by to_batch_seq and encoded together
+            as one padded batch, the beam search for the sketch and the details runs per question.
+
+            Args:
+                batch_size: number of questions encoded together
+                sql_data: list of preprocessed questions
+                table_data: dict from db_id to schema
+
+            Returns:
+                the pre_sql with the sketch_result and the model_result of each question,
+                or the exception raised while parsing the question
+        """
         self.model.eval()
-        sql_data_list = []
-        sql_data_list.append(sql_data)
-        perm = list(range(len(sql_data_list)))
-        examples = to_batch_seq(sql_data_list, self.schemas, perm, 0, len(perm),
-                                is_train=False)
-        example = examples[0]
+        pre_sqls = []
+        perm = list(range(len(sql_data)))
+        with torch.no_grad():
+            for start in range(0, len(perm), batch_size):
+                examples = to_batch_seq(sql_data, table_data, perm, start, min(start + batch_size, len(perm)),
+                                        is_train=False)
+                self.batch_state.encodings = self.encode_batch(examples) if len(examples) > 1 else None
+                try:
+                    for example in examples:
+                        try:
+                            pre_sqls.append(self.parse(example, beam_size))
+                        except Exception as e:
+                            pre_sqls.append(e)
+                finally:
+                    self.batch_state.encodings = None
+        return pre_sqls
+
+    def parse(self, example, beam_size):
         results_all = self.model.parse(example, beam_size=beam_size)
         results = results_all[0]
         list_preds = []
@@ -68,12 +219,15 @@ class IRNetAdapter:
         pre_sql['model_result'] = pred
         return pre_sql
 
-    def preprocessData(self, data, schema):
-        with open(os.path.join(PATH_TO_CONCEPTNET, 'english_RelatedTo.pkl'), 'rb') as f:
-            english_RelatedTo = pickle.load(f)
+    def concept_columns(self, name, data):
+        """
+            Returns the lookup from the keys of the ConceptNet graph to the first matching column of the schema
+        """
+        return self.prepare_schema(data['db_id']).concept_columns(name)
 
-        with open(os.path.join(PATH_TO_CONCEPTNET, 'english_IsA.pkl'), 'rb') as f:
-            english_IsA = pickle.load(f)
+    def preprocessData(self, data, schema):
+        english_RelatedTo = self.concept_columns("english_RelatedTo", data)
+        english_IsA = self.concept_columns("english_IsA", data)
 
         # copy of the origin question_toks
         data["origin_question_toks"] = data["question_toks"]
@@ -158,11 +312,9 @@ class IRNetAdapter:
                 for begin_id in range(0, len(toks)):
                     for r_ind in reversed(range(1, len(toks) + 1 - begin_id)):
                         tmp_query = "_".join(toks[begin_id:r_ind])
-                        if tmp_query in graph:
-                            mi = graph[tmp_query]
-                            for col in data['col_set']:
-                                if col in mi:
-                                    return col
+                        col = graph.get(tmp_query)
+                        if col is not None:
+                            return col
 
             end_idx, symbol = utils.group_symbol(question_toks, idx, num_toks)
             if symbol:
@@ -218,20 +370,48 @@ class IRNetAdapter:
 
     @no_stdout
     def translate(self, nl_question, db_id):
-        data = self.createSqlData(nl_question, db_id)
-        schema = self.schemas[data['db_id']]
-        myArray = np.asarray(schema['column_names'])
-        data['col_set'] = myArray[:, 1].tolist()
-        data['table_names'] = schema['table_names']
-        processData = self.preprocessData(data, schema)
-        list = []
-        list.append(processData)
-        result = self.epoch_acc(1, processData, schema)
-        result['model_result_replace'] = result['model_result']
-
-        processedResult = transform(result, schema)
-        print(processedResult)
-        return processedResult[0]
+        result = self.translate_batch([(nl_question, db_id)])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    @no_stdout
+    def translate_batch(self, requests, batch_size=None):
+        """
+            Translate several natural language questions
+
+            Args:
+                requests: list of (nl_question, db_id) tuples
+                batch_size: number of questions encoded together, all questions by default
+
+            Returns:
+                the list of the sql predictions, or of the exceptions raised for single questions
+        """
+        results = [None] * len(requests)
+        processed = []
+        for i, (nl_question, db_id) in enumerate(requests):
+            try:
+                data = self.createSqlData(nl_question, db_id)
+                prepared = self.prepare_schema(data['db_id'])
+                data['col_set'] = list(prepared.col_set)
+                data['table_names'] = prepared.table_names
+                processed.append((i, self.preprocessData(data, prepared.schema)))
+            except Exception as e:
+                results[i] = e
+
+        pre_sqls = self.epoch_acc(batch_size or max(len(processed), 1), [data for _, data in processed], self.schemas)
+        for (i, data), result in zip(processed, pre_sqls):
+            if isinstance(result, Exception):
+                results[i] = result
+                continue
+            try:
+                result['model_result_replace'] = result['model_result']
+                processedResult = transform(result, self.schemas[data['db_id']])
+                print(processedResult)
+                results[i] = processedResult[0]
+            except Exception as e:
+                results[i] = e
+        return results
 
     def createSqlData(self, nl_question, db_id):
         nl_question = nl_question.replace(" .", ".")
@@ -61,22 +61,33 @@ class Grammar(object):
 
 
 class Action(object):
+    # the beam search creates many actions, so they have no instance dict unless an attribute
+    # other than these is set, and the list of children is only created when it is used
+    __slots__ = ('pt', 'production', '_children', 'parent', 'id_c', '__dict__')
+
     def __init__(self):
         self.pt = 0
         self.production = None
-        self.children = list()
+        self._children = None
+
+    @property
+    def children(self):
+        if self._children is None:
+            self._children = list()
+        return self._children
+
+    @children.setter
+    def children(self, children):
+        self._children = children
+
+    @classmethod
+    def _init_grammar(cls):
+        # the grammar is compiled once when the module is loaded, see _compile_grammar()
+        return cls.productions
 
     def get_next_action(self, is_sketch=False):
-        actions = list()
-        for x in self.production.split(' ')[1:]:
-            if x not in Keywords:
-                rule_type = eval(x)
-                if is_sketch:
-                    if rule_type is not A:
-                        actions.append(rule_type)
-                else:
-                    actions.append(rule_type)
-        return actions
+        # a new list, as the callers modify it
+        return list(_next_actions(self.production)[1 if is_sketch else 0])
 
     def set_parent(self, parent):
         print("parent ")
@@ -87,27 +98,21 @@ class Action(object):
 
 
 class Root1(Action):
+    __slots__ = ()
+
     def __init__(self, id_c, parent=None):
         super(Root1, self).__init__()
         self.parent = parent
         self.id_c = id_c
-        self._init_grammar()
         self.production = self.grammar_dict[id_c]
 
-    @classmethod
-    def _init_grammar(self):
-        # TODO: should add Root grammar to this
-        self.grammar_dict = {
-            0: 'Root1 intersect Root Root',
-            1: 'Root1 union Root Root',
-            2: 'Root1 except Root Root',
-            3: 'Root1 Root',
-        }
-        self.production_id = {}
-        for id_x, value in enumerate(self.grammar_dict.values()):
-            self.production_id[value] = id_x
-
-        return self.grammar_dict.values()
+    # TODO: should add Root grammar to this
+    grammar_dict = {
+        0: 'Root1 intersect Root Root',
+        1: 'Root1 union Root Root',
+        2: 'Root1 except Root Root',
+        3: 'Root1 Root',
+    }
 
     def __str__(self):
         return 'Root1(' + str(self.id_c) + ')'
@@ -117,29 +122,23 @@ class Root1(Action):
 
 
 class Root(Action):
+    __slots__ = ()
+
     def __init__(self, id_c, parent=None):
         super(Root, self).__init__()
         self.parent = parent
         self.id_c = id_c
-        self._init_grammar()
         self.production = self.grammar_dict[id_c]
 
-    @classmethod
-    def _init_grammar(self):
-        # TODO: should add Root grammar to this
-        self.grammar_dict = {
-            0: 'Root Sel Sup Filter',
-            1: 'Root Sel Filter Order',
-            2: 'Root Sel Sup',
-            3: 'Root Sel Filter',
-            4: 'Root Sel Order',
-            5: 'Root Sel'
-        }
-        self.production_id = {}
-        for id_x, value in enumerate(self.grammar_dict.values()):
-            self.production_id[value] = id_x
-
-        return self.grammar_dict.values()
+    # TODO: should add Root grammar to this
+    grammar_dict = {
+        0: 'Root Sel Sup Filter',
+        1: 'Root Sel Filter Order',
+        2: 'Root Sel Sup',
+        3: 'Root Sel Filter',
+        4: 'Root Sel Order',
+        5: 'Root Sel'
+    }
 
     def __str__(self):
         return 'Root(' + str(self.id_c) + ')'
@@ -152,27 +151,21 @@ class N(Action):
     """
     Number of Columns
     """
+    __slots__ = ()
+
     def __init__(self, id_c, parent=None):
         super(N, self).__init__()
         self.parent = parent
         self.id_c = id_c
-        self._init_grammar()
         self.production = self.grammar_dict[id_c]
 
-    @classmethod
-    def _init_grammar(self):
-        self.grammar_dict = {
-            0: 'N A',
-            1: 'N A A',
-            2: 'N A A A',
-            3: 'N A A A A',
-            4: 'N A A A A A'
-        }
-        self.production_id = {}
-        for id_x, value in enumerate(self.grammar_dict.values()):
-            self.production_id[value] = id_x
-
-        return self.grammar_dict.values()
+    grammar_dict = {
+        0: 'N A',
+        1: 'N A A',
+        2: 'N A A A',
+        3: 'N A A A A',
+        4: 'N A A A A A'
+    }
 
     def __str__(self):
         return 'N(' + str(self.id_c) + ')'
@@ -184,6 +177,8 @@ class C(Action):
     """
     Column
     """
+    __slots__ = ('table',)
+
     def __init__(self, id_c, parent=None):
         super(C, self).__init__()
         self.parent = parent
@@ -202,6 +197,8 @@ class T(Action):
     """
     Table
     """
+    __slots__ = ('table',)
+
     def __init__(self, id_c, parent=None):
         super(T, self).__init__()
 
@@ -221,30 +218,24 @@ class A(Action):
     """
     Aggregator
     """
+    __slots__ = ()
+
     def __init__(self, id_c, parent=None):
         super(A, self).__init__()
 
         self.parent = parent
         self.id_c = id_c
-        self._init_grammar()
         self.production = self.grammar_dict[id_c]
 
-    @classmethod
-    def _init_grammar(self):
-        # TODO: should add Root grammar to this
-        self.grammar_dict = {
-            0: 'A none C',
-            1: 'A max C',
-            2: "A min C",
-            3: "A count C",
-            4: "A sum C",
-            5: "A avg C"
-        }
-        self.production_id = {}
-        for id_x, value in enumerate(self.grammar_dict.values()):
-            self.production_id[value] = id_x
-
-        return self.grammar_dict.values()
+    # TODO: should add Root grammar to this
+    grammar_dict = {
+        0: 'A none C',
+        1: 'A max C',
+        2: "A min C",
+        3: "A count C",
+        4: "A sum C",
+        5: "A avg C"
+    }
 
     def __str__(self):
         return 'A(' + str(self.id_c) + ')'
@@ -257,24 +248,18 @@ class Sel(Action):
     """
     Select
     """
+    __slots__ = ()
+
     def __init__(self, id_c, parent=None):
         super(Sel, self).__init__()
 
         self.parent = parent
         self.id_c = id_c
-        self._init_grammar()
         self.production = self.grammar_dict[id_c]
 
-    @classmethod
-    def _init_grammar(self):
-        self.grammar_dict = {
-            0: 'Sel N',
-        }
-        self.production_id = {}
-        for id_x, value in enumerate(self.grammar_dict.values()):
-            self.production_id[value] = id_x
-
-        return self.grammar_dict.values()
+    grammar_dict = {
+        0: 'Sel N',
+    }
 
     def __str__(self):
         return 'Sel(' + str(self.id_c) + ')'
@@ -286,47 +271,41 @@ class Filter(Action):
     """
     Filter
     """
+    __slots__ = ()
+
     def __init__(self, id_c, parent=None):
         super(Filter, self).__init__()
 
         self.parent = parent
         self.id_c = id_c
-        self._init_grammar()
         self.production = self.grammar_dict[id_c]
 
-    @classmethod
-    def _init_grammar(self):
-        self.grammar_dict = {
-            # 0: "Filter 1"
-            0: 'Filter and Filter Filter',
-            1: 'Filter or Filter Filter',
-            2: 'Filter = A',
-            3: 'Filter != A',
-            4: 'Filter < A',
-            5: 'Filter > A',
-            6: 'Filter <= A',
-            7: 'Filter >= A',
-            8: 'Filter between A',
-            9: 'Filter like A',
-            10: 'Filter not_like A',
-            # now begin root
-            11: 'Filter = A Root',
-            12: 'Filter < A Root',
-            13: 'Filter > A Root',
-            14: 'Filter != A Root',
-            15: 'Filter between A Root',
-            16: 'Filter >= A Root',
-            17: 'Filter <= A Root',
-            # now for In
-            18: 'Filter in A Root',
-            19: 'Filter not_in A Root'
-
-        }
-        self.production_id = {}
-        for id_x, value in enumerate(self.grammar_dict.values()):
-            self.production_id[value] = id_x
-
-        return self.grammar_dict.values()
+    grammar_dict = {
+        # 0: "Filter 1"
+        0: 'Filter and Filter Filter',
+        1: 'Filter or Filter Filter',
+        2: 'Filter = A',
+        3: 'Filter != A',
+        4: 'Filter < A',
+        5: 'Filter > A',
+        6: 'Filter <= A',
+        7: 'Filter >= A',
+        8: 'Filter between A',
+        9: 'Filter like A',
+        10: 'Filter not_like A',
+        # now begin root
+        11: 'Filter = A Root',
+        12: 'Filter < A Root',
+        13: 'Filter > A Root',
+        14: 'Filter != A Root',
+        15: 'Filter between A Root',
+        16: 'Filter >= A Root',
+        17: 'Filter <= A Root',
+        # now for In
+        18: 'Filter in A Root',
+        19: 'Filter not_in A Root'
+
+    }
 
     def __str__(self):
         return 'Filter(' + str(self.id_c) + ')'
@@ -339,25 +318,19 @@ class Sup(Action):
     """
     Superlative
     """
+    __slots__ = ()
+
     def __init__(self, id_c, parent=None):
         super(Sup, self).__init__()
 
         self.parent = parent
         self.id_c = id_c
-        self._init_grammar()
         self.production = self.grammar_dict[id_c]
 
-    @classmethod
-    def _init_grammar(self):
-        self.grammar_dict = {
-            0: 'Sup des A',
-            1: 'Sup asc A',
-        }
-        self.production_id = {}
-        for id_x, value in enumerate(self.grammar_dict.values()):
-            self.production_id[value] = id_x
-
-        return self.grammar_dict.values()
+    grammar_dict = {
+        0: 'Sup des A',
+        1: 'Sup asc A',
+    }
 
     def __str__(self):
         return 'Sup(' + str(self.id_c) + ')'
@@ -370,25 +343,19 @@ class Order(Action):
     """
     Order
     """
+    __slots__ = ()
+
     def __init__(self, id_c, parent=None):
         super(Order, self).__init__()
 
         self.parent = parent
         self.id_c = id_c
-        self._init_grammar()
         self.production = self.grammar_dict[id_c]
 
-    @classmethod
-    def _init_grammar(self):
-        self.grammar_dict = {
-            0: 'Order des A',
-            1: 'Order asc A',
-        }
-        self.production_id = {}
-        for id_x, value in enumerate(self.grammar_dict.values()):
-            self.production_id[value] = id_x
-
-        return self.grammar_dict.values()
+    grammar_dict = {
+        0: 'Order des A',
+        1: 'Order asc A',
+    }
 
     def __str__(self):
         return 'Order(' + str(self.id_c) + ')'
@@ -397,5 +364,36 @@ class Order(Action):
         return 'Order(' + str(self.id_c) + ')'
 
 
+# production to the rule types of its children, with and without A (for the sketch)
+_NEXT_ACTIONS = dict()
+
+
+def _compile_production(production):
+    # the rule types are looked up by name instead of eval() of every token
+    rule_types = tuple(globals()[x] for x in production.split(' ')[1:] if x not in Keywords)
+    return rule_types, tuple(rule_type for rule_type in rule_types if rule_type is not A)
+
+
+def _next_actions(production):
+    compiled = _NEXT_ACTIONS.get(production)
+    if compiled is None:
+        compiled = _compile_production(production)
+        _NEXT_ACTIONS[production] = compiled
+    return compiled
+
+
+def _compile_grammar():
+    for Cls in [Root1, Root, N, A, Sel, Filter, Sup, Order]:
+        Cls.productions = tuple(Cls.grammar_dict.values())
+        Cls.production_id = {value: id_x for id_x, value in enumerate(Cls.productions)}
+        for production in Cls.productions:
+            _next_actions(production)
+    _next_actions('C T')
+    _next_actions('T min')
+
+
+_compile_grammar()
+
+
 if __name__ == '__main__':
     Grammar()
@@ -0,0 +1,33 @@
+import json
+
+from nltk.stem import WordNetLemmatizer
+
+from adapters.IRNet.constants import IRNET_BASE_DIR
+
+# tokens that IRNet adds itself, e.g. for the type annotations of schema linking
+SPECIAL_TOKENS = {'unk', 'table', 'column', 'value', 'agg', 'more', 'most', 'count', 'number', 'many', 'year', 'have'}
+
+DATA_FILES = [IRNET_BASE_DIR / "data" / "train.json", IRNET_BASE_DIR / "data" / "dev.json"]
+
+
+def embedding_vocabulary():
+    """
+        Collect the tokens IRNet looks up in the glove embeddings, apart from the schema tokens.
+        Questions are open vocabulary, so this covers the questions of the spider data only.
+
+        Returns:
+            the set of tokens and the list of files they were read from
+    """
+    lemmatizer = WordNetLemmatizer()
+    tokens = set(SPECIAL_TOKENS)
+    files = [f for f in DATA_FILES if f.exists()]
+    for data_file in files:
+        with open(str(data_file)) as infile:
+            examples = json.load(infile)
+        for example in examples:
+            for token in example["question_toks"]:
+                tokens.add(token.lower())
+                tokens.add(lemmatizer.lemmatize(token.lower()))
+            for arg in example.get("question_arg", []):
+                tokens.update(arg)
+    return tokens, files
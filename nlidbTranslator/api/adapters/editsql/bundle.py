@@ -0,0 +1,42 @@
+import pickle
+from pathlib import Path
+from types import SimpleNamespace
+
+# everything editsql needs from the ATISDataset to serve translations
+BUNDLE_FIELDS = ["input_vocabulary", "output_vocabulary", "output_vocabulary_schema", "entities_dictionary",
+                 "anonymizer"]
+
+SERVING_BUNDLE_FILENAME = "serving_bundle.pkl"
+
+
+def bundle_file(params):
+    return Path(params.data_directory) / SERVING_BUNDLE_FILENAME
+
+
+def write_serving_bundle(params, data):
+    """
+        Serialize the vocabularies and the anonymizer of the ATISDataset for the model described by params
+
+        Args:
+            params: the parsed arguments
+            data: the ATISDataset
+    """
+    content = {field: getattr(data, field) for field in BUNDLE_FIELDS}
+    with open(str(bundle_file(params)), 'wb') as f:
+        pickle.dump(content, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_serving_bundle(params):
+    """
+        Load the vocabularies and the anonymizer written by write_serving_bundle()
+
+        Returns:
+            object with the same attributes as the ATISDataset for the fields in BUNDLE_FIELDS
+            or None if there is no bundle
+    """
+    path = bundle_file(params)
+    if not path.exists():
+        return None
+    with open(str(path), 'rb') as f:
+        content = pickle.load(f)
+    return SimpleNamespace(**content)
@@ -2,17 +2,23 @@ import os
 from pathlib import Path
 
 from api.paths import TRANSLATORS_DIR
-from editsql.data_util import atis_data
 
 CURRENT_DIR = Path(os.path.dirname(__file__))
 
 EDITSQL_BASE_DIR = Path(TRANSLATORS_DIR) / "editsql"
 
 EVAL_REFERENCE_FILE = Path(CURRENT_DIR / "evaluation/reference.json")
-BATCH_INPUT_FILE = Path(CURRENT_DIR / "batch_processing/input.json")
-BATCH_OUTPUT_DIR = Path(CURRENT_DIR / "batch_processing/output")
 
+# default data directories and checkpoints of the models, see parse_args_spider.py and parse_args_sparc.py
+SPIDER_DATA_DIR = EDITSQL_BASE_DIR / "processed_data_spider_removefrom"
+SPIDER_SAVE_FILE = EDITSQL_BASE_DIR / "logs/logs_spider_editsql/save_12"
+SPARC_DATA_DIR = EDITSQL_BASE_DIR / "processed_data_sparc_removefrom_test"
+SPARC_SAVE_FILE = EDITSQL_BASE_DIR / "logs/logs_sparc_editsql/save_31_sparc_editsql"
 
-# overwrite the path constants in atis_data
-atis_data.ENTITIES_FILENAME = str(EDITSQL_BASE_DIR / "data/entities.txt")
-atis_data.ANONYMIZATION_FILENAME = str(EDITSQL_BASE_DIR / "data/anonymization.txt")
+
+def patch_atis_data():
+    # overwrite the path constants in atis_data, imported here so that the constants do not load editsql
+    from editsql.data_util import atis_data
+
+    atis_data.ENTITIES_FILENAME = str(EDITSQL_BASE_DIR / "data/entities.txt")
+    atis_data.ANONYMIZATION_FILENAME = str(EDITSQL_BASE_DIR / "data/anonymization.txt")
@@ -1,6 +1,11 @@
+import copy
+import logging
 import random
+import threading
 import time
+import warnings
 from pathlib import Path
+from types import SimpleNamespace
 
 import numpy as np
 import json
@@ -17,9 +22,15 @@ from editsql.model.bert import tokenization as tokenization
 from editsql.model.bert.modeling import BertConfig, BertModel
 
 from adapters.editsql import parse_args_spider, parse_args_sparc
+from adapters.editsql.bundle import BUNDLE_FIELDS, load_serving_bundle, bundle_file
 from adapters.editsql.constants import *
 from api import setup_util
 from api.paths import DB_SCHEMAS_FILE
+from api.snapshot import open_snapshot, restore_state, state_dict_to_arrays, arrays_to_state_dict, assign_state_dict
+
+patch_atis_data()
+
+logger = logging.getLogger(__name__)
 
 
 class EditsqlAdapter:
@@ -33,11 +44,19 @@ class EditsqlAdapter:
         else:
             params = parse_args_spider.interpret_args()
 
-        # create the dataset and model
-        data = ATISDataset(params)
-        self.model = self.load_model(params, data)
+        # restore the state of an earlier start if neither the checkpoint nor the vocabularies changed since
+        snapshot = open_snapshot("editsql_" + model, [params.save_file, bundle_file(params)], extra=vars(params))
+        if snapshot is not None and snapshot.is_current():
+            data = self.restore_snapshot(params, snapshot)
+        else:
+            # load the vocabularies and create the model
+            data = self.load_data(params)
+            self.model = self.load_model(params, data)
+
+            _, _, self.database_schemas = read_database_schema(DB_SCHEMAS_FILE, schema_tokens={}, column_names={}, database_schemas_dict={})
 
-        _, _, self.database_schemas = read_database_schema(DB_SCHEMAS_FILE, schema_tokens={}, column_names={}, database_schemas_dict={})
+            if snapshot is not None:
+                self.save_snapshot(snapshot, data)
 
         # function used for loading of interaction in raw state
         self.int_load_function = load_function(params,
@@ -45,13 +64,33 @@ class EditsqlAdapter:
                                                data.anonymizer,
                                                database_schema=self.database_schemas)
 
-    def load_model(self, params, data):
+    def load_data(self, params):
+        """
+        Loads the vocabularies and the anonymizer from the bundle written by build_editsql.py,
+        which avoids loading the train and dev data of the ATISDataset
+
+        Args:
+            params: the parsed arguments
+
+        Returns:
+            object with the vocabularies, the entities dictionary and the anonymizer
+
+        """
+        data = load_serving_bundle(params)
+        if data is None:
+            warnings.warn("No serving bundle found in " + str(bundle_file(params)) + ", loading the ATISDataset "
+                          "instead. Run build_editsql.py to create the bundle and start faster.")
+            data = ATISDataset(params)
+        return data
+
+    def load_model(self, params, data, state_dict=None):
         """
         Loads the editsql translation model
 
         Args:
             params: the parsed arguments
-            data: the ATISDataset
+            data: the vocabularies as loaded by load_data()
+            state_dict: the state of the model, read from params.save_file if not given
 
         Returns:
             the loaded SchemaInteractionATISModel
@@ -65,12 +104,85 @@ class EditsqlAdapter:
             data.output_vocabulary_schema,
             data.anonymizer if params.anonymize and params.anonymization_scoring else None)
 
-        model.load_state_dict(torch.load(params.save_file,map_location='cpu'))
-        print("Loaded model from file " + params.save_file)
+        # the tensors of a snapshot are memory-mapped, they become the parameters instead of being copied
+        assign = state_dict is not None
+        if state_dict is None:
+            state_dict = torch.load(params.save_file,map_location='cpu')
+            print("Loaded model from file " + params.save_file)
+        self.load_state(model, params, state_dict, assign)
         model.eval()
 
         return model
 
+    def load_state(self, model, params, state_dict, assign=False):
+        """
+        Load the state dict into the model. If the model uses a shared BERT whose weights were already loaded
+        by another model, the BERT weights of both state dicts have to match. Otherwise the model gets its own BERT.
+        With assign, the tensors of the state dict replace those of the model (see assign_state_dict).
+
+        """
+        load = assign_state_dict if assign else torch.nn.Module.load_state_dict
+        shared = shared_berts.get(params.bert_type_abb)
+        if shared is None or model.model_bert is not shared.model_bert:
+            load(model, state_dict)
+            return
+
+        with shared.lock:
+            bert_state = {k[len(BERT_STATE_PREFIX):]: v for k, v in state_dict.items() if k.startswith(BERT_STATE_PREFIX)}
+            if shared.weights_loaded and not shared.has_weights(bert_state):
+                warnings.warn("The fine-tuned BERT weights of " + params.save_file + " differ from the weights of the "
+                              "shared BERT, loading a separate BERT for this model")
+                model.model_bert = copy.deepcopy(shared.model_bert)
+            load(model, state_dict)
+            shared.weights_loaded = True
+
+    def save_snapshot(self, snapshot, data):
+        """
+        Write the state dict, the vocabulary embeddings, the vocabularies and the schemas to the snapshot
+
+        """
+        input_embeddings, output_embeddings, schema_embeddings, input_embedding_size = restore_state.created_embeddings
+        restore_state.created_embeddings = None
+
+        arrays = state_dict_to_arrays(self.model.state_dict(), prefix="model.")
+        arrays["embeddings.input"] = input_embeddings
+        arrays["embeddings.output"] = output_embeddings
+        if schema_embeddings is not None:
+            arrays["embeddings.schema"] = schema_embeddings
+
+        objects = dict()
+        # only the fields of the serving bundle, also if the data is a complete ATISDataset
+        objects["data"] = {field: getattr(data, field) for field in BUNDLE_FIELDS}
+        objects["database_schemas"] = self.database_schemas
+        objects["input_embedding_size"] = input_embedding_size
+
+        snapshot.save(arrays, objects)
+
+    def restore_snapshot(self, params, snapshot):
+        """
+        Create the model from the snapshot, without reading the checkpoint, the glove file or the pretrained BERT
+
+        Returns:
+            object with the vocabularies, the entities dictionary and the anonymizer
+
+        """
+        arrays, objects = snapshot.load()
+        data = SimpleNamespace(**objects["data"])
+        self.database_schemas = objects["database_schemas"]
+
+        # picked up by load_word_embeddings_for_editsql and get_bert while the model is constructed
+        restore_state.embeddings = (arrays["embeddings.input"], arrays["embeddings.output"],
+                                    arrays.get("embeddings.schema"), objects["input_embedding_size"])
+        restore_state.skip_bert_weights = True
+        try:
+            self.model = self.load_model(params, data, state_dict=arrays_to_state_dict(arrays, prefix="model."))
+        finally:
+            restore_state.embeddings = None
+            restore_state.skip_bert_weights = False
+        print("Restored model from snapshot " + str(snapshot.directory))
+
+        return data
+
     def prepare_interaction(self, nl_questions, db_id, prev_predictions):
         """
         Creates an InteractionItem that contains the natural language question and the database id
@@ -134,6 +246,67 @@ class EditsqlAdapter:
         prediction = self.predict(interaction)
         return self.post_process(prediction, db_id)
 
+    def translate_batch(self, requests):
+        """
+        Translate several single natural language questions, e.g. the requests collected by a MicroBatcher.
+        The questions of a database are encoded by BERT in one forward pass, the model of editsql then decodes
+        one interaction at a time.
+
+        Args:
+            requests: list of (nl_question, db_id) tuples
+
+        Returns:
+            the list of the sql predictions, or of the exceptions raised for single questions
+
+        """
+        results = [None] * len(requests)
+        by_database = dict()
+        for i, (nl_question, db_id) in enumerate(requests):
+            by_database.setdefault(db_id, []).append(i)
+
+        for db_id, indices in by_database.items():
+            interactions = dict()
+            for i in indices:
+                try:
+                    interactions[i] = self.prepare_interaction([requests[i][0]], db_id, prev_predictions=[])
+                except Exception as e:
+                    results[i] = e
+
+            bert_encodings.encodings = self.encode_batch(list(interactions.values()))
+            try:
+                for i, interaction in interactions.items():
+                    try:
+                        results[i] = self.post_process(self.predict(interaction), db_id)
+                    except Exception as e:
+                        results[i] = e
+            finally:
+                bert_encodings.encodings = None
+        return results
+
+    def encode_batch(self, interactions):
+        """
+        Encode the questions of the interactions with one forward pass of BERT
+
+        Returns:
+            dict from (id of the schema, question tokens) to the encoding, used by get_bert_encoding() when the
+            interactions are decoded; None if there is nothing to batch or the encoding failed
+            (the questions are then encoded one by one)
+
+        """
+        if len(interactions) < 2 or not self.model.params.use_bert:
+            return None
+        questions = [(interaction.gold_utterances()[0].input_sequence(), interaction.get_schema())
+                     for interaction in interactions]
+        try:
+            with torch.no_grad():
+                encodings = get_bert_encodings(self.model.bert_config, self.model.model_bert, self.model.tokenizer,
+                                               questions, self.model.params.bert_input_version)
+        except Exception:
+            logger.exception("Encoding a batch of %d questions failed, encoding them one by one", len(questions))
+            return None
+        return {(id(input_schema), tuple(input_sequence)): encoding
+                for (input_sequence, input_schema), encoding in zip(questions, encodings)}
+
     def translate_interaction(self, nl_question, db_id, prev_nl_questions, prev_predictions):
         """
         Predict the sql for the next utterance in an interaction
@@ -157,7 +330,9 @@ class EditsqlAdapter:
         return self.post_process(prediction, db_id)
 
     def predict(self, interaction):
-        prediction = self.model.predict_with_predicted_queries(interaction, 1000)
+        # no gradients are needed for the prediction, this saves the time and memory of recording the graph
+        with torch.no_grad():
+            prediction = self.model.predict_with_predicted_queries(interaction, 1000)
         pred_tokens_raw = prediction[-1][0]
         pred_tokens = pred_tokens_raw[:-1]  # strip the _EOS symbol
         pred_str = " ".join(pred_tokens)
@@ -261,29 +436,6 @@ class EditsqlAdapter:
 
         write_json_log_results(eval_output, CURRENT_DIR / "evaluation/results")
 
-    # ------------ Batch processing -----------------
-    @classmethod
-    def batch_translate(cls, input_file=BATCH_INPUT_FILE, output_dir=BATCH_OUTPUT_DIR):
-        """
-        Read the list of dicts with values for nl_question and db_id from the input file
-        and save the translations to a file in the output directory
-
-        Args:
-            input_file: path of file with list of dicts with values for nl_question and db_id
-            output_dir: path of dir where the translations are saved
-
-        """
-
-        edi_adap = EditsqlAdapter()
-
-        with open(input_file) as f:
-            requests = json.load(f)
-
-        for i, request in enumerate(requests):
-            request["sql"] = edi_adap.translate(request["nl_question"], request["db_id"])
-
-        write_json_log_results(requests, output_dir)
-
 
 def write_json_log_results(content, directory):
     path = Path(directory)
@@ -295,6 +447,12 @@ def write_json_log_results(content, directory):
 
 # define a modified embeddings loading function that makes use of the preloaded glove
 def load_word_embeddings_for_editsql(input_vocabulary, output_vocabulary, output_vocabulary_schema, params):
+    # ------- use the embeddings of a snapshot -----------
+    restored = getattr(restore_state, "embeddings", None)
+    if restored is not None:
+        return restored
+    # ---------------------------------------
+
     glove_embedding_size = 300
 
     # ------- use preloaded glove -----------
@@ -326,15 +484,70 @@ def load_word_embeddings_for_editsql(input_vocabulary, output_vocabulary, output
     if output_vocabulary_schema:
         output_vocabulary_schema_embeddings = create_word_embeddings(output_vocabulary_schema)
 
-    return input_vocabulary_embeddings, output_vocabulary_embeddings, output_vocabulary_schema_embeddings, input_embedding_size
+    embeddings = input_vocabulary_embeddings, output_vocabulary_embeddings, output_vocabulary_schema_embeddings, input_embedding_size
+    # kept for the snapshot, see EditsqlAdapter.save_snapshot()
+    restore_state.created_embeddings = embeddings
+
+    return embeddings
 
 
 # overwrite the original embeddings loading function with the modified version
 model.load_word_embeddings = load_word_embeddings_for_editsql
 
 
-# define a modified version with absolute path instead of relative path in the first line
+# prefix of the BERT parameters in the state dict of the SchemaInteractionATISModel
+BERT_STATE_PREFIX = "model_bert."
+
+
+class SharedBert:
+    """
+    BERT encoder, tokenizer and config that are used by all models of the same BERT type in this process,
+    see EDITSQL_SHARED_BERT in the settings
+    """
+
+    def __init__(self, model_bert, tokenizer, bert_config):
+        self.model_bert = model_bert
+        self.tokenizer = tokenizer
+        self.bert_config = bert_config
+        # whether a model loaded its fine-tuned weights into the encoder already
+        self.weights_loaded = False
+        self.lock = threading.Lock()
+
+    def has_weights(self, bert_state):
+        own_state = self.model_bert.state_dict()
+        if own_state.keys() != bert_state.keys():
+            return False
+        return all(torch.equal(own_state[k], bert_state[k].to(own_state[k].device)) for k in own_state)
+
+
+# bert type abbreviation to SharedBert
+shared_berts = dict()
+shared_berts_lock = threading.Lock()
+
+
+def release_shared_bert():
+    """
+        Drop the references to the shared BERT encoders, so that they are freed together with the models
+    """
+    with shared_berts_lock:
+        shared_berts.clear()
+
+
+# return the same BERT for all models unless sharing is disabled
 def get_bert(params):
+    if not setup_util.get_setting("EDITSQL_SHARED_BERT", True):
+        return load_bert(params)
+
+    with shared_berts_lock:
+        if params.bert_type_abb not in shared_berts:
+            shared_berts[params.bert_type_abb] = SharedBert(*load_bert(params))
+        shared = shared_berts[params.bert_type_abb]
+
+    return shared.model_bert, shared.tokenizer, shared.bert_config
+
+
+# define a modified version with absolute path instead of relative path in the first line
+def load_bert(params):
     BERT_PT_PATH = str(TRANSLATORS_DIR / "editsql/model/bert/data/annotated_wikisql_and_PyTorch_bert_param")
     map_bert_type_abb = {'uS': 'uncased_L-12_H-768_A-12',
                          'uL': 'uncased_L-24_H-1024_A-16',
@@ -346,7 +559,8 @@ def get_bert(params):
         do_lower_case = False
     else:
         do_lower_case = True
-    no_pretraining = False
+    # the weights are overwritten by the state dict when the model is restored from a snapshot
+    no_pretraining = getattr(restore_state, "skip_bert_weights", False)
 
     bert_config_file = os.path.join(BERT_PT_PATH, f'bert_config_{bert_type}.json')
     vocab_file = os.path.join(BERT_PT_PATH, f'vocab_{bert_type}.txt')
@@ -375,3 +589,79 @@ def get_bert(params):
 
 # overwrite the original function with the modified version
 utils_bert.get_bert = get_bert
+
+
+# encodings of the questions of a batch, see EditsqlAdapter.encode_batch()
+bert_encodings = threading.local()
+
+original_get_bert_encoding = utils_bert.get_bert_encoding
+
+
+# use the encoding of the batch if the question was encoded with it
+def get_bert_encoding(bert_config, model_bert, tokenizer, input_sequence, input_schema, *args, **kwargs):
+    encodings = getattr(bert_encodings, "encodings", None)
+    if encodings is not None:
+        encoding = encodings.pop((id(input_schema), tuple(input_sequence)), None)
+        if encoding is not None:
+            return encoding
+    return original_get_bert_encoding(bert_config, model_bert, tokenizer, input_sequence, input_schema, *args, **kwargs)
+
+
+# overwrite the original function with the modified version
+utils_bert.get_bert_encoding = get_bert_encoding
+
+
+def get_bert_encodings(bert_config, model_bert, tokenizer, questions, bert_input_version='v1', max_seq_length=512):
+    """
+    Batched version of utils_bert.get_bert_encoding: the segments (question and part of the schema) of all questions
+    go through BERT together, the states of each question are then averaged over its segments as in the original
+
+    Args:
+        questions: list of (input_sequence, input_schema)
+
+    Returns:
+        the list of (utterance_states, schema_token_states) of the questions
+
+    """
+    nlu_t = []
+    hds = []
+    segments = []
+    for input_sequence, input_schema in questions:
+        if bert_input_version == 'v1':
+            nlu_t1, hds1 = utils_bert.prepare_input(tokenizer, input_sequence, input_schema, max_seq_length)
+        else:
+            nlu_t1, hds1, max_seq_length1 = utils_bert.prepare_input_v2(tokenizer, input_sequence, input_schema)
+            # the shorter segments are padded, BERT masks the padding
+            max_seq_length = max_seq_length1 if not segments else max(max_seq_length, max_seq_length1)
+        segments.append((len(nlu_t), len(nlu_t) + len(nlu_t1)))
+        nlu_t += nlu_t1
+        hds += hds1
+
+    wemb_n, wemb_h, l_n, l_hpu, l_hs, _, t_to_tt_idx, _, t_to_tt_idx_hds = utils_bert.get_wemb_bert(
+        bert_config, model_bert, tokenizer, nlu_t, hds, max_seq_length, num_out_layers_n=1, num_out_layers_h=1)
+
+    encodings = []
+    for (input_sequence, input_schema), (start, end) in zip(questions, segments):
+        # the rows of wemb_h are the headers of all segments in order
+        headers_start = sum(l_hs[:start])
+        headers = range(headers_start, headers_start + sum(l_hs[start:end]))
+
+        utterance_states = []
+        token_starts = t_to_tt_idx[start]
+        for i, token_start in enumerate(token_starts):
+            token_end = token_starts[i + 1] if i + 1 < len(token_starts) else l_n[start]
+            utterance_states.append(torch.mean(wemb_n[start:end, token_start:token_end, :], dim=[0, 1]))
+        assert len(utterance_states) == len(input_sequence)
+
+        schema_token_states = []
+        header_starts = [starts for segment in t_to_tt_idx_hds[start:end] for starts in segment]
+        for header, starts in zip(headers, header_starts):
+            states = []
+            for i, token_start in enumerate(starts):
+                token_end = starts[i + 1] if i + 1 < len(starts) else l_hpu[header]
+                states.append(torch.mean(wemb_h[header, token_start:token_end, :], dim=0))
+            schema_token_states.append(states)
+        assert len(schema_token_states) == len(input_schema.column_names_embedder_input)
+
+        encodings.append((utterance_states, schema_token_states))
+    return encodings
@@ -1,22 +1,85 @@
-from adapters.editsql.editsql_adapter import EditsqlAdapter
-from api.setup_util import no_stdout
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from api.batching import MicroBatcher
+from api.setup_util import get_setting, no_stdout
+
+logger = logging.getLogger(__name__)
 
 ediAdapter_spider = None
 ediAdapter_sparc = None
 
+# concurrent questions are translated in batches if EDITSQL_BATCH_SIZE is larger than 1
+batcher = MicroBatcher(lambda requests: ediAdapter_spider.translate_batch(requests),
+                       max_size=get_setting("EDITSQL_BATCH_SIZE", 1),
+                       max_wait=get_setting("EDITSQL_BATCH_WAIT_MS", 5) / 1000,
+                       group_key=lambda request: request[1], name="editsql-batcher")
+
+
+def load_adapter(model):
+    from adapters.editsql.editsql_adapter import EditsqlAdapter
+
+    start = time.time()
+    adapter = EditsqlAdapter(model)
+    logger.info("Loaded editsql %s model in %.1fs", model, time.time() - start)
+    return adapter
+
 
 @no_stdout
 def setup():
     global ediAdapter_spider, ediAdapter_sparc
-    ediAdapter_spider = EditsqlAdapter("spider")
-    ediAdapter_sparc = EditsqlAdapter("sparc")
+    # imported here, so that importing the interface does not load editsql
+    # (and before the threads start, so that the module patches editsql only once)
+    import adapters.editsql.editsql_adapter
+
+    # the two models are independent, so they are loaded concurrently
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="editsql-setup") as pool:
+        spider = pool.submit(load_adapter, "spider")
+        sparc = pool.submit(load_adapter, "sparc")
+    ediAdapter_spider = spider.result()
+    ediAdapter_sparc = sparc.result()
+
+
+def model_files():
+    # the checkpoints and vocabularies, cached translations are invalidated when they change
+    # (from the constants, so that computing the key of a translation does not load editsql)
+    from adapters.editsql.bundle import SERVING_BUNDLE_FILENAME
+    from adapters.editsql.constants import SPARC_DATA_DIR, SPARC_SAVE_FILE, SPIDER_DATA_DIR, SPIDER_SAVE_FILE
+
+    return [SPIDER_SAVE_FILE, SPIDER_DATA_DIR / SERVING_BUNDLE_FILENAME,
+            SPARC_SAVE_FILE, SPARC_DATA_DIR / SERVING_BUNDLE_FILENAME]
+
+
+def question_template(nl_question, db_id):
+    # the values of the questions, the sql of questions with the same template differs only in them
+    from adapters.editsql.templates import anonymize_question
+
+    return anonymize_question(nl_question)
+
+
+def teardown():
+    global ediAdapter_spider, ediAdapter_sparc
+    from adapters.editsql.editsql_adapter import release_shared_bert
+
+    batcher.stop()
+    ediAdapter_spider = None
+    ediAdapter_sparc = None
+    release_shared_bert()
 
 
 @no_stdout
 def translate(nl_question, db_id):
+    if batcher.max_size > 1:
+        return batcher.submit((nl_question, db_id))
     return ediAdapter_spider.translate(nl_question, db_id)
 
 
+@no_stdout
+def translate_batch(requests):
+    return ediAdapter_spider.translate_batch(requests)
+
+
 @no_stdout
 def translate_interaction(nl_question, db_id, prev_nl_questions, prev_predictions):
     return ediAdapter_sparc.translate_interaction(nl_question, db_id, prev_nl_questions, prev_predictions)
\ No newline at end of file
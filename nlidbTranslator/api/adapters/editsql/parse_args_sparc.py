@@ -3,7 +3,7 @@ from pathlib import Path
 import os
 import argparse
 
-from adapters.editsql.constants import EDITSQL_BASE_DIR
+from adapters.editsql.constants import EDITSQL_BASE_DIR, SPARC_DATA_DIR, SPARC_SAVE_FILE
 from api.paths import SCHEMAS_DIR, GLOVE_FILE
 
 args = sys.argv
@@ -33,7 +33,7 @@ def interpret_args():
         type=str,
         default=str(EDITSQL_BASE_DIR / Path('../atis_data/data/resplit/processed/test_with_tables.pkl')))
 
-    parser.add_argument('--data_directory', type=str, default=str(EDITSQL_BASE_DIR / Path("processed_data_sparc_removefrom_test")))
+    parser.add_argument('--data_directory', type=str, default=str(SPARC_DATA_DIR))
 
     parser.add_argument('--processed_train_filename', type=str, default='train.pkl')
     parser.add_argument('--processed_dev_filename', type=str, default='dev.pkl')
@@ -129,7 +129,7 @@ def interpret_args():
 
     parser.add_argument('--evaluate', type=bool, default=True)
     parser.add_argument('--attention', type=bool, default=False)
-    parser.add_argument('--save_file', type=str, default=str(EDITSQL_BASE_DIR / Path("logs/logs_sparc_editsql/save_31_sparc_editsql")))
+    parser.add_argument('--save_file', type=str, default=str(SPARC_SAVE_FILE))
     parser.add_argument('--enable_testing', type=bool, default=False)
     parser.add_argument('--use_predicted_queries', type=bool, default=True)
     parser.add_argument('--evaluate_split', type=str, default="valid")
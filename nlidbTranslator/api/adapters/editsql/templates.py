@@ -0,0 +1,44 @@
+import re
+
+# placeholder types, named like the anonymization tokens of editsql (e.g. CITY_NAME0)
+NUMBER = "NUMBER"
+STRING = "STRING"
+
+# quoted values (as in the spider questions: `` Data base ``, "...", '...') and numbers that are separate words.
+# the anonymizer of editsql only knows the entities of ATIS, so the spider questions are matched by this pattern
+VALUE_PATTERN = re.compile(r"``\s*(?P<backquoted>.+?)\s*(?:``|'')"
+                           r"|(?<!\w)\"\s*(?P<double>[^\"]+?)\s*\"(?!\w)"
+                           r"|(?<!\w)'\s*(?P<single>[^']+?)\s*'(?!\w)"
+                           r"|(?<![\w.])(?P<number>\d+(?:\.\d+)?)(?![\w.])")
+
+
+def anonymize_question(nl_question):
+    """
+        Replace the literal values of a question by placeholders, so that questions that differ only in
+        their values have the same template. Equal values get the same placeholder.
+
+        Args:
+            nl_question: the natural language question
+
+        Returns:
+            the template and the dict from placeholder to value,
+            e.g. "cars with more than NUMBER0 cylinders" and {"NUMBER0": "4"}
+    """
+    values = dict()
+
+    def replace(match):
+        kind = NUMBER if match.group("number") is not None else STRING
+        value = next(v for v in match.groupdict().values() if v is not None)
+        for placeholder, other in values.items():
+            if other == value and placeholder.startswith(kind):
+                break
+        else:
+            placeholder = kind + str(sum(1 for p in values if p.startswith(kind)))
+            values[placeholder] = value
+        # keep the quotes, they are part of the question the model sees
+        start, end = match.span(match.lastgroup)
+        text = match.group(0)
+        return text[:start - match.start()] + placeholder + text[end - match.start():]
+
+    template = VALUE_PATTERN.sub(replace, nl_question)
+    return template, values
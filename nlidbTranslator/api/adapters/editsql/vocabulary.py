@@ -0,0 +1,35 @@
+import pickle
+from pathlib import Path
+
+from adapters.editsql import parse_args_spider, parse_args_sparc
+
+
+def vocabulary_files():
+    """
+        Returns the paths of the input, output and schema vocabularies of the spider and the sparc model
+    """
+    files = []
+    for parse_args in (parse_args_spider, parse_args_sparc):
+        params = parse_args.interpret_args()
+        directory = Path(params.data_directory)
+        files.append(directory / params.input_vocabulary_filename)
+        files.append(directory / params.output_vocabulary_filename)
+        files.append(directory / ("schema_" + params.output_vocabulary_filename))
+    return [f for f in files if f.exists()]
+
+
+def embedding_vocabulary():
+    """
+        Collect all tokens editsql looks up in the glove embeddings
+
+        Returns:
+            the set of tokens and the list of files they were read from
+    """
+    tokens = set()
+    files = vocabulary_files()
+    for vocab_file in files:
+        # the vocabulary files start with the pickled token_to_id dict
+        with open(str(vocab_file), 'rb') as infile:
+            token_to_id = pickle.load(infile)
+        tokens.update(token_to_id)
+    return tokens, files
@@ -20,11 +20,17 @@ def list_of_files(directory, extension=""):
 # list of available translators based on files
 translators = list_of_files(directory=ADAPTERS_DIR)
 
-schema_files = list_of_files(directory=SCHEMAS_DIR, extension=".json")
-schemas = {}
-for schema_f in schema_files:
-    # access schema definitions list
-    with open(os.path.join(SCHEMAS_DIR, schema_f + ".json")) as infile:
+
+def read_schema_file(path):
+    """
+        Read the schema definitions of a file
+
+        Returns:
+            the dict from database id to schema and the version (size and modification time) of the file that was read
+    """
+    with open(path) as infile:
+        # the version of the content that is read, later changes of the file are not in the returned schemas
+        stat = os.fstat(infile.fileno())
         schema_list = json.load(infile)
 
     # restructure the list into a dict according to the database id
@@ -32,6 +38,16 @@ for schema_f in schema_files:
     for entry in schema_list:
         value_for_key = entry["db_id"]
         schema_dict[value_for_key] = entry
+    return schema_dict, (stat.st_size, stat.st_mtime_ns)
+
+
+schema_files = list_of_files(directory=SCHEMAS_DIR, extension=".json")
+schemas = {}
+# database id to the version of the file its schema was loaded from, the schemas are not reloaded when it changes
+schema_versions = {}
+for schema_f in schema_files:
+    # access schema definitions list
+    schema_dict, version = read_schema_file(os.path.join(SCHEMAS_DIR, schema_f + ".json"))
 
     # check for duplicates
     for db_id in schema_dict:
@@ -40,6 +56,7 @@ for schema_f in schema_files:
 
     # add the schema definitions from this iteration to the overall collection
     schemas.update(schema_dict)
+    schema_versions.update({db_id: version for db_id in schema_dict})
 
 
 # store the mapping of table name to column names for each schema
@@ -0,0 +1,94 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.handlers.asgi import ASGIHandler
+from django.db import close_old_connections
+
+from api.setup_util import get_setting
+
+# threads that run the translating views, see TRANSLATION_EXECUTOR_WORKERS in the settings
+translation_executor = ThreadPoolExecutor(max_workers=get_setting("TRANSLATION_EXECUTOR_WORKERS", 8),
+                                          thread_name_prefix="translation")
+
+
+def run_view(view, request, *args, **kwargs):
+    try:
+        response = view(request, *args, **kwargs)
+        # render here instead of in the thread that runs all synchronous views under ASGI
+        if hasattr(response, 'render') and callable(response.render):
+            response.render()
+        return response
+    finally:
+        # the threads of the executor outlive the request, unlike the connection of the request
+        close_old_connections()
+
+
+def async_view(view):
+    """
+        Wraps a view (e.g. the result of as_view()) into an async view that awaits the view running in
+        translation_executor. Under ASGI, the event loop and the other views are then not blocked by a
+        translation, at most TRANSLATION_EXECUTOR_WORKERS requests translate at the same time and
+        the others wait without holding a thread.
+
+        Returns:
+            the async view, with the attributes of view (e.g. cls and csrf_exempt of an APIView)
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(translation_executor,
+                                          functools.partial(run_view, view, request, *args, **kwargs))
+
+    return wrapper
+
+
+class StreamingASGIHandler(ASGIHandler):
+    """
+    Django 3.1 iterates streaming responses on the event loop, so that generating their content
+    (e.g. the translations of /translate/batch) blocks every other request of the process.
+    This handler iterates them in a thread of their own.
+    """
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+
+        response_headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode('ascii')
+            if isinstance(value, str):
+                value = value.encode('latin1')
+            response_headers.append((bytes(header), bytes(value)))
+        for c in response.cookies.values():
+            response_headers.append((b'Set-Cookie', c.output(header='').encode('ascii').strip()))
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': response_headers,
+        })
+
+        loop = asyncio.get_running_loop()
+        end = object()
+        # one thread for the whole response, e.g. for the database connection of its generator
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="streaming-response") as executor:
+            try:
+                parts = iter(response)
+                while True:
+                    part = await loop.run_in_executor(executor, next, parts, end)
+                    if part is end:
+                        break
+                    for chunk, _ in self.chunk_bytes(part):
+                        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                await send({'type': 'http.response.body'})
+            finally:
+                # also ends an unfinished generator, e.g. when the client disconnected
+                await loop.run_in_executor(executor, close_response, response)
+
+
+def close_response(response):
+    try:
+        response.close()
+    finally:
+        close_old_connections()
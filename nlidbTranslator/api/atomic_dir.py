@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None    # not available on windows, where the processes are not locked against each other
+
+
+@contextmanager
+def store_lock(directory):
+    """
+        Hold an exclusive lock on directory against all processes (e.g. the uWSGI workers that convert
+        the same store at their first start). The lock file is next to the directory.
+    """
+    directory = Path(directory)
+    directory.parent.mkdir(parents=True, exist_ok=True)
+    with open(str(directory.with_name(directory.name + ".lock")), 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@contextmanager
+def new_directory(directory):
+    """
+        Yields a new empty directory next to directory, which replaces directory when the block completes.
+        Readers see either the complete old or the complete new content, never a partly written one.
+        Must be used while holding store_lock(directory).
+    """
+    directory = Path(directory)
+    directory.parent.mkdir(parents=True, exist_ok=True)
+    prefix = directory.name + ".tmp-"
+    # left behind by an interrupted process, nobody else writes while the lock is held
+    for stale in directory.parent.glob(prefix + "*"):
+        shutil.rmtree(str(stale), ignore_errors=True)
+
+    tmp_dir = Path(tempfile.mkdtemp(prefix=prefix, dir=str(directory.parent)))
+    # mkdtemp creates a private directory, the store is readable like other new directories
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(str(tmp_dir), 0o777 & ~umask)
+    try:
+        yield tmp_dir
+    except BaseException:
+        shutil.rmtree(str(tmp_dir), ignore_errors=True)
+        raise
+
+    # a non-empty directory cannot be replaced, so the old one is moved aside first
+    old_dir = None
+    if directory.exists():
+        old_dir = Path(tempfile.mkdtemp(prefix=prefix, dir=str(directory.parent)))
+        os.replace(str(directory), str(old_dir / directory.name))
+    os.replace(str(tmp_dir), str(directory))
+    if old_dir is not None:
+        # files that are still memory-mapped by other processes stay valid until they are unmapped
+        shutil.rmtree(str(old_dir), ignore_errors=True)
@@ -0,0 +1,115 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# put into the queue to stop the worker thread
+_STOP = object()
+
+
+class MicroBatcher:
+    """
+    Collects the requests of concurrent callers for up to max_wait seconds or max_size requests
+    and passes them to one call of the batch function, from a single worker thread.
+    Each caller gets back the result of its own request.
+    """
+
+    def __init__(self, batch_function, max_size, max_wait, group_key=None, name="batcher"):
+        """
+        Args:
+            batch_function: function that takes a list of requests and returns the list of their results
+                (an exception as result is raised in the caller of that request)
+            max_size: maximum number of requests per batch
+            max_wait: seconds the first request of a batch waits for more requests
+            group_key: optional function of a request, only requests with the same key are passed to one call
+                (e.g. the database id)
+            name: name of the worker thread
+        """
+        self.batch_function = batch_function
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self.group_key = group_key
+        self.name = name
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.batches = 0
+        self.requests = 0
+
+    def submit(self, request):
+        """
+            Returns the result of the request, after it was processed with the other requests of its batch
+        """
+        future = Future()
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, args=(self.queue,), name=self.name, daemon=True)
+                self.thread.start()
+            self.queue.put((request, future))
+        return future.result()
+
+    def stop(self):
+        """
+            Let the worker thread finish the queued requests and exit, it is started again by the next request
+        """
+        with self.lock:
+            if self.thread is not None:
+                # the next worker thread gets a new queue
+                self.queue.put(_STOP)
+                self.queue = queue.Queue()
+                self.thread = None
+
+    def collect(self, requests, first):
+        # the first request waits at most max_wait for the others
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # stop after this batch
+                requests.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def run(self, requests):
+        while True:
+            first = requests.get()
+            if first is _STOP:
+                return
+            batch = self.collect(requests, first)
+            self.batches += 1
+            self.requests += len(batch)
+
+            groups = dict()
+            for request, future in batch:
+                key = self.group_key(request) if self.group_key is not None else None
+                groups.setdefault(key, []).append((request, future))
+            for group in groups.values():
+                self.process(group)
+
+    def process(self, group):
+        try:
+            results = self.batch_function([request for request, _ in group])
+        except Exception as e:
+            for _, future in group:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(group, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "mean batch size": self.requests / self.batches if self.batches else None,
+        }
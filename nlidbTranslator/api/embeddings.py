@@ -0,0 +1,222 @@
+import json
+import os
+from collections.abc import Mapping
+from pathlib import Path
+
+import numpy as np
+
+from api.atomic_dir import new_directory, store_lock
+from api.mmap_index import MappedKeyIndex, write_key_index
+
+# file names inside a store directory
+VECTORS_FILENAME = "vectors.bin"
+TOKENS_INDEX_NAME = "tokens"
+META_FILENAME = "meta.json"
+
+STORE_FORMAT_VERSION = 2
+
+# by default only the first (i.e. most frequent) tokens of the glove file are used
+THRESHOLD = 500000
+
+
+def source_signature(file_name):
+    """
+        Describes a source file by size and modification time, to detect when a store is outdated
+    """
+    stat = os.stat(str(file_name))
+    return {"size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+
+def convert_glove(file_name, store_dir, limit=None, dtype=np.float32, vocabulary=None, keep_top=0, inputs=None,
+                  if_outdated=False):
+    """
+        Convert a GloVe text file into a binary store, i.e. a contiguous matrix and a token to row index.
+        Concurrent conversions of processes into the same store_dir are done one after the other,
+        the store is replaced as a whole once it is complete.
+
+        Args:
+            file_name: path of the GloVe text file
+            store_dir: directory the store is written to
+            limit: only consider the first `limit` lines of the file (all lines if None)
+            dtype: numpy type of the stored vectors
+            vocabulary: if given, only store these tokens (pruned store)
+            keep_top: number of the first (i.e. most frequent) tokens to keep in addition to the vocabulary
+            inputs: list of files the vocabulary was computed from, a pruned store is outdated once one changes
+            if_outdated: skip the conversion if the store is current, e.g. because another process just converted it
+
+        Returns:
+            the number of stored tokens
+    """
+    store_dir = Path(store_dir)
+    with store_lock(store_dir):
+        if if_outdated and is_store_current(store_dir, file_name, limit=limit):
+            return read_store_meta(store_dir)["count"]
+
+        print('Converting word embedding from %s to %s' % (file_name, store_dir))
+        with new_directory(store_dir) as directory:
+            return _write_glove_store(file_name, directory, limit, dtype, vocabulary, keep_top, inputs)
+
+
+def _write_glove_store(file_name, directory, limit, dtype, vocabulary, keep_top, inputs):
+    tokens = []
+    seen = set()
+    dimension = None
+    with open(str(file_name)) as inf, open(str(directory / VECTORS_FILENAME), 'wb') as outf:
+        for idx, line in enumerate(inf):
+            if limit is not None and idx >= limit:
+                break
+            info = line.strip().split(' ')
+            # same semantics as the original text loader: the first occurrence of a token wins
+            if info[0].lower() in seen:
+                continue
+            seen.add(info[0])
+            if vocabulary is not None and idx >= keep_top and info[0] not in vocabulary:
+                continue
+            vector = np.array(info[1:], dtype=dtype)
+            if dimension is None:
+                dimension = len(vector)
+            tokens.append(info[0])
+            outf.write(vector.tobytes())
+
+    write_key_index(directory / TOKENS_INDEX_NAME, tokens, range(len(tokens)))
+
+    # written last, a store without meta data is incomplete
+    meta = {
+        "format": STORE_FORMAT_VERSION,
+        "dtype": np.dtype(dtype).name,
+        "count": len(tokens),
+        "dimension": dimension or 0,
+        "limit": limit,
+        "source": source_signature(file_name),
+        "pruned": vocabulary is not None,
+        "inputs": {str(f): source_signature(f) for f in inputs or []},
+    }
+    with open(str(directory / META_FILENAME), 'w') as f:
+        json.dump(meta, f, indent=4)
+
+    return len(tokens)
+
+
+def read_store_meta(store_dir):
+    """
+        Returns the meta data of the store in store_dir or None if there is no complete store
+    """
+    meta_file = Path(store_dir) / META_FILENAME
+    if not meta_file.exists():
+        return None
+    with open(str(meta_file)) as f:
+        return json.load(f)
+
+
+def is_store_current(store_dir, file_name, limit=None):
+    """
+        Check whether store_dir holds a store that was converted from the current version of file_name
+    """
+    meta = read_store_meta(store_dir)
+    if meta is None or meta.get("format") != STORE_FORMAT_VERSION:
+        return False
+    for input_file, signature in meta.get("inputs", {}).items():
+        if not Path(input_file).exists() or source_signature(input_file) != signature:
+            return False
+    if not Path(file_name).exists():
+        # the text file may be removed after the conversion
+        return meta["limit"] == limit
+    return meta["limit"] == limit and meta["source"] == source_signature(file_name)
+
+
+def collect_schema_tokens(schemas, lemmatize=None):
+    """
+        Collect the tokens of all table and column names, i.e. every schema token a translator may look up
+
+        Args:
+            schemas: dict from schema name to the schema definition
+            lemmatize: optional function that is additionally applied to every token
+
+        Returns:
+            set of tokens
+    """
+    tokens = set()
+    for schema in schemas.values():
+        names = schema["table_names"] + schema["table_names_original"]
+        names += [column[1] for column in schema["column_names"] + schema["column_names_original"]]
+        for name in names:
+            for token in name.replace("_", " ").split():
+                tokens.update([token, token.lower()])
+                if lemmatize is not None:
+                    tokens.add(lemmatize(token.lower()))
+    return tokens
+
+
+class GloveStore(Mapping):
+    """
+    Read-only mapping from token to embedding vector backed by a memory-mapped matrix
+
+    Only the pages of the vectors that are actually accessed are loaded into memory.
+    The returned vectors are read-only views into the mapped file.
+    As the token index is memory-mapped as well, all processes that open the same store
+    (e.g. the uWSGI workers) share a single copy of it in the page cache.
+    Vectors of stores with a reduced precision (e.g. float16) are upcast to float32 on access.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = Path(store_dir)
+        self.meta = read_store_meta(self.store_dir)
+        if self.meta is None:
+            raise FileNotFoundError("No embedding store found in {}".format(self.store_dir))
+
+        shape = (self.meta["count"], self.meta["dimension"])
+        self.vectors = np.memmap(str(self.store_dir / VECTORS_FILENAME), dtype=self.meta["dtype"], mode='r',
+                                 shape=shape)
+        self.index = MappedKeyIndex(self.store_dir / TOKENS_INDEX_NAME)
+        self.upcast = np.dtype(self.meta["dtype"]).itemsize < np.dtype(np.float32).itemsize
+
+    @property
+    def dimension(self):
+        return self.meta["dimension"]
+
+    def __getitem__(self, token):
+        row = self.index.get(token)
+        if row is None:
+            raise KeyError(token)
+        if self.upcast:
+            return np.asarray(self.vectors[row]).astype(np.float32)
+        return np.asarray(self.vectors[row])
+
+    def __contains__(self, token):
+        return token in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+
+class FallbackStore(Mapping):
+    """
+    Pruned store whose missing tokens are looked up in the full store, e.g. rare words of open vocabulary questions
+    """
+
+    def __init__(self, store, fallback):
+        self.store = store
+        self.fallback = fallback
+
+    @property
+    def dimension(self):
+        return self.store.dimension
+
+    def __getitem__(self, token):
+        try:
+            return self.store[token]
+        except KeyError:
+            return self.fallback[token]
+
+    def __contains__(self, token):
+        return token in self.store or token in self.fallback
+
+    def __iter__(self):
+        # the full store holds the tokens of the pruned one as well
+        return iter(self.fallback)
+
+    def __len__(self):
+        return len(self.fallback)
@@ -0,0 +1,232 @@
+import json
+import logging
+import os
+import socket
+import threading
+from datetime import timedelta
+
+from django.db import close_old_connections, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from api.models import Job, JobItem, Translation
+from api.process_request import check_batch_item, format_sql, translate_group
+from api.setup_util import get_setting
+from api.translation_cache import caching_enabled, translation_version
+from rest_framework.exceptions import ValidationError
+
+logger = logging.getLogger(__name__)
+
+
+def parse_job_file(lines, defaults=None):
+    """
+        Read the questions of a job, one json object per line
+
+        Args:
+            lines: iterable of the lines (str or bytes)
+            defaults: optional values for db_schema and translator of lines without them
+
+        Returns:
+            the list of the items, each with nl_question, db_schema and translator
+    """
+    items = []
+    for number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            raise ValidationError(detail="Line {}: invalid json".format(number))
+        if isinstance(item, dict):
+            item = dict(defaults or {}, **item)
+        check_batch_item(number, item, position="Line")
+        items.append(item)
+    if not items:
+        raise ValidationError(detail="The file contains no questions")
+    return items
+
+
+def create_job(items):
+    """
+        Queue the translation of the items
+
+        Returns:
+            the Job
+    """
+    with transaction.atomic():
+        job = Job.objects.create(total=len(items))
+        JobItem.objects.bulk_create(
+            [JobItem(job=job, index=index, nl_question=item['nl_question'], db_schema=item['db_schema'],
+                     translator=item['translator']) for index, item in enumerate(items)],
+            batch_size=500)
+    job_workers.wake()
+    return job
+
+
+def job_progress(job):
+    counts = job.items.aggregate(completed=Count('id', filter=Q(done=True)),
+                                 failed=Count('id', filter=Q(done=True, error__isnull=False)))
+    return {
+        "id": job.id,
+        "status": job.status,
+        "total": job.total,
+        "completed": counts['completed'],
+        "failed": counts['failed'],
+        "error": job.error,
+        "created": job.created,
+    }
+
+
+def job_result_lines(job):
+    """
+        Returns:
+            generator of one json line per translated item, in the order of the uploaded file
+    """
+    for item in job.items.filter(done=True).order_by('index').iterator():
+        result = {
+            "index": item.index,
+            "nl_question": item.nl_question,
+            "db_schema": item.db_schema,
+            "translator": item.translator,
+        }
+        if item.error is None:
+            result["sql_statement"] = item.sql_statement
+        else:
+            result["error"] = item.error
+        yield json.dumps(result) + "\n"
+
+
+def claim_job(worker):
+    """
+        Returns the oldest queued job, or a running job whose worker stopped reporting progress,
+        after marking it as running for worker. None if there is no such job.
+    """
+    stale = timezone.now() - timedelta(seconds=get_setting("JOB_HEARTBEAT_TIMEOUT", 300))
+    candidates = Job.objects.filter(Q(status=Job.QUEUED) | Q(status=Job.RUNNING, heartbeat__lt=stale))
+    for job in candidates.order_by('created')[:10]:
+        # only one worker wins the update, also across processes
+        claimed = Job.objects.filter(pk=job.pk, status=job.status, heartbeat=job.heartbeat).update(
+            status=Job.RUNNING, worker=worker, heartbeat=timezone.now())
+        if claimed:
+            if job.status == Job.RUNNING:
+                logger.info("Resuming job %d of %s", job.pk, job.worker)
+            job.refresh_from_db()
+            return job
+    return None
+
+
+def process_job(job, worker):
+    """
+        Translate the remaining items of the job in chunks of TRANSLATION_BATCH_CHUNK_SIZE questions of the same
+        translator and schema. The results of every chunk are stored right away, so that an interrupted job
+        resumes with the remaining items.
+
+        Returns:
+            False if another worker took over the job
+    """
+    chunk_size = get_setting("TRANSLATION_BATCH_CHUNK_SIZE", 32)
+    while True:
+        pending = list(job.items.filter(done=False).order_by('translator', 'db_schema', 'index')[:chunk_size])
+        if not pending:
+            break
+        translator, db_schema = pending[0].translator, pending[0].db_schema
+        chunk = [item for item in pending if item.translator == translator and item.db_schema == db_schema]
+
+        version = translation_version(db_schema, translator) if caching_enabled() else ""
+        results = translate_group(translator, db_schema, [item.nl_question for item in chunk])
+        translations = []
+        for item, result in zip(chunk, results):
+            item.done = True
+            if isinstance(result, Exception):
+                item.error = str(result)
+            else:
+                item.sql_statement = format_sql(result)
+                translations.append(Translation(nl_question=item.nl_question, sql_statement=item.sql_statement,
+                                                db_schema=db_schema, translator=translator, version=version))
+
+        with transaction.atomic():
+            if not Job.objects.filter(pk=job.pk, worker=worker).update(heartbeat=timezone.now()):
+                return False
+            JobItem.objects.bulk_update(chunk, ['done', 'sql_statement', 'error'])
+            Translation.objects.bulk_create(translations)
+
+    Job.objects.filter(pk=job.pk, worker=worker).update(status=Job.DONE, heartbeat=timezone.now())
+    return True
+
+
+def run_next_job(worker):
+    """
+        Process one job, if there is one
+
+        Returns:
+            True if a job was processed
+    """
+    job = claim_job(worker)
+    if job is None:
+        return False
+    logger.info("Processing job %d (%d questions)", job.pk, job.total)
+    try:
+        process_job(job, worker)
+    except Exception as e:
+        logger.exception("Job %d failed", job.pk)
+        Job.objects.filter(pk=job.pk, worker=worker).update(status=Job.FAILED, error=str(e))
+    return True
+
+
+class JobWorkers:
+    """
+    Threads that process the queued jobs, one job per thread at a time
+    """
+
+    def __init__(self, count, poll_interval):
+        """
+        Args:
+            count: number of threads
+            poll_interval: seconds between two checks for new jobs (jobs of other processes, resumable jobs)
+        """
+        self.count = count
+        self.poll_interval = poll_interval
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.threads = []
+        self.started = False
+
+    def start(self):
+        """
+            Start the threads that are not running, e.g. after the process was forked (threads do not survive a fork)
+        """
+        with self.lock:
+            self.started = True
+            self.threads = [thread for thread in self.threads if thread.is_alive()]
+            names = {thread.name for thread in self.threads}
+            for number in range(self.count):
+                name = "job-worker-{}".format(number)
+                if name not in names:
+                    thread = threading.Thread(target=self.run, name=name, daemon=True)
+                    self.threads.append(thread)
+                    thread.start()
+
+    def wake(self):
+        # a worker process forked from the process that started the threads has to start its own
+        if self.started:
+            self.start()
+        self.event.set()
+
+    def run(self):
+        worker = "{}:{}:{}".format(socket.gethostname(), os.getpid(), threading.current_thread().name)
+        while True:
+            close_old_connections()
+            try:
+                found = run_next_job(worker)
+            except Exception:
+                logger.exception("Job worker %s failed", worker)
+                found = False
+            if not found:
+                self.event.wait(self.poll_interval)
+                self.event.clear()
+
+
+# see JOB_WORKERS and JOB_POLL_INTERVAL in the settings
+job_workers = JobWorkers(count=get_setting("JOB_WORKERS", 0), poll_interval=get_setting("JOB_POLL_INTERVAL", 5))
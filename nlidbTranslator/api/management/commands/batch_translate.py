@@ -0,0 +1,184 @@
+import json
+import multiprocessing
+import os
+import sys
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.process_request import batch_result_line, check_batch_item, format_sql, translate_group
+from api.setup_util import get_setting
+from rest_framework.exceptions import ValidationError
+
+
+def read_checkpoint(output_file, retry_failed=False):
+    """
+        Collect the indexes of the items that are already in the output file of an interrupted run
+        and cut off a line that was only partly written
+
+        Args:
+            output_file: path of the output file
+            retry_failed: also remove the items with an error from the output file, so that they are translated again
+
+        Returns:
+            the set of the indexes
+    """
+    done = set()
+    if not os.path.exists(output_file):
+        return done
+    complete = 0
+    kept = []
+    with open(output_file, 'rb') as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                result = json.loads(line)
+                index = result["index"]
+            except (ValueError, KeyError):
+                break
+            complete += len(line)
+            if retry_failed and "error" in result:
+                continue
+            done.add(index)
+            kept.append(line)
+
+    if sum(len(line) for line in kept) < complete:
+        # the failed items are dropped, the output holds one line per item also after the retry
+        tmp_file = output_file + ".tmp"
+        with open(tmp_file, 'wb') as f:
+            f.writelines(kept)
+        os.replace(tmp_file, output_file)
+    elif complete < os.path.getsize(output_file):
+        with open(output_file, 'r+b') as f:
+            f.truncate(complete)
+    return done
+
+
+def read_items(input_file, defaults):
+    """
+        Read the questions, one json object per line
+
+        Returns:
+            generator of (index, item, error) for each non-empty line, error is None for valid items
+    """
+    with open(input_file, encoding='utf-8') as f:
+        index = 0
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+                if isinstance(item, dict):
+                    item = dict(defaults, **item)
+                check_batch_item(index, item, position="Line")
+                yield index, item, None
+            except ValueError:
+                yield index, None, "invalid json"
+            except ValidationError as e:
+                yield index, item if isinstance(item, dict) else None, str(e.detail[0])
+            index += 1
+
+
+def init_worker(threads):
+    # every process translates on its own cores
+    os.environ["OMP_NUM_THREADS"] = os.environ["MKL_NUM_THREADS"] = str(threads)
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
+
+
+def translate_chunk(chunk):
+    """
+        Translate a chunk of questions in a worker process, the translator is set up at the first chunk
+        and stays loaded for the following ones
+
+        Args:
+            chunk: (translator, db_schema, list of (index, item))
+
+        Returns:
+            the list of the result lines and the number of failed questions
+    """
+    translator, db_schema, indexed_items = chunk
+    results = translate_group(translator, db_schema, [item['nl_question'] for _, item in indexed_items])
+    lines = []
+    failed = 0
+    for (index, item), result in zip(indexed_items, results):
+        if isinstance(result, Exception):
+            lines.append(batch_result_line(index, item, error=str(result)))
+            failed += 1
+        else:
+            lines.append(batch_result_line(index, item, sql_statement=format_sql(result)))
+    return lines, failed
+
+
+class Command(BaseCommand):
+    help = "Translate a JSONL file of questions (one object with nl_question, db_schema and translator per line) " \
+           "in parallel processes. The results are appended to the output file as they complete, " \
+           "a run that was interrupted continues with the questions that are not in the output file yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help="JSONL file with the questions")
+        parser.add_argument('output', help="JSONL file for the results, one object per question with its index "
+                                           "(line number in the input, empty lines not counted)")
+        parser.add_argument('--translator', help="translator of the lines without one")
+        parser.add_argument('--db_schema', help="schema of the lines without one")
+        parser.add_argument('--processes', type=int, default=2,
+                            help="number of worker processes, each loads the translators once and needs their memory "
+                                 "(several GB for EditSQL or IRNet), see also --threads")
+        parser.add_argument('--threads', type=int, default=1, help="torch threads per worker process")
+        parser.add_argument('--retry_failed', action='store_true',
+                            help="translate the questions that failed in an earlier run again instead of keeping "
+                                 "their errors in the output file")
+        parser.add_argument('--chunk_size', type=int, default=get_setting("TRANSLATION_BATCH_CHUNK_SIZE", 32),
+                            help="number of questions of the same translator and schema sent to a worker at once")
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options['input']):
+            raise CommandError("Input file not found: {}".format(options['input']))
+        defaults = {name: options[name] for name in ['translator', 'db_schema'] if options[name]}
+        chunk_size = max(1, options['chunk_size'])
+        processes = max(1, options['processes'])
+
+        done = read_checkpoint(options['output'], retry_failed=options['retry_failed'])
+        if done:
+            self.stdout.write("Resuming, {} questions are already translated".format(len(done)))
+
+        # at most two chunks per process are read ahead of the results, so the input is streamed
+        in_flight = threading.Semaphore(2 * processes)
+        written = failed = 0
+        # the chunks are read in a thread of the pool, which writes the invalid lines
+        lock = threading.Lock()
+
+        with open(options['output'], 'a', encoding='utf-8') as output:
+            def write(lines, errors):
+                nonlocal written, failed
+                with lock:
+                    output.writelines(lines)
+                    output.flush()
+                    written += len(lines)
+                    failed += errors
+
+            def chunks():
+                pending = dict()
+                for index, item, error in read_items(options['input'], defaults):
+                    if index in done:
+                        continue
+                    if error is not None:
+                        write([json.dumps(dict(item or {}, index=index, error=error)) + "\n"], 1)
+                        continue
+                    key = item['translator'], item['db_schema']
+                    pending.setdefault(key, []).append((index, item))
+                    if len(pending[key]) == chunk_size:
+                        in_flight.acquire()
+                        yield key + (pending.pop(key),)
+                for key, indexed_items in pending.items():
+                    in_flight.acquire()
+                    yield key + (indexed_items,)
+
+            with multiprocessing.Pool(processes, initializer=init_worker, initargs=(options['threads'],)) as pool:
+                for lines, errors in pool.imap_unordered(translate_chunk, chunks()):
+                    in_flight.release()
+                    write(lines, errors)
+                    self.stdout.write("Translated {} questions ({} failed)".format(written, failed))
+
+        self.stdout.write("Done: {} questions translated in this run, {} failed".format(written, failed))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from api.model_server import ModelServer
+from api.setup_util import create_translator_registry, get_setting, model_server_authkey
+
+
+class Command(BaseCommand):
+    help = "Load the enabled translators and serve them to the web server processes at MODEL_SERVER_ADDRESS"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--address', help="unix socket path, default: MODEL_SERVER_ADDRESS")
+        parser.add_argument('--workers', type=int, default=get_setting("MODEL_SERVER_WORKERS", 4),
+                            help="number of requests passed to the translators at the same time")
+
+    def handle(self, *args, **options):
+        address = options['address'] or get_setting("MODEL_SERVER_ADDRESS", None)
+        if address is None:
+            self.stderr.write("Set MODEL_SERVER_ADDRESS in the settings or use --address")
+            return
+        registry = create_translator_registry()
+        if get_setting("EAGER_TRANSLATOR_LOADING", False):
+            registry.load_all()
+
+        server = ModelServer(registry, address, model_server_authkey(), workers=options['workers'])
+        self.stdout.write("Serving {} on {}, stop with CONTROL-C".format(", ".join(registry.names), address))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.stop()
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from api.jobs import JobWorkers
+from api.setup_util import get_setting
+
+
+class Command(BaseCommand):
+    help = "Translate the queued jobs (see /jobs) until the command is stopped, " \
+           "e.g. in a separate process instead of the job workers of the server (JOB_WORKERS = 0)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help="number of jobs that are processed at the same time")
+
+    def handle(self, *args, **options):
+        workers = JobWorkers(count=options['workers'], poll_interval=get_setting("JOB_POLL_INTERVAL", 5))
+        workers.start()
+        self.stdout.write("Processing jobs with {} workers, stop with CONTROL-C".format(options['workers']))
+        try:
+            for thread in workers.threads:
+                thread.join()
+        except KeyboardInterrupt:
+            pass
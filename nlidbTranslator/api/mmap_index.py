@@ -0,0 +1,133 @@
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# suffixes of the files that make up an index
+KEYS_SUFFIX = ".keys"
+OFFSETS_SUFFIX = ".offsets"
+PREFIXES_SUFFIX = ".prefixes"
+VALUES_SUFFIX = ".values"
+
+PREFIX_LENGTH = 8
+
+
+def _prefix(key_bytes):
+    # big endian keeps the numeric order of the prefixes consistent with the byte order of the keys
+    return int.from_bytes(key_bytes[:PREFIX_LENGTH].ljust(PREFIX_LENGTH, b'\0'), 'big')
+
+
+def _file(path_prefix, suffix):
+    return Path(str(path_prefix) + suffix)
+
+
+def _replace_file(path, write):
+    # the table is complete before it appears under its name, a process that maps it never sees a partial file
+    fd, tmp_path = tempfile.mkstemp(prefix=path.name + ".tmp-", dir=str(path.parent))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, str(path))
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def write_key_index(path_prefix, keys, values):
+    """
+        Write a sorted key table that maps every string in keys to the integer at the same position in values.
+        Each table replaces its file once it is written. Processes that may write the same index concurrently
+        write into a directory of their own (see api/atomic_dir.py), otherwise the tables could be mixed.
+
+        Args:
+            path_prefix: path that is extended by a suffix for each file of the index
+            keys: list of unique strings
+            values: list of integers
+    """
+    encoded = sorted(zip((k.encode('utf-8') for k in keys), values))
+
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+
+    def write_keys(f):
+        position = 0
+        for i, (key_bytes, _) in enumerate(encoded):
+            f.write(key_bytes)
+            position += len(key_bytes)
+            offsets[i + 1] = position
+
+    _replace_file(_file(path_prefix, KEYS_SUFFIX), write_keys)
+
+    prefixes = np.array([_prefix(k) for k, _ in encoded], dtype=np.uint64)
+    ordered_values = np.array([v for _, v in encoded], dtype=np.int64)
+
+    _replace_file(_file(path_prefix, OFFSETS_SUFFIX), lambda f: f.write(offsets.tobytes()))
+    _replace_file(_file(path_prefix, PREFIXES_SUFFIX), lambda f: f.write(prefixes.tobytes()))
+    _replace_file(_file(path_prefix, VALUES_SUFFIX), lambda f: f.write(ordered_values.tobytes()))
+
+
+def _map(path, dtype):
+    # np.memmap refuses empty files
+    if path.stat().st_size == 0:
+        return np.zeros(0, dtype=dtype)
+    # plain ndarray views avoid the overhead of the memmap subclass on every access
+    return np.asarray(np.memmap(str(path), dtype=dtype, mode='r'))
+
+
+class MappedKeyIndex:
+    """
+    Read-only string to integer index whose tables are memory-mapped files
+
+    Nothing but the file mappings is held per process, so the operating system shares
+    the pages between all processes that open the same index.
+    """
+
+    def __init__(self, path_prefix):
+        self.path_prefix = path_prefix
+        # bytes slices of the raw buffer are the cheapest way to compare keys
+        self.keys = memoryview(_map(_file(path_prefix, KEYS_SUFFIX), np.uint8))
+        self.offsets = _map(_file(path_prefix, OFFSETS_SUFFIX), np.uint64)
+        self.prefixes = _map(_file(path_prefix, PREFIXES_SUFFIX), np.uint64)
+        self.values = _map(_file(path_prefix, VALUES_SUFFIX), np.int64)
+
+    def _key_at(self, position):
+        return self.keys[self.offsets[position]:self.offsets[position + 1]].tobytes()
+
+    def position(self, key):
+        """
+            Returns the position of key in the sorted table or -1 if it does not exist
+        """
+        if not isinstance(key, str):
+            return -1
+        key_bytes = key.encode('utf-8')
+        prefix = np.uint64(_prefix(key_bytes))
+
+        # narrow down to the keys sharing the prefix, then bisect on the full keys
+        lo = int(self.prefixes.searchsorted(prefix, 'left'))
+        hi = int(self.prefixes.searchsorted(prefix, 'right'))
+        while lo < hi:
+            mid = (lo + hi) // 2
+            current = self._key_at(mid)
+            if current == key_bytes:
+                return mid
+            if current < key_bytes:
+                lo = mid + 1
+            else:
+                hi = mid
+        return -1
+
+    def get(self, key, default=None):
+        position = self.position(key)
+        if position < 0:
+            return default
+        return int(self.values[position])
+
+    def __contains__(self, key):
+        return self.position(key) >= 0
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self._key_at(position).decode('utf-8')
@@ -0,0 +1,232 @@
+import logging
+import os
+import queue
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+from api.registry import OPERATIONS, TranslatorRegistry
+
+logger = logging.getLogger(__name__)
+
+# requests that are answered by the registry of the server instead of a translator
+REGISTRY_REQUESTS = ["status", "load_all", "model_version"]
+
+
+class RemoteTranslatorError(Exception):
+    """
+    Raised in the client for an exception of a translator in the model server
+    """
+
+
+class ModelServerTimeout(RemoteTranslatorError):
+    """
+    Raised in the client if the model server does not answer in time
+    """
+
+
+def connection_family(address):
+    # a path is a unix socket, (host, port) a tcp socket
+    return "AF_UNIX" if isinstance(address, str) else "AF_INET"
+
+
+class ModelServer:
+    """
+    Serves the translators of a registry to the processes of the web server, which then hold no models themselves.
+    Every client connection is handled by its own thread, at most workers requests are passed to the
+    translators at the same time (concurrent questions for a translator are batched by its interface,
+    see EDITSQL_BATCH_SIZE and IRNET_BATCH_SIZE).
+
+    The requests are unpickled, i.e. every client that knows the authkey can run code in the server. A unix socket
+    limits the clients to the users with access to its path, a (host, port) address accepts them from every host
+    that reaches the port and should only be used in a trusted network with a MODEL_SERVER_AUTHKEY of its own.
+    """
+
+    def __init__(self, registry, address, authkey, workers):
+        """
+        Args:
+            registry: the TranslatorRegistry that loads the translators in this process
+            address: path of the unix socket or (host, port)
+            authkey: bytes the clients authenticate with
+            workers: maximum number of concurrent translator calls
+        """
+        self.registry = registry
+        self.address = address
+        self.authkey = authkey
+        self.workers = threading.BoundedSemaphore(workers)
+        self.listener = None
+
+    def handle(self, request):
+        name, operation, args, kwargs = request
+        if name is None and operation in REGISTRY_REQUESTS:
+            return getattr(self.registry, operation)(*args, **kwargs)
+        with self.workers:
+            result = self.registry.adapters_dict[name][operation](*args, **kwargs)
+        if operation == "batch":
+            # the exceptions of single questions may not be picklable
+            result = [RemoteTranslatorError("{}: {}".format(type(r).__name__, r)) if isinstance(r, Exception) else r
+                      for r in result]
+        return result
+
+    def serve_connection(self, connection):
+        with connection:
+            while True:
+                try:
+                    request = connection.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    response = ("ok", self.handle(request))
+                except Exception as e:
+                    logger.exception("Request %s failed", request[:2])
+                    response = ("error", "{}: {}".format(type(e).__name__, e))
+                # the version of the model that answered, so that the clients do not have to ask for it
+                connection.send(response + (self.model_version(request[0]),))
+
+    def model_version(self, name):
+        if name not in self.registry.adapters_dict:
+            return None
+        try:
+            return self.registry.model_version(name)
+        except Exception:
+            logger.exception("No model version of %s", name)
+            return None
+
+    def serve_forever(self):
+        if connection_family(self.address) == "AF_UNIX" and os.path.exists(self.address):
+            # left behind by a server that was killed
+            os.remove(self.address)
+        self.listener = Listener(self.address, family=connection_family(self.address), authkey=self.authkey)
+        if connection_family(self.address) == "AF_INET":
+            logger.warning("Model server accepts requests from the network on %s, they are unpickled after "
+                           "authenticating with the authkey", self.address)
+        logger.info("Model server listening on %s", self.address)
+        with self.listener:
+            while True:
+                try:
+                    connection = self.listener.accept()
+                except (OSError, EOFError, AuthenticationError) as e:
+                    if self.listener is None:
+                        return
+                    logger.warning("Rejected connection: %s", e)
+                    continue
+                threading.Thread(target=self.serve_connection, args=(connection,), name="model-server-connection",
+                                 daemon=True).start()
+
+    def stop(self):
+        listener, self.listener = self.listener, None
+        if listener is not None:
+            listener.close()
+
+
+class ModelClient:
+    """
+    Sends requests to the model server, over a pool of connections so that the threads of a process
+    do not wait for each other
+    """
+
+    def __init__(self, address, authkey, timeout=None):
+        """
+        Args:
+            address: path of the unix socket or (host, port) of the model server
+            authkey: bytes the client authenticates with
+            timeout: seconds to wait for the answer to a request, None waits forever
+        """
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+        self.connections = queue.LifoQueue()
+        # translator name to the model version the server reported last and the time it was reported
+        self.model_versions = dict()
+
+    def connect(self):
+        return Client(self.address, family=connection_family(self.address), authkey=self.authkey)
+
+    def exchange(self, connection, request):
+        connection.send(request)
+        if self.timeout is not None and not connection.poll(self.timeout):
+            raise ModelServerTimeout("The model server did not answer within {} seconds".format(self.timeout))
+        return connection.recv()
+
+    def call(self, name, operation, *args, **kwargs):
+        """
+            Returns the result of the operation of the translator in the server,
+            name None calls a method of the registry of the server (see REGISTRY_REQUESTS)
+        """
+        request = (name, operation, args, kwargs)
+        try:
+            connection = self.connections.get_nowait()
+        except queue.Empty:
+            connection = self.connect()
+        try:
+            try:
+                status, result, version = self.exchange(connection, request)
+            except (EOFError, OSError):
+                # the server was restarted, try once more with a new connection
+                connection.close()
+                connection = self.connect()
+                status, result, version = self.exchange(connection, request)
+        except BaseException:
+            # the connection may hold a partly sent request or receive the late answer, it is not reused
+            connection.close()
+            raise
+        self.connections.put(connection)
+        if version is not None:
+            self.model_versions[name] = (version, time.monotonic())
+
+        if status == "error":
+            raise RemoteTranslatorError(result)
+        return result
+
+
+class RemoteTranslatorRegistry(TranslatorRegistry):
+    """
+    Registry of the translators of a model server: the interfaces are imported for question_template(),
+    which does not need the translator, but the operations and the model versions are asked from the server
+    """
+
+    def __init__(self, names, client, version_ttl=10):
+        """
+        Args:
+            names: names of the translators of the server
+            client: the ModelClient of the server
+            version_ttl: seconds the model version the server reported last is used without asking it again
+        """
+        self.client = client
+        self.version_ttl = version_ttl
+        super().__init__(names)
+
+    def operation(self, name, function_name):
+        operation = next(o for o, f in OPERATIONS.items() if f == function_name)
+
+        def remote(*args, **kwargs):
+            return self.client.call(name, operation, *args, **kwargs)
+
+        remote.__name__ = function_name
+        return remote
+
+    def model_version(self, name):
+        """
+            Returns the version of the model the server was set up with, the files of the server may differ from local
+            ones. The server reports it with every answer of the translator, it is only asked for it when the last
+            report is older than version_ttl.
+        """
+        reported = self.client.model_versions.get(name)
+        if reported is not None and time.monotonic() - reported[1] <= self.version_ttl:
+            return reported[0]
+        version = self.client.call(None, "model_version", name)
+        self.client.model_versions[name] = (version, time.monotonic())
+        return version
+
+    def load_all(self):
+        self.client.call(None, "load_all")
+        # the server may have set up the translators with other model files
+        self.client.model_versions.clear()
+
+    def status(self):
+        status = self.client.call(None, "status")
+        # the server may have unloaded or reloaded translators
+        self.client.model_versions.clear()
+        status["model_server"] = self.client.address
+        return status
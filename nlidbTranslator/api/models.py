@@ -1,11 +1,13 @@
 from django.db import models
 
-from api.analysis import schemas, translators
-from api.setup_util import int_translators
+from api.analysis import schemas
+from api.setup_util import enabled_translators as translators, int_translators
 
 # choices for the CharFields of the django models
 TRANSLATOR_CHOICES = list(zip(translators, translators))
 INT_TRANSLATOR_CHOICES = list(zip(int_translators, int_translators))
+# the enabled translators may not support interactions
+INT_TRANSLATOR_DEFAULT = INT_TRANSLATOR_CHOICES[0] if INT_TRANSLATOR_CHOICES else None
 DATABASE_CHOICES = sorted(list(zip(schemas, schemas)))
 
 
@@ -25,6 +27,8 @@ class Translation(models.Model):
         choices=TRANSLATOR_CHOICES,
         default=TRANSLATOR_CHOICES[0],
     )
+    # versions of the schema and model files (see translation_version()), empty if caching is disabled
+    version = models.CharField(max_length=32, blank=True, editable=False)
     created = models.DateTimeField(auto_now_add=True)
 
 
@@ -45,9 +49,48 @@ class Interaction(models.Model):
     translator = models.CharField(
         max_length=100,
         choices=INT_TRANSLATOR_CHOICES,
-        default=INT_TRANSLATOR_CHOICES[0],
+        default=INT_TRANSLATOR_DEFAULT,
     )
     url = models.URLField(
         editable=False
     )
-    created = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    created = models.DateTimeField(auto_now_add=True)
+
+class Job(models.Model):
+    """
+    Translation of an uploaded list of questions, processed by the job workers (see api/jobs.py)
+    """
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [(s, s) for s in [QUEUED, RUNNING, DONE, FAILED]]
+
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=QUEUED,
+    )
+    total = models.IntegerField(default=0)
+    # the worker that processes the job and the last time it reported progress
+    worker = models.CharField(max_length=200, blank=True)
+    heartbeat = models.DateTimeField(null=True)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+
+class JobItem(models.Model):
+    job = models.ForeignKey(Job, on_delete=models.CASCADE, related_name="items")
+    index = models.IntegerField()
+    nl_question = models.CharField(max_length=1000)
+    db_schema = models.CharField(
+        max_length=100,
+        choices=DATABASE_CHOICES,
+    )
+    translator = models.CharField(
+        max_length=100,
+        choices=TRANSLATOR_CHOICES,
+    )
+    sql_statement = models.CharField(max_length=1000, null=True)
+    error = models.TextField(null=True)
+    done = models.BooleanField(default=False)
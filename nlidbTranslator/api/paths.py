@@ -7,6 +7,9 @@ from nlidbTranslator.settings import BASE_DIR, PROJECT_ROOT
 
 TRANSLATORS_DIR = Path(PROJECT_ROOT / "translators")
 GLOVE_FILE = Path(TRANSLATORS_DIR, "glove.42B.300d.txt")
+GLOVE_STORE_DIR = Path(TRANSLATORS_DIR, "glove.42B.300d")
+GLOVE_PRUNED_STORE_DIR = Path(TRANSLATORS_DIR, "glove.42B.300d.pruned")
+SNAPSHOT_DIR = Path(TRANSLATORS_DIR, "snapshots")
 
 ADAPTERS_DIR = Path(BASE_DIR / "api/adapters")
 SCHEMAS_DIR = Path(BASE_DIR / "api/schemas")
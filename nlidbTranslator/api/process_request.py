@@ -1,9 +1,14 @@
+import json
+
 import sqlparse
 
 from analysis import schemas
-from api.setup_util import adapters_dict
+from api.setup_util import adapters_dict, get_setting
 from api.models import Translation, Interaction
 from api.serializers import TranslationSerializer, InteractionSerializer, UtteranceSerializer
+from api.translation_cache import cache_translation, cached_translation, caching_enabled, translation_key, \
+    translation_version, interaction_key, translation_flights
+from api.template_cache import question_template
 from rest_framework.exceptions import ValidationError
 
 
@@ -11,30 +16,69 @@ def format_sql(sql_statement):
     return sqlparse.format(sql_statement, reindent=False, keyword_case='upper', strip_whitespace=True)
 
 
-def store_translation(nl_question, db_schema, translator):
+def translate_question(nl_question, db_schema, translator, key, template):
     """
-        Stores a Translation in the database
+        Translates the question and caches the translation
 
         Args:
-            nl_question: question as a string
-            db_schema: database name
-            translator: translator name
+            key: cache key of the translation, None if caching is disabled
 
         Returns:
-            serializer data for this same Translation
+            the formatted sql
     """
+    # a flight with the same key may have finished and cached the translation after the caller looked it up
+    if key is not None and caching_enabled():
+        formatted = cached_translation(key)
+        if formatted is not None:
+            return formatted
+
     # get the right translation function
     translate = adapters_dict[translator]['translate']
 
     # use the function to translate
     sql_statement = translate(nl_question, db_schema)
     formatted = format_sql(sql_statement)
+    if template is not None:
+        template.store(formatted)
+    if key is not None and caching_enabled():
+        cache_translation(key, formatted)
+    return formatted
+
+
+def store_translation(nl_question, db_schema, translator):
+    """
+        Stores a Translation in the database
+
+        Args:
+            nl_question: question as a string
+            db_schema: database name
+            translator: translator name
+
+        Returns:
+            serializer data for this same Translation
+    """
+    # repeated questions are answered from the cache, but logged like every other translation
+    caching = caching_enabled()
+    # the key depends on the versions of the schema and model files, so it is only computed if it is used
+    key = translation_key(nl_question, db_schema, translator) if caching or translation_flights.enabled else None
+    formatted = cached_translation(key) if caching else None
+
+    # questions that differ only in their values share the sql skeleton, if the translator uses the template cache
+    template = question_template(nl_question, db_schema, translator) if formatted is None else None
+    if template is not None:
+        formatted = template.lookup()
+
+    if formatted is None:
+        # identical requests at the same time wait for the first one instead of translating again
+        formatted = translation_flights.do(
+            key, lambda: translate_question(nl_question, db_schema, translator, key, template))
 
     translation = Translation(
         nl_question=nl_question,
         sql_statement=formatted,
         db_schema=db_schema,
         translator=translator,
+        version=translation_version(db_schema, translator) if caching else "",
     )
     translation.save()
 
@@ -42,6 +86,94 @@ def store_translation(nl_question, db_schema, translator):
     return serializer.data
 
 
+def translate_group(translator, db_schema, nl_questions):
+    """
+        Translates questions for the same translator and schema, using the batched path of the translator if it has one
+
+        Returns:
+            list of the sql statements, or of the exceptions raised for single questions
+    """
+    operations = adapters_dict[translator]
+    if 'batch' in operations:
+        try:
+            return operations['batch']([(nl_question, db_schema) for nl_question in nl_questions])
+        except Exception as e:
+            return [e] * len(nl_questions)
+
+    results = []
+    for nl_question in nl_questions:
+        try:
+            results.append(operations['translate'](nl_question, db_schema))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def batch_result_line(index, item, sql_statement=None, error=None):
+    result = {
+        "index": index,
+        "nl_question": item['nl_question'],
+        "db_schema": item['db_schema'],
+        "translator": item['translator'],
+    }
+    if error is None:
+        result["sql_statement"] = sql_statement
+    else:
+        result["error"] = error
+    return json.dumps(result) + "\n"
+
+
+def stream_batch_translations(items):
+    """
+        Translates the items grouped by translator and schema, in chunks of TRANSLATION_BATCH_CHUNK_SIZE questions
+
+        Args:
+            items: list of dicts with values for nl_question, db_schema and translator (see check_batch_items())
+
+        Returns:
+            generator of one json line per item (NDJSON) in the order the translations complete,
+            index is the position of the item in the list.
+            The Translations are stored with one bulk_create after the last item, or when the client disconnects.
+    """
+    groups = dict()
+    for index, item in enumerate(items):
+        groups.setdefault((item['translator'], item['db_schema']), []).append(index)
+    chunk_size = get_setting("TRANSLATION_BATCH_CHUNK_SIZE", 32)
+
+    translations = []
+    try:
+        for (translator, db_schema), indexes in groups.items():
+            caching = caching_enabled()
+            version = translation_version(db_schema, translator) if caching else ""
+            # answer the cached questions first
+            pending = []
+            for index in indexes:
+                key = translation_key(items[index]['nl_question'], db_schema, translator) if caching else None
+                formatted = cached_translation(key) if caching else None
+                if formatted is None:
+                    pending.append((index, key))
+                    continue
+                translations.append(Translation(nl_question=items[index]['nl_question'], sql_statement=formatted,
+                                                db_schema=db_schema, translator=translator, version=version))
+                yield batch_result_line(index, items[index], sql_statement=formatted)
+
+            for start in range(0, len(pending), chunk_size):
+                chunk = pending[start:start + chunk_size]
+                results = translate_group(translator, db_schema, [items[index]['nl_question'] for index, _ in chunk])
+                for (index, key), result in zip(chunk, results):
+                    if isinstance(result, Exception):
+                        yield batch_result_line(index, items[index], error=str(result))
+                        continue
+                    formatted = format_sql(result)
+                    if caching:
+                        cache_translation(key, formatted)
+                    translations.append(Translation(nl_question=items[index]['nl_question'], sql_statement=formatted,
+                                                    db_schema=db_schema, translator=translator, version=version))
+                    yield batch_result_line(index, items[index], sql_statement=formatted)
+    finally:
+        Translation.objects.bulk_create(translations)
+
+
 def store_interaction(int_id, prev_utterances, nl_question, db_schema, translator, url):
     """
         Stores an Interaction in the database
@@ -69,9 +201,12 @@ def store_interaction(int_id, prev_utterances, nl_question, db_schema, translato
     # get the right translation function
     translate_interaction = adapters_dict[translator]['interaction']
 
-    # use the function to translate
-    sql_statement = translate_interaction(nl_question, db_schema, prev_questions, prev_predictions)
-    formatted = format_sql(sql_statement)
+    # use the function to translate, identical requests at the same time wait for the first one.
+    # interactions are not cached, the key is only computed for the single flight
+    key = interaction_key(nl_question, db_schema, translator, prev_questions, prev_predictions) \
+        if translation_flights.enabled else None
+    formatted = translation_flights.do(
+        key, lambda: format_sql(translate_interaction(nl_question, db_schema, prev_questions, prev_predictions)))
 
     interaction = Interaction(
         url=url,
@@ -154,6 +289,37 @@ def check_params_exist_and_not_empty(request_data, required_params):
         raise ValidationError(detail="No value for parameters {}".format(empty))
 
 
+def check_batch_items(items):
+    """
+        Will raise a Bad Request Error (400) if items is no list of at most TRANSLATION_BATCH_MAX_ITEMS valid items,
+        each with nl_question, db_schema and translator as for a single translation
+    """
+    max_items = get_setting("TRANSLATION_BATCH_MAX_ITEMS", 1000)
+    if not isinstance(items, list) or not items:
+        raise ValidationError(detail="Expected a list of items")
+    if len(items) > max_items:
+        raise ValidationError(detail="Too many items: {} (at most {})".format(len(items), max_items))
+
+    for index, item in enumerate(items):
+        check_batch_item(index, item)
+
+
+def check_batch_item(index, item, position="Item"):
+    """
+        Will raise a Bad Request Error (400) if item is no object with valid values for nl_question, db_schema and translator,
+        the message starts with position and index
+    """
+    try:
+        if not isinstance(item, dict):
+            raise ValidationError(detail="Expected an object")
+        check_params_exist_and_not_empty(request_data=item,
+            required_params=['nl_question', 'db_schema', 'translator'])
+        check_choices_valid(database_id=item['db_schema'], translator=item['translator'],
+            operation_name="translate")
+    except ValidationError as e:
+        raise ValidationError(detail="{} {}: {}".format(position, index, e.detail[0]))
+
+
 def check_choices_valid(database_id, translator, operation_name):
     """
         Will raise a Bad Request Error (400) if database_id or translator are no valid choices or the translator does not support the operation
@@ -0,0 +1,339 @@
+import collections
+import concurrent.futures
+import ctypes
+import ctypes.util
+import gc
+import importlib
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# operations of an adapter entry and the interface functions that implement them
+OPERATIONS = {
+    "translate": "translate",
+    "interaction": "translate_interaction",
+    "batch": "translate_batch",
+}
+
+# number of load and unload events kept for the status report
+EVENT_HISTORY = 100
+
+
+def current_rss_mb():
+    """
+        Returns the resident set size of this process in MB or None if it is unknown (only available on Linux)
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def file_version(path):
+    # size and modification time, None for missing files
+    try:
+        stat = os.stat(str(path))
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def release_free_memory():
+    """
+        Collect garbage and ask the allocator to give freed memory back to the operating system
+    """
+    gc.collect()
+    libc_name = ctypes.util.find_library("c")
+    if libc_name is None:
+        return
+    try:
+        ctypes.CDLL(libc_name).malloc_trim(0)
+    except (OSError, AttributeError):
+        pass    # not glibc
+
+
+class TranslatorRegistry:
+    """
+    Runtime registry of the translators
+
+    The interface modules of the adapters are imported right away, which is cheap as long as they
+    defer loading their system to setup(). setup() itself is called once at the first use of a
+    translator or for all translators at once using load_all().
+
+    Translators whose interface provides teardown() can be unloaded again: after idle_timeout seconds
+    without a request, or least recently used first while the process exceeds memory_limit_mb.
+    An unloaded translator is set up again at its next use.
+    """
+
+    def __init__(self, names, prepare=None, idle_timeout=None, memory_limit_mb=None, check_interval=60,
+                 load_workers=None):
+        """
+        Args:
+            names: names of the enabled translators, i.e. directories in api/adapters
+            prepare: function that is called once before the first translator is set up
+            idle_timeout: seconds without use after which a translator is unloaded (None: never)
+            memory_limit_mb: resident memory of the process above which translators are unloaded (None: no limit)
+            check_interval: seconds between two checks for translators to unload
+            load_workers: number of translators load_all() sets up concurrently (None: all at once)
+        """
+        self.names = list(names)
+        self.prepare = prepare
+        self.load_workers = load_workers
+        self.prepared = False
+        self.modules = dict()
+        self.loaded = set()
+        self.load_times = dict()
+
+        self.idle_timeout = idle_timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.check_interval = check_interval
+        self.monitor = None
+        self.last_used = {name: None for name in self.names}
+        self.in_flight = {name: 0 for name in self.names}
+        self.counts = {name: collections.Counter() for name in self.names}
+        self.events = collections.deque(maxlen=EVENT_HISTORY)
+
+        self.prepare_lock = threading.Lock()
+        self.monitor_lock = threading.Lock()
+        self.locks = {name: threading.Lock() for name in self.names}
+        self.files = dict()
+        # versions of the model files when each translator was set up
+        self.versions = dict()
+
+        # access the specific modules without calling setup()
+        for name in self.names:
+            self.modules[name] = importlib.import_module("api.adapters.{}.interface".format(name))
+
+        # mapping of translator name to its operations, as used by the views
+        self.adapters_dict = dict()
+        self.int_translators = []
+        for name, module in self.modules.items():
+            self.adapters_dict[name] = dict()
+            for operation, function_name in OPERATIONS.items():
+                if hasattr(module, function_name):
+                    self.adapters_dict[name][operation] = self.operation(name, function_name)
+            if "interaction" in self.adapters_dict[name]:
+                self.int_translators.append(name)
+
+    def operation(self, name, function_name):
+        """
+            Returns a function that makes sure the translator is set up before it calls the interface function
+        """
+        def wrapper(*args, **kwargs):
+            self.acquire(name)
+            try:
+                return getattr(self.modules[name], function_name)(*args, **kwargs)
+            finally:
+                self.release(name)
+
+        wrapper.__name__ = function_name
+        return wrapper
+
+    def model_files(self, name):
+        """
+            Returns the files the translations of the translator depend on (e.g. checkpoints),
+            as listed by the optional function model_files() of its interface
+        """
+        if name not in self.files:
+            module = self.modules.get(name)
+            self.files[name] = list(module.model_files()) if hasattr(module, "model_files") else []
+        return self.files[name]
+
+    def model_version(self, name):
+        """
+            Returns the version (size and modification time) of the model files the translator uses:
+            those it was set up with if it is loaded, otherwise those it will be set up with
+        """
+        version = self.versions.get(name)
+        if name in self.loaded and version is not None:
+            return version
+        return tuple(file_version(f) for f in self.model_files(name))
+
+    def template_function(self, name):
+        """
+            Returns the optional function question_template(nl_question, db_id) of the interface of the translator or None,
+            it is called without setting up the translator
+        """
+        return getattr(self.modules[name], "question_template", None)
+
+    # ------------ Loading -----------------
+    def is_loaded(self, name):
+        return name in self.loaded
+
+    def is_evictable(self, name):
+        return hasattr(self.modules[name], "teardown")
+
+    def ensure_prepared(self):
+        with self.prepare_lock:
+            if not self.prepared:
+                if self.prepare is not None:
+                    self.prepare()
+                self.prepared = True
+
+    def _load(self, name):
+        # expects the lock of the translator to be held
+        start = time.time()
+        # taken before setup(), the files may be replaced while it reads them
+        self.versions[name] = tuple(file_version(f) for f in self.model_files(name))
+        self.modules[name].setup()
+        self.load_times[name] = time.time() - start
+        self.last_used[name] = time.time()
+        self.loaded.add(name)
+        self.record(name, "load", self.load_times[name])
+
+    def ensure_loaded(self, name):
+        """
+            Call setup() of the translator unless it is already loaded
+        """
+        if name in self.loaded:
+            return
+
+        self.ensure_prepared()
+        with self.locks[name]:
+            # another thread may have finished the setup while waiting for the lock
+            if name not in self.loaded:
+                self._load(name)
+
+    def load_all(self):
+        """
+            Set up all translators concurrently, which takes about as long as the slowest one
+            as most of the time is spent reading and deserializing files
+        """
+        self.ensure_monitor()
+        if not self.names:
+            return
+        self.ensure_prepared()
+
+        start = time.time()
+        workers = self.load_workers or len(self.names)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="translator-setup") as pool:
+            futures = [pool.submit(self.ensure_loaded, name) for name in self.names]
+        # raise the first error only after all other translators are done
+        for future in futures:
+            future.result()
+        logger.info("Loaded %d translators in %.1fs", len(self.names), time.time() - start)
+
+    def acquire(self, name):
+        """
+            Mark the translator as in use, loading it if necessary. It is not unloaded before release() is called.
+        """
+        self.ensure_monitor()
+        self.ensure_prepared()
+        with self.locks[name]:
+            if name not in self.loaded:
+                self._load(name)
+            self.in_flight[name] += 1
+            self.last_used[name] = time.time()
+
+    def release(self, name):
+        with self.locks[name]:
+            self.in_flight[name] -= 1
+            self.last_used[name] = time.time()
+
+    # ------------ Unloading -----------------
+    def unload(self, name, reason="manual"):
+        """
+            Call teardown() of the translator if it is loaded and currently not in use
+
+            Returns:
+                True if the translator was unloaded
+        """
+        if not self.is_evictable(name):
+            return False
+
+        with self.locks[name]:
+            if name not in self.loaded or self.in_flight[name] > 0:
+                return False
+            start = time.time()
+            self.modules[name].teardown()
+            self.loaded.discard(name)
+        release_free_memory()
+        self.record(name, "unload", time.time() - start, reason=reason)
+        return True
+
+    def evict(self):
+        """
+            Unload the translators that are idle for too long and, if the process uses too much memory,
+            the least recently used ones
+        """
+        now = time.time()
+        if self.idle_timeout is not None:
+            for name in list(self.loaded):
+                last_used = self.last_used[name]
+                if last_used is None or now - last_used >= self.idle_timeout:
+                    self.unload(name, reason="idle")
+
+        if self.memory_limit_mb is not None:
+            candidates = sorted((n for n in self.loaded if self.is_evictable(n)),
+                                key=lambda n: self.last_used[n] or 0)
+            for name in candidates:
+                rss = current_rss_mb()
+                if rss is None or rss <= self.memory_limit_mb:
+                    break
+                self.unload(name, reason="memory pressure")
+
+    def ensure_monitor(self):
+        """
+            Start the thread that periodically unloads translators, unless eviction is disabled.
+            Threads do not survive a fork, so this is checked at every use (e.g. in each uWSGI worker).
+        """
+        if self.idle_timeout is None and self.memory_limit_mb is None:
+            return
+        if self.monitor is not None and self.monitor.is_alive():
+            return
+        with self.monitor_lock:
+            if self.monitor is None or not self.monitor.is_alive():
+                self.monitor = threading.Thread(target=self.monitor_loop, name="translator-eviction", daemon=True)
+                self.monitor.start()
+
+    def monitor_loop(self):
+        while True:
+            time.sleep(self.check_interval)
+            try:
+                self.evict()
+            except Exception:
+                logger.exception("Unloading translators failed")
+
+    # ------------ Reporting -----------------
+    def record(self, name, event, duration, reason=None):
+        rss = current_rss_mb()
+        self.counts[name][event] += 1
+        self.events.append({
+            "time": time.time(),
+            "translator": name,
+            "event": event,
+            "reason": reason,
+            "duration": round(duration, 3),
+            "rss_mb": None if rss is None else round(rss),
+        })
+        logger.info("%s translator %s in %.1fs%s, process rss: %s MB", event.capitalize() + "ed", name, duration,
+                    " ({})".format(reason) if reason else "", "?" if rss is None else round(rss))
+
+    def status(self):
+        """
+            Returns the residency of every translator and the recent load and unload events
+        """
+        rss = current_rss_mb()
+        translators = dict()
+        for name in self.names:
+            translators[name] = {
+                "loaded": name in self.loaded,
+                "evictable": self.is_evictable(name),
+                "in_flight": self.in_flight[name],
+                "last_used": self.last_used[name],
+                "last_load_duration": self.load_times.get(name),
+                "loads": self.counts[name]["load"],
+                "unloads": self.counts[name]["unload"],
+            }
+        return {
+            "rss_mb": None if rss is None else round(rss),
+            "idle_timeout": self.idle_timeout,
+            "memory_limit_mb": self.memory_limit_mb,
+            "translators": translators,
+            "events": list(self.events),
+        }
@@ -1,83 +1,209 @@
 import json
 import os
 import sys
-import numpy as np
-import importlib
+import threading
+import warnings
+from collections.abc import Mapping
 from pathlib import Path
-from api.analysis import translators, schemas
-from api.paths import GLOVE_FILE, DB_SCHEMAS_FILE, PROJECT_ROOT
 
-import nltk
-nltk.download('punkt')
-nltk.download('wordnet')
-nltk.download('averaged_perceptron_tagger')
+from django.core.exceptions import ImproperlyConfigured
 
+from api.analysis import translators, schemas
+from api.paths import GLOVE_FILE, GLOVE_STORE_DIR, GLOVE_PRUNED_STORE_DIR, DB_SCHEMAS_FILE, PROJECT_ROOT
+from api.model_server import ModelClient, RemoteTranslatorRegistry
+from api.registry import TranslatorRegistry
 
 
-# load the glove file
-THRESHOLD = 500000
-# source: https://github.com/microsoft/IRNet
-def load_word_emb(file_name, use_small=False):
-    print('Loading word embedding from %s' % file_name)
-    ret = {}
-    with open(file_name) as inf:
-        for idx, line in enumerate(inf):
-            if use_small and idx >= THRESHOLD:
-                break
-            info = line.strip().split(' ')
-            if info[0].lower() not in ret:
-                ret[info[0]] = np.array(list(map(lambda x: float(x), info[1:])))
-    return ret
+def get_setting(name, default):
+    """
+        Returns the django setting name, or default if it is not set or there are no settings (e.g. in build scripts)
+    """
+    from django.conf import settings
 
-glove_embeddings = load_word_emb(GLOVE_FILE, use_small=True)
+    try:
+        return getattr(settings, name, default)
+    except ImproperlyConfigured:
+        return default
 
 
-# concatenate all schema files to one file
-tables = []
+# load the glove file
+def load_word_emb(file_name, store_dir, use_small=False, pruned_store_dir=None):
+    """
+        Open the binary store of the glove file.
+        A pruned store (see build_glove.py) is preferred as long as it matches the current vocabulary,
+        the tokens it does not hold are looked up in the full store.
+        The text file is converted once into the full store, i.e. if there is no store yet or the text file changed since.
+    """
+    from api.embeddings import FallbackStore, GloveStore, THRESHOLD, convert_glove, is_store_current
+
+    limit = THRESHOLD if use_small else None
+    if pruned_store_dir is not None and Path(pruned_store_dir).exists():
+        if is_store_current(pruned_store_dir, file_name, limit=limit):
+            print('Loading pruned word embedding from %s' % pruned_store_dir)
+            pruned_store = GloveStore(pruned_store_dir)
+            if not is_store_current(store_dir, file_name, limit=limit):
+                if not Path(file_name).exists():
+                    warnings.warn("There is no current word embedding in {} and {} is missing, the tokens that are "
+                                  "not in the pruned one are unknown".format(store_dir, file_name))
+                    return pruned_store
+                # the other worker processes wait for the first one to convert it
+                convert_glove(file_name, store_dir, limit=limit, if_outdated=True)
+            # only the pages of the rare tokens that are actually looked up are loaded from the full store
+            return FallbackStore(pruned_store, GloveStore(store_dir))
+        warnings.warn("The pruned word embedding in {} is outdated, using the full one instead. "
+                      "Run build_glove.py --prune to update it.".format(pruned_store_dir))
+
+    if not is_store_current(store_dir, file_name, limit=limit):
+        # the other worker processes wait for the first one to convert it
+        convert_glove(file_name, store_dir, limit=limit, if_outdated=True)
+
+    print('Loading word embedding from %s' % store_dir)
+    return GloveStore(store_dir)
+
+
+class LazyEmbeddings(Mapping):
+    """
+    Mapping that opens the glove store at its first access
+    """
+
+    def __init__(self, loader):
+        self.loader = loader
+        self.store = None
+        self.lock = threading.Lock()
+
+    def get_store(self):
+        if self.store is None:
+            with self.lock:
+                if self.store is None:
+                    self.store = self.loader()
+        return self.store
+
+    def __getitem__(self, token):
+        return self.get_store()[token]
+
+    def __contains__(self, token):
+        return token in self.get_store()
+
+    def __iter__(self):
+        return iter(self.get_store())
+
+    def __len__(self):
+        return len(self.get_store())
+
+
+glove_embeddings = LazyEmbeddings(
+    lambda: load_word_emb(GLOVE_FILE, GLOVE_STORE_DIR, use_small=True, pruned_store_dir=GLOVE_PRUNED_STORE_DIR))
+
+
+def write_combined_schemas():
+    # concatenate all schema files to one file
+    tables = []
+
+    for schema in schemas.values():
+        tables.append(schema)
+
+    # write the total to a file for use in read_database_schema()
+    with open(DB_SCHEMAS_FILE, 'w') as f:
+        json.dump(tables, f, indent=4)
+
+
+def prepare_translators():
+    """
+        Everything the translators need before any of them can be set up
+    """
+    import nltk
+    nltk.download('punkt')
+    nltk.download('wordnet')
+    nltk.download('averaged_perceptron_tagger')
+
+    write_combined_schemas()
+
+
+# sys.stdout is global, so it is only replaced by the first and restored by the last of concurrent callers
+_stdout_lock = threading.Lock()
+_stdout_depth = 0
+_saved_stdout = None
+
+
+def _silence_stdout():
+    global _stdout_depth, _saved_stdout
+    with _stdout_lock:
+        if _stdout_depth == 0:
+            _saved_stdout = sys.stdout
+            sys.stdout = open(os.devnull, 'w')
+        _stdout_depth += 1
 
-for schema in schemas.values():
-    tables.append(schema)
 
-# write the total to a file for use in read_database_schema()
-with open(DB_SCHEMAS_FILE, 'w') as f:
-    json.dump(tables, f, indent=4)
+def _restore_stdout():
+    global _stdout_depth, _saved_stdout
+    with _stdout_lock:
+        _stdout_depth -= 1
+        if _stdout_depth == 0:
+            sys.stdout.close()
+            sys.stdout = _saved_stdout
+            _saved_stdout = None
 
 
 # decorator used to send translator stdout to void
 def no_stdout(func):
     def wrapper(*args, **kwargs):
-        stdout = sys.stdout
-        f = open(os.devnull, 'w')
-        sys.stdout = f
-
-        value = func(*args, **kwargs)
-
-        sys.stdout = stdout
-
-        return value
+        _silence_stdout()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _restore_stdout()
 
     return wrapper
 
 
-# for each adapter:
-# dynamically access the functions defined in interface.py
-# to call setup() once and
-#    store the reference to translate() in a dict
-adapters_dict = {}
-int_translators = []
-
-for translator in translators:
-    # access the specific module
-    path = "api.adapters.{}.interface".format(translator)
-    module = importlib.import_module(path)
-
-    # single call to setup()
-    module.setup()
-
-    # store reference to translate() for later use by view.py
-    adapters_dict[translator] = dict()
-    adapters_dict[translator]["translate"] = module.translate
-    if hasattr(module, "translate_interaction"):
-        adapters_dict[translator]["interaction"] = module.translate_interaction
-        int_translators.append(translator)
-
+# translators served by this instance, see ENABLED_TRANSLATORS in the settings
+enabled_translators = get_setting("ENABLED_TRANSLATORS", None)
+if enabled_translators is None:
+    enabled_translators = list(translators)
+else:
+    unknown = [t for t in enabled_translators if t not in translators]
+    if unknown:
+        raise ImproperlyConfigured("ENABLED_TRANSLATORS contains unknown translators: {}".format(unknown))
+if not enabled_translators:
+    raise ImproperlyConfigured("No translator is enabled, set ENABLED_TRANSLATORS to at least one of {} "
+                               "or to None".format(list(translators)))
+
+
+def create_translator_registry():
+    """
+        Returns a TranslatorRegistry that sets up the enabled translators in this process
+    """
+    # for each adapter:
+    # dynamically access the functions defined in interface.py
+    # and store references that call setup() once, at the first use
+    #    (and again after the translator was unloaded, see TRANSLATOR_IDLE_TIMEOUT)
+    return TranslatorRegistry(enabled_translators, prepare=prepare_translators,
+                              idle_timeout=get_setting("TRANSLATOR_IDLE_TIMEOUT", None),
+                              memory_limit_mb=get_setting("TRANSLATOR_MEMORY_LIMIT_MB", None),
+                              check_interval=get_setting("TRANSLATOR_CHECK_INTERVAL", 60),
+                              load_workers=get_setting("TRANSLATOR_LOAD_WORKERS", None))
+
+
+def model_server_authkey():
+    return get_setting("MODEL_SERVER_AUTHKEY", None) or get_setting("SECRET_KEY", "").encode('utf-8')
+
+
+# with a model server (see MODEL_SERVER_ADDRESS in the settings) the translators are called in the server
+model_server_address = get_setting("MODEL_SERVER_ADDRESS", None)
+if model_server_address is None:
+    translator_registry = create_translator_registry()
+else:
+    translator_registry = RemoteTranslatorRegistry(enabled_translators,
+                                                   ModelClient(model_server_address, model_server_authkey(),
+                                                               timeout=get_setting("MODEL_SERVER_TIMEOUT", 300)),
+                                                   version_ttl=get_setting("MODEL_SERVER_VERSION_TTL", 10))
+adapters_dict = translator_registry.adapters_dict
+int_translators = translator_registry.int_translators
+
+
+def load_eager_translators():
+    """
+        Set up all enabled translators right away if EAGER_TRANSLATOR_LOADING is set
+    """
+    if get_setting("EAGER_TRANSLATOR_LOADING", False):
+        translator_registry.load_all()
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import pickle
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from api.analysis import schema_files
+from api.atomic_dir import new_directory, store_lock
+from api.embeddings import META_FILENAME as STORE_META_FILENAME, source_signature
+from api.paths import SCHEMAS_DIR, GLOVE_STORE_DIR, GLOVE_PRUNED_STORE_DIR, SNAPSHOT_DIR
+
+# file names inside a snapshot directory
+META_FILENAME = "meta.json"
+OBJECTS_FILENAME = "objects.pkl"
+ARRAYS_DIRNAME = "arrays"
+
+# increase whenever the layout of a snapshot changes
+SNAPSHOT_FORMAT_VERSION = 1
+
+# state of the snapshot that is currently restored by this thread, for patched translator functions
+restore_state = threading.local()
+
+
+def default_inputs():
+    """
+        Files every snapshot depends on: the schemas and the glove stores
+    """
+    inputs = [Path(SCHEMAS_DIR) / (name + ".json") for name in sorted(schema_files)]
+    inputs += [Path(GLOVE_STORE_DIR) / STORE_META_FILENAME, Path(GLOVE_PRUNED_STORE_DIR) / STORE_META_FILENAME]
+    return inputs
+
+
+def fingerprint(inputs, extra=None):
+    """
+        Hash over the signatures of the input files (missing files included), the snapshot format and extra
+
+        Args:
+            inputs: list of files the snapshot is derived from
+            extra: optional json serializable data the snapshot depends on, e.g. the parsed arguments
+    """
+    content = {
+        "format": SNAPSHOT_FORMAT_VERSION,
+        "inputs": {str(f): source_signature(f) if Path(f).exists() else None for f in inputs},
+        "extra": extra,
+    }
+    encoded = json.dumps(content, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def state_dict_to_arrays(state_dict, prefix=""):
+    return {prefix + key: tensor.detach().cpu().numpy() for key, tensor in state_dict.items()}
+
+
+def arrays_to_state_dict(arrays, prefix=""):
+    import torch
+
+    return {key[len(prefix):]: torch.from_numpy(array) for key, array in arrays.items() if key.startswith(prefix)}
+
+
+def assign_state_dict(module, state_dict):
+    """
+        Replace the parameters and buffers of module by the tensors of state_dict instead of copying the values
+        like load_state_dict() does, so that tensors of memory-mapped arrays stay shared between the processes.
+        Tensors on another device or with another dtype than the module are still converted.
+
+        Args:
+            module: the torch module
+            state_dict: dict from the name of each parameter and buffer of module to its tensor
+    """
+    own = dict()
+    for module_name, submodule in module.named_modules():
+        prefix = module_name + "." if module_name else ""
+        for name, tensor in list(submodule._parameters.items()) + list(submodule._buffers.items()):
+            if tensor is not None:
+                own[prefix + name] = tensor
+    if set(own) != set(state_dict):
+        raise RuntimeError("State dict does not match the module, missing keys: {}, unexpected keys: {}".format(
+            sorted(set(own) - set(state_dict)), sorted(set(state_dict) - set(own))))
+
+    for name, tensor in own.items():
+        value = state_dict[name]
+        if value.shape != tensor.shape:
+            raise RuntimeError("Size mismatch for {}: {} in the state dict, {} in the module".format(
+                name, tuple(value.shape), tuple(tensor.shape)))
+        tensor.data = value.to(device=tensor.device, dtype=tensor.dtype)
+
+
+class Snapshot:
+    """
+    Ready-to-serve state of a translator, i.e. numpy arrays and picklable objects
+
+    The arrays are stored as one .npy file each and restored as copy-on-write memory maps,
+    so that only the pages that are actually read are loaded and processes share them until they are written.
+    A snapshot is outdated as soon as the fingerprint of its inputs changes.
+    """
+
+    def __init__(self, directory, inputs, extra=None):
+        """
+        Args:
+            directory: directory of the snapshot
+            inputs: files the state is derived from, e.g. checkpoints (default_inputs() are added)
+            extra: optional json serializable data the state depends on
+        """
+        self.directory = Path(directory)
+        self.fingerprint = fingerprint(list(inputs) + default_inputs(), extra)
+
+    def read_meta(self):
+        meta_file = self.directory / META_FILENAME
+        if not meta_file.exists():
+            return None
+        with open(str(meta_file)) as f:
+            return json.load(f)
+
+    def is_current(self):
+        meta = self.read_meta()
+        return meta is not None and meta.get("fingerprint") == self.fingerprint
+
+    def save(self, arrays, objects=None):
+        """
+            Write the snapshot, replacing an existing one
+
+            Args:
+                arrays: dict from name to numpy array
+                objects: picklable object
+        """
+        # processes that set up the same translator at once write one after the other, each into a new directory,
+        # so that an interrupted write never leaves a valid looking snapshot
+        with store_lock(self.directory):
+            if self.is_current():
+                return
+            with new_directory(self.directory) as directory:
+                (directory / ARRAYS_DIRNAME).mkdir()
+
+                names = sorted(arrays)
+                for i, name in enumerate(names):
+                    np.save(str(directory / ARRAYS_DIRNAME / "{}.npy".format(i)), np.ascontiguousarray(arrays[name]))
+
+                with open(str(directory / OBJECTS_FILENAME), 'wb') as f:
+                    pickle.dump(objects, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+                with open(str(directory / META_FILENAME), 'w') as f:
+                    json.dump({"fingerprint": self.fingerprint, "arrays": names}, f, indent=4)
+
+    def load(self):
+        """
+            Returns:
+                the arrays as dict from name to memory-mapped array and the objects
+        """
+        meta = self.read_meta()
+        arrays = dict()
+        for i, name in enumerate(meta["arrays"]):
+            arrays[name] = np.load(str(self.directory / ARRAYS_DIRNAME / "{}.npy".format(i)), mmap_mode='c')
+
+        with open(str(self.directory / OBJECTS_FILENAME), 'rb') as f:
+            objects = pickle.load(f)
+
+        return arrays, objects
+
+
+def open_snapshot(name, inputs, extra=None):
+    """
+        Returns the snapshot of the translator with the given name or None if snapshots are disabled,
+        see TRANSLATOR_SNAPSHOTS in the settings
+    """
+    from api.setup_util import get_setting
+
+    if not get_setting("TRANSLATOR_SNAPSHOTS", True):
+        return None
+    return Snapshot(Path(SNAPSHOT_DIR) / name, inputs, extra)
@@ -0,0 +1,93 @@
+import re
+import warnings
+
+from django.core.exceptions import ImproperlyConfigured
+
+from api.setup_util import get_setting, translator_registry
+from api.translation_cache import TranslationCache, normalize_question, schema_version, model_version
+
+
+def value_pattern(value):
+    # the value as a separate word of the sql
+    return re.compile(r"(?<![\w.])" + re.escape(value) + r"(?![\w.])")
+
+
+def to_skeleton(sql, values):
+    """
+        Replace the values of a question in its sql by their placeholders
+
+        Args:
+            sql: the translation of the question
+            values: dict from placeholder to value, as returned by the question_template() function of a translator
+
+        Returns:
+            the sql skeleton or None unless every value occurs exactly once in the sql and differs from the others:
+            a value that is missing from the sql (e.g. the translator ignored it) or repeated cannot be filled in
+            for the values of another question
+    """
+    if len(set(values.values())) < len(values):
+        return None
+    skeleton = sql
+    for placeholder, value in values.items():
+        pattern = value_pattern(value)
+        if len(pattern.findall(skeleton)) != 1:
+            return None
+        skeleton = pattern.sub(lambda match: placeholder, skeleton)
+    return skeleton
+
+
+def fill_skeleton(skeleton, values):
+    """
+        Returns the sql skeleton with the placeholders replaced by the values of another question with the same template
+    """
+    for placeholder, value in values.items():
+        skeleton = re.sub(r"\b" + placeholder + r"\b", lambda match: value, skeleton)
+    return skeleton
+
+
+class QuestionTemplate:
+    """
+    Value-anonymized template of a question, whose sql skeleton is cached for all questions with the same template
+    """
+
+    def __init__(self, nl_question, db_schema, translator, template_function):
+        self.template, self.values = template_function(normalize_question(nl_question), db_schema)
+        self.key = translator, db_schema, self.template, schema_version(db_schema), model_version(translator)
+
+    def lookup(self):
+        """
+            Returns the sql of the question built from the cached skeleton or None
+        """
+        skeleton = template_cache.get(self.key)
+        if skeleton is None:
+            return None
+        return fill_skeleton(skeleton, self.values)
+
+    def store(self, sql):
+        skeleton = to_skeleton(sql, self.values)
+        if skeleton is not None:
+            template_cache.put(self.key, skeleton)
+
+
+def question_template(nl_question, db_schema, translator):
+    """
+        Returns the QuestionTemplate of the question or None if the translator does not use the template cache
+    """
+    if translator not in template_translators or not template_cache.enabled:
+        return None
+    return QuestionTemplate(nl_question, db_schema, translator,
+                            translator_registry.template_function(translator))
+
+
+# translators whose translations are cached per template, see TEMPLATE_CACHE_TRANSLATORS in the settings
+template_translators = [t for t in get_setting("TEMPLATE_CACHE_TRANSLATORS", []) if t in translator_registry.names]
+unsupported = [t for t in template_translators if translator_registry.template_function(t) is None]
+if unsupported:
+    raise ImproperlyConfigured("TEMPLATE_CACHE_TRANSLATORS contains translators without question_template(): {}"
+                               .format(unsupported))
+if template_translators:
+    warnings.warn("The template cache is experimental: the SQL it builds for {} is not checked against a translation "
+                  "of the question, see validate_template_cache.py".format(template_translators))
+
+template_cache = TranslationCache(max_size=get_setting("TEMPLATE_CACHE_SIZE", 1024),
+                                  ttl=get_setting("TRANSLATION_CACHE_TTL", 24 * 60 * 60))
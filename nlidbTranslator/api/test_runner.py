@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Runs the tests with the shared translation cache in memory, so that they neither read nor write
+    the translations cached by the server (and of earlier test runs)
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        caches = dict(settings.CACHES)
+        caches['translations'] = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                  'LOCATION': 'test-translations'}
+        self.caches = override_settings(CACHES=caches)
+        self.caches.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.caches.disable()
+        super().teardown_test_environment(**kwargs)
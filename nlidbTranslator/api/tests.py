@@ -1,4 +1,14 @@
+import importlib.util
+import json
+import multiprocessing
+import os
+import tempfile
+from pathlib import Path
+from unittest import skipUnless
+
+import numpy as np
 from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
 from rest_framework import status
 from rest_framework.test import APITestCase, APIRequestFactory, APIClient
 from rest_framework.test import force_authenticate
@@ -137,6 +147,770 @@ class TranslatorsListTestCase(APITestCase):
         response = self.client.get("/translators")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+class TranslatorStatusTestCase(APITestCase):
+    def test_get_translator_status(self):
+        response_before_authentication = self.client.get("/translators/status")
+        self.assertEqual(response_before_authentication.status_code, status.HTTP_401_UNAUTHORIZED)
+        user = User.objects.create_user(username='testUser', is_staff=True)
+        self.client.force_authenticate(user=user)
+        response = self.client.get("/translators/status")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("translators", response.data)
+        self.assertIn("events", response.data)
+
+class TranslationCacheTestCase(SimpleTestCase):
+    def test_least_recently_used_entry_is_evicted(self):
+        from api.translation_cache import TranslationCache
+
+        cache = TranslationCache(max_size=2)
+        cache.put("a", "SELECT 1")
+        cache.put("b", "SELECT 2")
+        self.assertEqual(cache.get("a"), "SELECT 1")
+        cache.put("c", "SELECT 3")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), "SELECT 3")
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["evictions"]), (2, 1, 1))
+
+    def test_entries_expire(self):
+        import time
+        from api.translation_cache import TranslationCache
+
+        cache = TranslationCache(max_size=2, ttl=0.05)
+        cache.put("a", "SELECT 1")
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["expirations"], 1)
+
+    def test_key_follows_the_loaded_schema_file(self):
+        from api import translation_cache
+        from api.analysis import read_schema_file
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            schema_file = Path(tmp_dir) / "schema.json"
+            schema_file.write_text('[{"db_id": "cache_test_db"}]')
+            _, version = read_schema_file(str(schema_file))
+            translation_cache.schema_versions["cache_test_db"] = version
+            try:
+                key = translation_cache.translation_key("How many  singers?", "cache_test_db", "IRNet")
+                self.assertEqual(key, translation_cache.translation_key(" How many singers? ", "cache_test_db", "IRNet"))
+                # the process still translates with the schema it loaded, until the file is loaded again
+                schema_file.write_text('[{"db_id": "cache_test_db", "table_names": []}]')
+                self.assertEqual(key, translation_cache.translation_key("How many singers?", "cache_test_db", "IRNet"))
+                schemas, version = read_schema_file(str(schema_file))
+                self.assertEqual(schemas, {"cache_test_db": {"db_id": "cache_test_db", "table_names": []}})
+                translation_cache.schema_versions["cache_test_db"] = version
+                self.assertNotEqual(key, translation_cache.translation_key("How many singers?", "cache_test_db", "IRNet"))
+            finally:
+                del translation_cache.schema_versions["cache_test_db"]
+
+
+LOCAL_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'translations': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'translations'},
+}
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class SharedTranslationCacheTestCase(APITestCase):
+    def tearDown(self):
+        from api.translation_cache import clear_translation_caches
+
+        clear_translation_caches()
+
+    def test_shared_translation_fills_process_cache(self):
+        from api.translation_cache import cache_translation, cached_translation, translation_cache, \
+            shared_translation_cache
+
+        key = ("IRNet", "concert_singer", "How many singers do we have?", None, ())
+        cache_translation(key, "SELECT count(*) FROM singer")
+        # another process only finds it in the shared cache
+        translation_cache.clear()
+        self.assertEqual(cached_translation(key), "SELECT count(*) FROM singer")
+        self.assertEqual(translation_cache.get(key), "SELECT count(*) FROM singer")
+        self.assertEqual(shared_translation_cache.stats()["hits"], 1)
+
+    def test_warm_up_from_translation_log(self):
+        from api.models import Translation
+        from api.setup_util import enabled_translators
+        from api.translation_cache import warm_translation_cache, shared_translation_cache, translation_key, \
+            translation_version
+
+        translator = enabled_translators[0]
+        version = translation_version("concert_singer", translator)
+        for question in ["How many singers do we have?"] * 3 + ["What is the name of the youngest singer?"]:
+            Translation.objects.create(nl_question=question, sql_statement="SELECT 1",
+                                       db_schema="concert_singer", translator=translator, version=version)
+        # translated by a previous model, however old the model files are
+        Translation.objects.create(nl_question="How many concerts are there?", sql_statement="SELECT 2",
+                                   db_schema="concert_singer", translator=translator, version="previous")
+
+        self.assertEqual(warm_translation_cache(limit=1), 1)
+        key = translation_key("How many singers do we have?", "concert_singer", translator)
+        self.assertEqual(shared_translation_cache.get(key), "SELECT 1")
+        # already cached
+        self.assertEqual(warm_translation_cache(limit=3), 1)
+        key = translation_key("How many concerts are there?", "concert_singer", translator)
+        self.assertIsNone(shared_translation_cache.get(key))
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class StoreTranslationTestCase(APITestCase):
+    def setUp(self):
+        from api.setup_util import adapters_dict
+
+        self.calls = []
+
+        def translate(nl_question, db_id):
+            self.calls.append(nl_question)
+            return "select count(*) from singer"
+
+        def interaction(nl_question, db_id, prev_questions, prev_predictions):
+            self.calls.append(nl_question)
+            return "select count(*) from singer"
+
+        adapters_dict["store_test"] = {"translate": translate, "interaction": interaction}
+
+    def tearDown(self):
+        from api.setup_util import adapters_dict
+        from api.translation_cache import clear_translation_caches
+
+        del adapters_dict["store_test"]
+        clear_translation_caches()
+
+    def test_flight_leader_uses_translation_cached_meanwhile(self):
+        from api.process_request import translate_question
+        from api.translation_cache import cache_translation, translation_key
+
+        # another flight cached the translation after this request missed the cache
+        key = translation_key("How many singers do we have?", "concert_singer", "store_test")
+        cache_translation(key, "SELECT 1")
+        self.assertEqual(translate_question("How many singers do we have?", "concert_singer", "store_test", key, None),
+                         "SELECT 1")
+        self.assertEqual(self.calls, [])
+
+    def test_no_key_without_cache_and_single_flight(self):
+        from api import process_request
+
+        def translation_key(*args):
+            raise AssertionError("translation key computed")
+
+        original = process_request.translation_key, process_request.caching_enabled, \
+            process_request.translation_flights.enabled
+        process_request.translation_key = translation_key
+        process_request.caching_enabled = lambda: False
+        process_request.translation_flights.enabled = False
+        try:
+            data = process_request.store_translation("How many singers do we have?", "concert_singer", "store_test")
+        finally:
+            process_request.translation_key, process_request.caching_enabled, \
+                process_request.translation_flights.enabled = original
+        self.assertEqual(data["sql_statement"], "SELECT count(*) FROM singer")
+        self.assertEqual(self.calls, ["How many singers do we have?"])
+
+    def test_no_interaction_key_without_single_flight(self):
+        from api import process_request
+
+        def interaction_key(*args):
+            raise AssertionError("interaction key computed")
+
+        original = process_request.interaction_key, process_request.translation_flights.enabled
+        process_request.interaction_key = interaction_key
+        process_request.translation_flights.enabled = False
+        try:
+            data = process_request.store_interaction(1, [], "How many singers do we have?", "concert_singer",
+                                                     "store_test", "http://testserver/interaction/1")
+        finally:
+            process_request.interaction_key, process_request.translation_flights.enabled = original
+        self.assertEqual(data["sql_statement"], "SELECT count(*) FROM singer")
+        self.assertEqual(self.calls, ["How many singers do we have?"])
+
+
+class SingleFlightTestCase(SimpleTestCase):
+    def test_concurrent_calls_share_one_result(self):
+        import threading
+        import time
+        from api.translation_cache import SingleFlight
+
+        flights = SingleFlight()
+        calls = []
+
+        def translate():
+            calls.append(1)
+            time.sleep(0.2)
+            return "SELECT count(*) FROM singer"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flights.do("key", translate))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["SELECT count(*) FROM singer"] * 5)
+        self.assertEqual(flights.stats(), {"in_flight": 0, "coalesced": 4})
+        # later calls run again
+        flights.do("key", translate)
+        self.assertEqual(len(calls), 2)
+
+    def test_error_is_raised_in_waiting_calls(self):
+        import threading
+        import time
+        from api.translation_cache import SingleFlight
+
+        flights = SingleFlight()
+
+        def fail():
+            time.sleep(0.2)
+            raise ValueError("translation failed")
+
+        errors = []
+
+        def call():
+            try:
+                flights.do("key", fail)
+            except ValueError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(errors), 3)
+
+
+class MicroBatcherTestCase(SimpleTestCase):
+    def test_concurrent_requests_are_batched_per_group(self):
+        import threading
+        from api.batching import MicroBatcher
+
+        batches = []
+
+        def translate_batch(requests):
+            batches.append(requests)
+            return ["SELECT {}".format(question) if question != "fail" else ValueError(question)
+                    for question, db_id in requests]
+
+        batcher = MicroBatcher(translate_batch, max_size=8, max_wait=0.2, group_key=lambda request: request[1])
+        requests = [("q{}".format(i), "db{}".format(i % 2)) for i in range(6)] + [("fail", "db0")]
+        results = dict()
+
+        def submit(request):
+            try:
+                results[request] = batcher.submit(request)
+            except ValueError as e:
+                results[request] = e
+
+        threads = [threading.Thread(target=submit, args=(request,)) for request in requests]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        batcher.stop()
+
+        for question, db_id in requests[:-1]:
+            self.assertEqual(results[(question, db_id)], "SELECT " + question)
+        self.assertIsInstance(results[("fail", "db0")], ValueError)
+        # each call of the batch function gets the requests of one database
+        self.assertTrue(all(len({db_id for _, db_id in batch}) == 1 for batch in batches))
+        self.assertLess(len(batches), len(requests))
+
+    def test_max_size(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from api.batching import MicroBatcher
+
+        batcher = MicroBatcher(lambda requests: requests, max_size=2, max_wait=0.1)
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            self.assertEqual(list(pool.map(batcher.submit, range(5))), list(range(5)))
+        batcher.stop()
+        self.assertGreaterEqual(batcher.stats()["batches"], 3)
+
+
+class TemplateCacheTestCase(SimpleTestCase):
+    def test_anonymize_question(self):
+        from adapters.editsql.templates import anonymize_question
+
+        self.assertEqual(anonymize_question("Which cars have more than 4 cylinders ?"),
+                         ("Which cars have more than NUMBER0 cylinders ?", {"NUMBER0": "4"}))
+        self.assertEqual(anonymize_question("Find documents named `` Data base `` with 2 or 2 paragraphs ."),
+                         ("Find documents named `` STRING0 `` with NUMBER0 or NUMBER0 paragraphs .",
+                          {"STRING0": "Data base", "NUMBER0": "2"}))
+        self.assertEqual(anonymize_question("What is the student's 2nd grade ?"), ("What is the student's 2nd grade ?", {}))
+
+    def test_skeleton_is_filled_with_other_values(self):
+        from api.template_cache import to_skeleton, fill_skeleton
+
+        skeleton = to_skeleton("SELECT count(*) FROM cars WHERE cylinders > 4", {"NUMBER0": "4"})
+        self.assertEqual(skeleton, "SELECT count(*) FROM cars WHERE cylinders > NUMBER0")
+        self.assertEqual(fill_skeleton(skeleton, {"NUMBER0": "6"}), "SELECT count(*) FROM cars WHERE cylinders > 6")
+        # the value occurs twice, so it is unclear which occurrence belongs to the question
+        self.assertIsNone(to_skeleton("SELECT name FROM cars WHERE cylinders > 4 LIMIT 4", {"NUMBER0": "4"}))
+        # the value is missing from the sql, so the sql of another value would be the same
+        self.assertIsNone(to_skeleton("SELECT count(*) FROM cars WHERE cylinders > value", {"NUMBER0": "4"}))
+        self.assertIsNone(to_skeleton("SELECT count(*) FROM cars WHERE cylinders > 4",
+                                      {"NUMBER0": "4", "STRING0": "ford"}))
+
+    def test_question_template(self):
+        from adapters.editsql.templates import anonymize_question
+        from api.template_cache import QuestionTemplate, template_cache
+
+        def template_function(nl_question, db_id):
+            return anonymize_question(nl_question)
+
+        try:
+            QuestionTemplate("cars with more than 4 cylinders", "car_1", "IRNet", template_function).store(
+                "SELECT * FROM cars_data WHERE cylinders > 4")
+            template = QuestionTemplate("cars with more than  6 cylinders", "car_1", "IRNet", template_function)
+            self.assertEqual(template.lookup(), "SELECT * FROM cars_data WHERE cylinders > 6")
+            self.assertIsNone(QuestionTemplate("cars with more than 6 cylinders", "concert_singer", "IRNet",
+                                               template_function).lookup())
+        finally:
+            template_cache.clear()
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class TranslateBatchTestCase(APITestCase):
+    def setUp(self):
+        from api.setup_util import adapters_dict
+
+        self.batches = []
+
+        def translate_batch(requests):
+            self.batches.append(requests)
+            return [ValueError("no translation") if nl_question == "fail" else "select count(*) from singer"
+                    for nl_question, db_id in requests]
+
+        adapters_dict["batch_test"] = {"translate": lambda nl_question, db_id: None, "batch": translate_batch}
+
+    def tearDown(self):
+        from api.setup_util import adapters_dict
+        from api.translation_cache import clear_translation_caches
+
+        del adapters_dict["batch_test"]
+        clear_translation_caches()
+
+    def test_translate_batch(self):
+        from api.models import Translation
+
+        items = [{"nl_question": question, "db_schema": "concert_singer", "translator": "batch_test"}
+                 for question in ["How many singers do we have?", "fail", "What is the total number of singers?"]]
+        response = self.client.post("/translate/batch", items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+
+        results = {line["index"]: line for line in lines}
+        self.assertEqual(sorted(results), [0, 1, 2])
+        self.assertEqual(results[0]["sql_statement"], "SELECT count(*) FROM singer")
+        self.assertIn("error", results[1])
+        self.assertEqual(len(self.batches), 1)
+        self.assertEqual(Translation.objects.count(), 2)
+
+        # cached translations are not passed to the translator again
+        self.client.post("/translate/batch", items[:1], format='json').getvalue()
+        self.assertEqual(len(self.batches), 1)
+        self.assertEqual(Translation.objects.count(), 3)
+
+    def test_invalid_item(self):
+        items = [{"nl_question": "How many singers do we have?", "db_schema": "concert_singer"}]
+        response = self.client.post("/translate/batch", items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class TranslateBatchASGITestCase(TransactionTestCase):
+    def setUp(self):
+        from api.setup_util import adapters_dict
+        from api.translation_cache import clear_translation_caches
+
+        clear_translation_caches()
+        self.on_event_loop = []
+
+        def translate_batch(requests):
+            import asyncio
+
+            try:
+                asyncio.get_running_loop()
+                self.on_event_loop.append(True)
+            except RuntimeError:
+                self.on_event_loop.append(False)
+            return ["select count(*) from singer" for _ in requests]
+
+        adapters_dict["asgi_test"] = {"translate": lambda nl_question, db_id: None, "batch": translate_batch}
+
+    def tearDown(self):
+        from api.setup_util import adapters_dict
+
+        del adapters_dict["asgi_test"]
+
+    async def test_batch_is_translated_off_the_event_loop(self):
+        from asgiref.sync import sync_to_async
+        from asgiref.testing import ApplicationCommunicator
+        from api.async_views import StreamingASGIHandler
+        from api.models import Translation
+
+        body = json.dumps([{"nl_question": question, "db_schema": "concert_singer", "translator": "asgi_test"}
+                           for question in ["How many singers do we have?", "How many concerts are there?"]])
+        scope = {"type": "http", "method": "POST", "path": "/translate/batch", "query_string": b"",
+                 "server": ("testserver", 80),
+                 "headers": [(b"host", b"testserver"), (b"content-type", b"application/json"),
+                             (b"content-length", str(len(body)).encode())]}
+        communicator = ApplicationCommunicator(StreamingASGIHandler(), scope)
+        await communicator.send_input({"type": "http.request", "body": body.encode()})
+
+        start = await communicator.receive_output(5)
+        self.assertEqual(start["status"], status.HTTP_200_OK)
+        content = b""
+        while True:
+            message = await communicator.receive_output(5)
+            content += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+
+        lines = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual(sorted(line["index"] for line in lines), [0, 1])
+        self.assertTrue(all(line["sql_statement"] == "SELECT count(*) FROM singer" for line in lines))
+        self.assertEqual(self.on_event_loop, [False])
+        self.assertEqual(await sync_to_async(Translation.objects.filter(translator="asgi_test").count)(), 2)
+
+
+class JobTestCase(APITestCase):
+    def setUp(self):
+        from api.setup_util import adapters_dict
+
+        self.translated = []
+
+        def translate_batch(requests):
+            self.translated += [nl_question for nl_question, db_id in requests]
+            return [ValueError("no translation") if nl_question == "fail" else "select count(*) from singer"
+                    for nl_question, db_id in requests]
+
+        adapters_dict["job_test"] = {"translate": lambda nl_question, db_id: None, "batch": translate_batch}
+
+    def tearDown(self):
+        from api.setup_util import adapters_dict
+
+        del adapters_dict["job_test"]
+
+    def upload(self, questions):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        lines = "\n".join(json.dumps({"nl_question": question}) for question in questions)
+        job_file = SimpleUploadedFile("questions.jsonl", lines.encode('utf-8'))
+        return self.client.post("/jobs", {"file": job_file, "db_schema": "concert_singer", "translator": "job_test"})
+
+    def test_job(self):
+        from api.jobs import run_next_job
+
+        response = self.upload(["How many singers do we have?", "fail", "What is the total number of singers?"])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["status"], "queued")
+        url = "/jobs/{}".format(response.data["id"])
+
+        self.assertTrue(run_next_job("test worker"))
+        self.assertFalse(run_next_job("test worker"))
+
+        response = self.client.get(url)
+        self.assertEqual(response.data["status"], "done")
+        self.assertEqual((response.data["completed"], response.data["failed"]), (3, 1))
+
+        response = self.client.get(url + "/results")
+        lines = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([line["index"] for line in lines], [0, 1, 2])
+        self.assertEqual(lines[0]["sql_statement"], "SELECT count(*) FROM singer")
+        self.assertIn("error", lines[1])
+
+    def test_interrupted_job_is_resumed(self):
+        import datetime
+        from django.utils import timezone
+        from api.jobs import run_next_job
+        from api.models import Job
+
+        response = self.upload(["How many singers do we have?", "What is the total number of singers?"])
+        job = Job.objects.get(pk=response.data["id"])
+        # a worker translated the first question and stopped
+        job.items.filter(index=0).update(done=True, sql_statement="SELECT count(*) FROM singer")
+        Job.objects.filter(pk=job.pk).update(status=Job.RUNNING, worker="stopped worker",
+                                             heartbeat=timezone.now() - datetime.timedelta(hours=1))
+
+        self.assertTrue(run_next_job("test worker"))
+        self.assertEqual(self.translated, ["What is the total number of singers?"])
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.DONE)
+
+    def test_workers_are_restarted(self):
+        import threading
+        from api.jobs import JobWorkers
+
+        runs = []
+
+        class FinishingWorkers(JobWorkers):
+            # like threads that did not survive a fork
+            def run(self):
+                runs.append(threading.current_thread().name)
+
+        workers = FinishingWorkers(count=2, poll_interval=1)
+        workers.wake()
+        self.assertEqual(runs, [])
+
+        workers.start()
+        for thread in list(workers.threads):
+            thread.join()
+        workers.wake()
+        for thread in workers.threads:
+            thread.join()
+        self.assertEqual(sorted(runs), ["job-worker-0", "job-worker-0", "job-worker-1", "job-worker-1"])
+
+    def test_invalid_line(self):
+        response = self.upload(["How many singers do we have?", ""])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BatchTranslateCommandTestCase(SimpleTestCase):
+    def setUp(self):
+        from api.setup_util import adapters_dict
+
+        adapters_dict["command_test"] = {
+            "translate": lambda nl_question, db_id: None,
+            "batch": lambda requests: [ValueError("no translation") if nl_question == "fail"
+                                       else "select count(*) from singer" for nl_question, db_id in requests],
+        }
+        self.directory = tempfile.TemporaryDirectory()
+        self.input = os.path.join(self.directory.name, "questions.jsonl")
+        self.output = os.path.join(self.directory.name, "results.jsonl")
+
+    def tearDown(self):
+        from api.setup_util import adapters_dict
+
+        del adapters_dict["command_test"]
+        self.directory.cleanup()
+
+    def translate(self, questions, **options):
+        from io import StringIO
+        from django.core.management import call_command
+
+        with open(self.input, 'w') as f:
+            f.writelines(json.dumps({"nl_question": question}) + "\n" for question in questions)
+        call_command("batch_translate", self.input, self.output, translator="command_test",
+                     db_schema="concert_singer", processes=2, chunk_size=2, stdout=StringIO(), **options)
+        with open(self.output) as f:
+            return sorted((json.loads(line) for line in f), key=lambda line: line["index"])
+
+    @skipUnless("fork" in multiprocessing.get_all_start_methods(), "the fake translator is inherited by fork")
+    def test_translate(self):
+        lines = self.translate(["How many singers do we have?", "fail", "What is the total number of singers?"])
+        self.assertEqual([line["index"] for line in lines], [0, 1, 2])
+        self.assertEqual(lines[0]["sql_statement"], "SELECT count(*) FROM singer")
+        self.assertIn("error", lines[1])
+
+    @skipUnless("fork" in multiprocessing.get_all_start_methods(), "the fake translator is inherited by fork")
+    def test_resume(self):
+        # an interrupted run wrote the first result and part of another one
+        with open(self.output, 'w') as f:
+            f.write(json.dumps({"index": 0, "sql_statement": "SELECT 1"}) + "\n" + '{"index": 2, "sql')
+        lines = self.translate(["How many singers do we have?", "fail", "What is the total number of singers?"])
+        self.assertEqual([line["index"] for line in lines], [0, 1, 2])
+        self.assertEqual(lines[0]["sql_statement"], "SELECT 1")
+
+    @skipUnless("fork" in multiprocessing.get_all_start_methods(), "the fake translator is inherited by fork")
+    def test_retry_failed(self):
+        with open(self.output, 'w') as f:
+            f.write(json.dumps({"index": 0, "sql_statement": "SELECT 1"}) + "\n")
+            f.write(json.dumps({"index": 1, "error": "out of memory"}) + "\n")
+        questions = ["How many singers do we have?", "What is the total number of singers?"]
+
+        # without the option the error of the earlier run is kept
+        self.assertEqual(self.translate(questions)[1], {"index": 1, "error": "out of memory"})
+
+        lines = self.translate(questions, retry_failed=True)
+        self.assertEqual([line["index"] for line in lines], [0, 1])
+        self.assertEqual(lines[0]["sql_statement"], "SELECT 1")
+        self.assertEqual(lines[1]["sql_statement"], "SELECT count(*) FROM singer")
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class TranslationCacheStatusTestCase(APITestCase):
+    def test_get_cache_status(self):
+        response_before_authentication = self.client.get("/translate/cache")
+        self.assertEqual(response_before_authentication.status_code, status.HTTP_401_UNAUTHORIZED)
+        user = User.objects.create_user(username='testUser', is_staff=True)
+        self.client.force_authenticate(user=user)
+        response = self.client.get("/translate/cache")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("hits", response.data["process"])
+        self.assertIn("hits", response.data["shared"])
+        self.assertIn("coalesced", response.data["single_flight"])
+        response = self.client.delete("/translate/cache")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+class ModelServerTestCase(SimpleTestCase):
+    def setUp(self):
+        import threading
+        import time
+        from types import SimpleNamespace
+        from api.model_server import ModelClient, ModelServer, RemoteTranslatorRegistry
+
+        self.version_requests = 0
+
+        def translate_batch(requests):
+            return [ValueError("no translation") if nl_question == "fail" else "select count(*) from singer"
+                    for nl_question, db_id in requests]
+
+        def translate(nl_question, db_id):
+            if nl_question == "fail":
+                raise ValueError("no translation")
+            return "select count(*) from singer"
+
+        def slow_translate(nl_question, db_id):
+            time.sleep(0.5)
+            return "select 1"
+
+        registry = SimpleNamespace(adapters_dict={"server_test": {"translate": translate, "batch": translate_batch,
+                                                                  "slow": slow_translate}},
+                                   status=lambda: {"translators": {"server_test": {"loaded": True}}},
+                                   model_version=self.server_model_version)
+        self.directory = tempfile.TemporaryDirectory()
+        address = os.path.join(self.directory.name, "model_server.sock")
+        self.server = ModelServer(registry, address, b"test key", workers=2)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        while self.server.listener is None:
+            pass
+        self.client = ModelClient(address, b"test key")
+        self.registry = RemoteTranslatorRegistry([], self.client)
+
+    def tearDown(self):
+        self.server.stop()
+        self.directory.cleanup()
+
+    def server_model_version(self, name):
+        self.version_requests += 1
+        return ((10, 1),)
+
+    def test_operations(self):
+        from api.model_server import RemoteTranslatorError
+
+        translate = self.registry.operation("server_test", "translate")
+        self.assertEqual(translate("How many singers do we have?", "concert_singer"), "select count(*) from singer")
+        with self.assertRaises(RemoteTranslatorError):
+            translate("fail", "concert_singer")
+
+        results = self.registry.operation("server_test", "translate_batch")(
+            [("How many singers do we have?", "concert_singer"), ("fail", "concert_singer")])
+        self.assertEqual(results[0], "select count(*) from singer")
+        self.assertIsInstance(results[1], RemoteTranslatorError)
+
+    def test_status(self):
+        self.assertTrue(self.registry.status()["translators"]["server_test"]["loaded"])
+
+    def test_model_version(self):
+        self.assertEqual(self.registry.model_version("server_test"), ((10, 1),))
+        self.assertEqual(self.registry.model_version("server_test"), ((10, 1),))
+        # asked once, then the reported version is used
+        self.assertEqual(self.version_requests, 1)
+
+    def test_model_version_reported_with_the_translation(self):
+        self.registry.operation("server_test", "translate")("How many singers do we have?", "concert_singer")
+        self.assertEqual(self.client.model_versions["server_test"][0], ((10, 1),))
+        requests = self.version_requests
+        self.assertEqual(self.registry.model_version("server_test"), ((10, 1),))
+        self.assertEqual(self.version_requests, requests)
+
+        # asked again once the reported version is outdated or the server may have reloaded the translators
+        self.registry.version_ttl = -1
+        self.registry.model_version("server_test")
+        self.assertEqual(self.version_requests, requests + 1)
+        self.registry.version_ttl = 10
+        self.registry.status()
+        self.registry.model_version("server_test")
+        self.assertEqual(self.version_requests, requests + 2)
+
+    def test_timeout(self):
+        from api.model_server import ModelClient, ModelServerTimeout
+
+        client = ModelClient(self.client.address, b"test key", timeout=0.1)
+        with self.assertRaises(ModelServerTimeout):
+            client.call("server_test", "slow", "How many singers do we have?", "concert_singer")
+        # the late answer must not be read as the answer of the next request
+        self.assertTrue(client.connections.empty())
+        self.assertEqual(client.call("server_test", "translate", "How many singers?", "concert_singer"),
+                         "select count(*) from singer")
+        self.assertEqual(client.connections.qsize(), 1)
+
+    def test_unpicklable_request(self):
+        import pickle
+
+        self.client.call(None, "status")
+        connection = self.client.connections.queue[-1]
+        with self.assertRaises((pickle.PicklingError, AttributeError, TypeError)):
+            self.client.call("server_test", "translate", lambda: None, "concert_singer")
+        self.assertTrue(connection.closed)
+        self.assertTrue(self.client.connections.empty())
+        self.assertTrue(self.registry.status()["translators"]["server_test"]["loaded"])
+
+    def test_wrong_key(self):
+        from multiprocessing import AuthenticationError
+        from api.model_server import ModelClient
+
+        with self.assertRaises(AuthenticationError):
+            ModelClient(self.client.address, b"other key").call("server_test", "translate", "fail", "concert_singer")
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class AsyncTranslateTestCase(TransactionTestCase):
+    def setUp(self):
+        import threading
+        from api.setup_util import adapters_dict
+        from api.translation_cache import clear_translation_caches
+
+        # the stub translator has to run, not a cached translation
+        clear_translation_caches()
+
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+        def translate(nl_question, db_id):
+            self.started.set()
+            self.release.wait(10)
+            return "select count(*) from singer"
+
+        adapters_dict["async_test"] = {"translate": translate}
+
+    def tearDown(self):
+        from api.setup_util import adapters_dict
+
+        self.release.set()
+        del adapters_dict["async_test"]
+
+    def test_translate_is_async(self):
+        import asyncio
+        from django.urls import resolve
+
+        for url in ["/translate", "/interaction", "/interaction/0"]:
+            self.assertTrue(asyncio.iscoroutinefunction(resolve(url).func), url)
+
+    async def test_schemas_while_translating(self):
+        import asyncio
+        from asgiref.sync import sync_to_async
+        from django.urls import resolve
+
+        factory = APIRequestFactory()
+        request = factory.post("/translate", {"nl_question": "How many singers do we have?",
+                                              "db_schema": "concert_singer", "translator": "async_test"}, format="json")
+        translation = asyncio.ensure_future(resolve("/translate").func(request))
+        await asyncio.get_running_loop().run_in_executor(None, self.started.wait, 10)
+
+        # synchronous views run in one thread under ASGI, which the running translation does not occupy
+        response = await sync_to_async(resolve("/schemas").func, thread_sensitive=True)(factory.get("/schemas"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(translation.done())
+
+        self.release.set()
+        response = await translation
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["sql_statement"], "SELECT count(*) FROM singer")
+
+
 class SchemasTestCase(APITestCase):
     def test_get_schema_List(self):
         response = self.client.get("/schemas")
@@ -266,3 +1040,765 @@ class InteractionLogsTestCase(APITestCase):
         response_deletion = self.client.delete("/interaction/log_item/" + str(log_id))
         response_after_deletion = self.client.get("/interaction/log_item/" + str(log_id))
         self.assertEqual(response_after_deletion.status_code, status.HTTP_404_NOT_FOUND)
+
+
+def _mapped_pss_kb(pid, directory):
+    """
+        Sum of the proportional set size of all mappings of files in directory for the process pid
+    """
+    total = 0
+    in_directory = False
+    with open("/proc/{}/smaps".format(pid)) as f:
+        for line in f:
+            fields = line.split()
+            if not fields[0].endswith(":"):
+                # header line of a mapping, the path is the last field if any
+                in_directory = len(fields) >= 6 and fields[-1].startswith(str(directory))
+            elif fields[0] == "Pss:" and in_directory:
+                total += int(fields[1])
+    return total
+
+
+def _touch_glove_store(store_dir, tokens, ready, done):
+    from api.embeddings import GloveStore
+
+    store = GloveStore(store_dir)
+    checksum = 0.0
+    for token in tokens:
+        checksum += float(store[token][0])
+    ready.put(checksum)
+    done.wait()
+
+
+class GloveStoreSharingTestCase(SimpleTestCase):
+    NUM_TOKENS = 20000
+    DIMENSION = 300
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from api.embeddings import convert_glove
+
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.tokens = ["token{}".format(i) for i in range(cls.NUM_TOKENS)]
+        glove_file = Path(cls.tmp_dir.name) / "glove.txt"
+        with open(str(glove_file), 'w') as f:
+            for i, token in enumerate(cls.tokens):
+                f.write(token + " " + " ".join(str(x) for x in np.full(cls.DIMENSION, i % 7)) + "\n")
+        cls.store_dir = Path(cls.tmp_dir.name) / "store"
+        convert_glove(glove_file, cls.store_dir)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+        super().tearDownClass()
+
+    def measure_total_pss(self, num_workers):
+        context = multiprocessing.get_context("fork")
+        ready = context.Queue()
+        done = context.Event()
+        workers = [context.Process(target=_touch_glove_store, args=(self.store_dir, self.tokens, ready, done))
+                   for _ in range(num_workers)]
+        for worker in workers:
+            worker.start()
+        try:
+            for _ in workers:
+                ready.get(timeout=120)
+            return sum(_mapped_pss_kb(worker.pid, self.store_dir) for worker in workers)
+        finally:
+            done.set()
+            for worker in workers:
+                worker.join()
+
+    def test_pss_grows_sublinearly_with_workers(self):
+        if not os.path.exists("/proc/self/smaps"):
+            self.skipTest("proportional set size is only available on Linux")
+
+        single = self.measure_total_pss(1)
+        multiple = self.measure_total_pss(4)
+
+        # the store is touched completely, so a single worker maps at least the vectors
+        self.assertGreater(single, self.NUM_TOKENS * self.DIMENSION * 4 // 1024 // 2)
+        # private copies would need 4 times the memory, shared pages are split between the workers
+        self.assertLess(multiple, 1.5 * single)
+
+
+    def test_pruned_store_falls_back_to_full_store(self):
+        from api.embeddings import FallbackStore, convert_glove
+        from api.setup_util import load_word_emb
+
+        glove_file = Path(self.tmp_dir.name) / "glove.txt"
+        pruned_dir = Path(self.tmp_dir.name) / "pruned"
+        convert_glove(glove_file, pruned_dir, dtype=np.float16, vocabulary={"token9"}, keep_top=2)
+
+        store = load_word_emb(glove_file, self.store_dir, pruned_store_dir=pruned_dir)
+        self.assertIsInstance(store, FallbackStore)
+        self.assertEqual(len(store.store), 3)
+        for token in ["token1", "token9", "token10"]:
+            self.assertIn(token, store)
+            self.assertEqual(float(store[token][0]), int(token[5:]) % 7)
+        self.assertNotIn("missing", store)
+        with self.assertRaises(KeyError):
+            store["missing"]
+
+    def test_pruned_store_converts_outdated_full_store(self):
+        from api.embeddings import FallbackStore, convert_glove
+        from api.setup_util import load_word_emb
+
+        glove_file = Path(self.tmp_dir.name) / "glove.txt"
+        pruned_dir = Path(self.tmp_dir.name) / "pruned_only"
+        full_dir = Path(self.tmp_dir.name) / "not_converted"
+        convert_glove(glove_file, pruned_dir, dtype=np.float16, vocabulary={"token9"}, keep_top=2)
+
+        store = load_word_emb(glove_file, full_dir, pruned_store_dir=pruned_dir)
+        self.assertIsInstance(store, FallbackStore)
+        self.assertEqual(float(store["token10"][0]), 3)
+
+    def test_pruned_store_without_full_store(self):
+        from api.embeddings import GloveStore, convert_glove
+        from api.setup_util import load_word_emb
+
+        # the text file was removed after the pruned store was built
+        glove_file = Path(self.tmp_dir.name) / "glove.txt"
+        pruned_dir = Path(self.tmp_dir.name) / "pruned_without_full"
+        convert_glove(glove_file, pruned_dir, dtype=np.float16, vocabulary={"token9"}, keep_top=2)
+        removed_file = Path(self.tmp_dir.name) / "removed.txt"
+
+        with self.assertWarns(UserWarning):
+            store = load_word_emb(removed_file, Path(self.tmp_dir.name) / "no_store", pruned_store_dir=pruned_dir)
+        self.assertIsInstance(store, GloveStore)
+        self.assertIn("token9", store)
+        self.assertNotIn("token10", store)
+
+    def test_concurrent_conversion(self):
+        from api.embeddings import GloveStore, convert_glove, read_store_meta
+
+        store_dir = Path(self.tmp_dir.name) / "concurrent"
+        glove_file = Path(self.tmp_dir.name) / "glove.txt"
+        context = multiprocessing.get_context("fork")
+        workers = [context.Process(target=convert_glove, args=(glove_file, store_dir), kwargs={"if_outdated": True})
+                   for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        converted = read_store_meta(store_dir)
+
+        # the workers that waited for the lock found the store current and kept it
+        convert_glove(glove_file, store_dir, if_outdated=True)
+        self.assertEqual(read_store_meta(store_dir), converted)
+        self.assertEqual([worker.exitcode for worker in workers], [0] * 4)
+        self.assertEqual(converted["count"], self.NUM_TOKENS)
+        self.assertEqual(float(GloveStore(store_dir)["token8"][0]), 1.0)
+        # no temporary directories are left behind
+        self.assertEqual(sorted(p.name for p in Path(self.tmp_dir.name).glob("concurrent*")),
+                         ["concurrent", "concurrent.lock"])
+
+
+@skipUnless(importlib.util.find_spec("torch") and importlib.util.find_spec("IRNet"), "torch or IRNet is not installed")
+class IRNetBatchEncodingTestCase(SimpleTestCase):
+    """
+    Runs epoch_acc of the IRNet adapter with a tiny encoder instead of the pretrained model
+    """
+
+    def setUp(self):
+        import threading
+        from types import SimpleNamespace
+        import torch
+        from torch.nn.utils.rnn import pack_padded_sequence, pad_packed_sequence
+        from adapters.IRNet import irnet_adapter
+
+        torch.manual_seed(0)
+        words = ["how", "many", "singer", "are", "there", "what", "is", "the", "name", "of", "oldest", "stadium"]
+
+        class StubModel(torch.nn.Module):
+            # encodes like the model of IRNet: embeddings of the tokens, packed, through a bidirectional LSTM
+            def __init__(self):
+                super().__init__()
+                self.embedding = torch.nn.Embedding(len(words), 4)
+                self.encoder_lstm = torch.nn.LSTM(4, 3, bidirectional=True, batch_first=True)
+                self.encode_calls = 0
+
+            def gen_x_batch(self, questions):
+                embeddings = torch.zeros(len(questions), max(len(q) for q in questions), 4)
+                for i, question in enumerate(questions):
+                    for j, token in enumerate(question):
+                        embeddings[i, j] = self.embedding(torch.tensor([words.index(w) for w in token])).mean(0)
+                return embeddings
+
+            def encode(self, src_sents_var, src_sents_len, q_onehot_project=None):
+                self.encode_calls += 1
+                packed = pack_padded_sequence(self.gen_x_batch(src_sents_var), src_sents_len, batch_first=True)
+                src_encodings, (last_state, last_cell) = self.encoder_lstm(packed)
+                src_encodings, _ = pad_packed_sequence(src_encodings, batch_first=True)
+                return src_encodings, (torch.cat([last_state[0], last_state[1]], -1),
+                                       torch.cat([last_cell[0], last_cell[1]], -1))
+
+            def parse(self, example, beam_size):
+                # the adapter replaced encode, so this gets the encoding of the batch if there is one
+                encoding = self.encode([example.src_sent], [len(example.src_sent)])
+                example.sql_json["pre_sql"]["encoding"] = encoding
+                return [SimpleNamespace(actions=["Root1(3)"])], ["Root1(3)"]
+
+        def to_batch_seq(sql_data, table_data, idxes, st, ed, is_train=True):
+            return [SimpleNamespace(src_sent=sql_data[i]["src_sent"], sql_json={"pre_sql": {"index": i}})
+                    for i in idxes[st:ed]]
+
+        self.torch = torch
+        self.model = StubModel()
+        self.adapter = object.__new__(irnet_adapter.IRNetAdapter)
+        self.adapter.model = self.model
+        self.adapter.batch_state = threading.local()
+        self.adapter.model_encode = self.model.encode
+        self.model.encode = self.adapter.encode
+
+        original_to_batch_seq = irnet_adapter.to_batch_seq
+        irnet_adapter.to_batch_seq = to_batch_seq
+        self.addCleanup(setattr, irnet_adapter, "to_batch_seq", original_to_batch_seq)
+
+        questions = ["how many singer are there", "what is the name of the oldest stadium", "how many stadium",
+                     "what is the oldest singer", "name"]
+        self.sql_data = [{"src_sent": [[w] for w in question.split()]} for question in questions]
+
+    def test_batches_keep_the_order(self):
+        pre_sqls = self.adapter.epoch_acc(2, self.sql_data, {})
+
+        self.assertEqual([pre_sql["index"] for pre_sql in pre_sqls], list(range(len(self.sql_data))))
+        self.assertTrue(all(pre_sql["model_result"] == "Root1(3)" for pre_sql in pre_sqls))
+        # two batches of two questions encoded together, the last question alone
+        self.assertEqual(self.model.encode_calls, 3)
+
+    def test_batch_encoding_matches_single_encoding(self):
+        pre_sqls = self.adapter.epoch_acc(len(self.sql_data), self.sql_data, {})
+        self.assertEqual(self.model.encode_calls, 1)
+
+        for data, pre_sql in zip(self.sql_data, pre_sqls):
+            src_sent = data["src_sent"]
+            with self.torch.no_grad():
+                encoding, (state, cell) = self.adapter.model_encode([src_sent], [len(src_sent)])
+            batched_encoding, (batched_state, batched_cell) = pre_sql["encoding"]
+            self.assertEqual(batched_encoding.shape, encoding.shape)
+            self.assertTrue(self.torch.allclose(batched_encoding, encoding, atol=1e-6))
+            self.assertTrue(self.torch.allclose(batched_state, state, atol=1e-6))
+            self.assertTrue(self.torch.allclose(batched_cell, cell, atol=1e-6))
+
+
+@skipUnless(importlib.util.find_spec("torch") and importlib.util.find_spec("IRNet"), "torch or IRNet is not installed")
+class IRNetBatchParseTestCase(SimpleTestCase):
+    """
+    Parses questions with a randomly initialized IRNet model in one batch and one by one
+    """
+
+    def setUp(self):
+        import threading
+        import zlib
+        import nltk
+        import torch
+        from api.analysis import schemas
+        from adapters.IRNet import irnet_adapter
+        from adapters.IRNet.grammar import grammar_model
+        from adapters.IRNet.parse_args import init_arg_parser
+        from adapters.IRNet.src.rule import semQL
+
+        try:
+            nltk.pos_tag(["singers"])
+            irnet_adapter.wordnet_lemmatizer.lemmatize("singers")
+        except LookupError:
+            self.skipTest("the nltk data is not installed")
+
+        class WordEmbeddings(dict):
+            # a fixed random vector for every word, unknown words included
+            def get(self, word, default=None):
+                return self[word]
+
+            def __missing__(self, word):
+                vector = np.random.RandomState(zlib.crc32(word.encode('utf-8'))).uniform(-1, 1, 300)
+                self[word] = vector.astype(np.float32)
+                return self[word]
+
+        torch.manual_seed(0)
+        adapter = object.__new__(irnet_adapter.IRNetAdapter)
+        adapter.params = init_arg_parser()
+        adapter.model = grammar_model(irnet_adapter.IRNet, semQL)(adapter.params, semQL.Grammar())
+        adapter.model.word_emb = WordEmbeddings()
+        adapter.schemas = schemas
+        adapter.prepared_schemas = dict()
+        adapter.header_owners = dict()
+        adapter.model_gen_x_batch = adapter.model.gen_x_batch
+        adapter.model.gen_x_batch = adapter.gen_x_batch
+        adapter.batch_state = threading.local()
+        adapter.model_encode = adapter.model.encode
+        adapter.model.encode = adapter.encode
+        # no ConceptNet links, they are the same for both runs
+        adapter.concept_columns = lambda name, data: {}
+
+        self.encode_calls = 0
+        self.beam_scores = []
+        model_encode = adapter.model_encode
+        model_parse = adapter.model.parse
+
+        def encode(*args):
+            self.encode_calls += 1
+            return model_encode(*args)
+
+        def parse(example, beam_size=5):
+            results = model_parse(example, beam_size=beam_size)
+            self.beam_scores.append([float(hypothesis.score) for hypothesis in results[0]])
+            return results
+
+        adapter.model_encode = encode
+        adapter.model.parse = parse
+        self.adapter = adapter
+
+    def test_batch_parse_matches_single_parse(self):
+        requests = [("How many perpetrators are there?", "perpetrator"),
+                    ("List the names of the perpetrators in descending order of the year.", "perpetrator"),
+                    ("What are the names of the body builders?", "body_builder"),
+                    ("What is the average snatch score of body builders?", "body_builder")]
+
+        def describe(result):
+            return result if isinstance(result, str) else "{}: {}".format(type(result).__name__, result)
+
+        batched = [describe(result) for result in self.adapter.translate_batch(requests)]
+        batched_scores, self.beam_scores = self.beam_scores, []
+        # the questions went through the encoder in one pass
+        encode_calls, self.encode_calls = self.encode_calls, 0
+        single = [describe(self.adapter.translate_batch([request])[0]) for request in requests]
+
+        self.assertEqual(batched, single)
+        self.assertEqual(len(batched_scores), len(self.beam_scores))
+        for scores, expected in zip(batched_scores, self.beam_scores):
+            self.assertEqual(len(scores), len(expected))
+            for score, expected_score in zip(scores, expected):
+                self.assertAlmostEqual(score, expected_score, places=4)
+        self.assertLess(encode_calls, self.encode_calls)
+
+
+@skipUnless(importlib.util.find_spec("torch") and importlib.util.find_spec("IRNet"), "torch or IRNet is not installed")
+class IRNetPreparedSchemaTestCase(SimpleTestCase):
+    def test_loaded_schema_file_invalidates_prepared_schema(self):
+        from api.analysis import read_schema_file, schema_versions
+        from adapters.IRNet import irnet_adapter
+
+        adapter = object.__new__(irnet_adapter.IRNetAdapter)
+        adapter.schemas = dict()
+        adapter.concept_graphs = dict()
+        adapter.prepared_schemas = dict()
+        adapter.header_owners = dict()
+
+        schema = {"db_id": "prepare_test_db", "table_names": ["singer"],
+                  "column_names": [[-1, "*"], [0, "name"]]}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            schema_file = Path(tmp_dir) / "schema.json"
+            schema_file.write_text(json.dumps([schema]))
+            adapter.schemas, version = read_schema_file(str(schema_file))
+            schema_versions["prepare_test_db"] = version
+            try:
+                prepared = adapter.prepare_schema("prepare_test_db")
+                self.assertIs(adapter.prepare_schema("prepare_test_db"), prepared)
+
+                # the schemas are loaded again from the edited file
+                schema["column_names"].append([0, "age"])
+                schema_file.write_text(json.dumps([schema]))
+                adapter.schemas, schema_versions["prepare_test_db"] = read_schema_file(str(schema_file))
+                changed = adapter.prepare_schema("prepare_test_db")
+                self.assertIsNot(changed, prepared)
+                self.assertEqual(changed.col_set, ["*", "name", "age"])
+            finally:
+                del schema_versions["prepare_test_db"]
+
+
+class SnapshotTestCase(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.checkpoint = Path(self.tmp_dir.name) / "model.pt"
+        self.checkpoint.write_bytes(b"weights")
+        self.directory = Path(self.tmp_dir.name) / "snapshot"
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_restore(self):
+        from api.snapshot import Snapshot
+
+        snapshot = Snapshot(self.directory, [self.checkpoint])
+        self.assertFalse(snapshot.is_current())
+
+        weights = np.arange(12, dtype=np.float32).reshape(3, 4)
+        snapshot.save({"layer.weight": weights}, {"vocabulary": ["a", "b"]})
+
+        restored = Snapshot(self.directory, [self.checkpoint])
+        self.assertTrue(restored.is_current())
+        arrays, objects = restored.load()
+        self.assertIsInstance(arrays["layer.weight"], np.memmap)
+        np.testing.assert_array_equal(arrays["layer.weight"], weights)
+        self.assertEqual(objects, {"vocabulary": ["a", "b"]})
+
+    def test_invalidated_by_changed_input(self):
+        from api.snapshot import Snapshot
+
+        Snapshot(self.directory, [self.checkpoint]).save({"x": np.zeros(2)})
+        self.checkpoint.write_bytes(b"retrained weights")
+        self.assertFalse(Snapshot(self.directory, [self.checkpoint]).is_current())
+        self.assertFalse(Snapshot(self.directory, [self.checkpoint], extra={"beam_size": 5}).is_current())
+
+    def test_concurrent_save(self):
+        from api.snapshot import Snapshot
+
+        arrays = {"layer{}.weight".format(i): np.full((64, 64), i, dtype=np.float32) for i in range(8)}
+        snapshot = Snapshot(self.directory, [self.checkpoint])
+        context = multiprocessing.get_context("fork")
+        workers = [context.Process(target=snapshot.save, args=(arrays, {"worker": i})) for i in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual([worker.exitcode for worker in workers], [0] * 4)
+        restored, objects = Snapshot(self.directory, [self.checkpoint]).load()
+        self.assertEqual(sorted(restored), sorted(arrays))
+        for name, array in arrays.items():
+            np.testing.assert_array_equal(restored[name], array)
+        self.assertIn(objects["worker"], range(4))
+        self.assertEqual(sorted(p.name for p in Path(self.tmp_dir.name).glob("snapshot*")),
+                         ["snapshot", "snapshot.lock"])
+
+    @skipUnless(importlib.util.find_spec("torch"), "torch is not installed")
+    def test_assign_state_dict_shares_arrays(self):
+        import torch
+        from api.snapshot import Snapshot, arrays_to_state_dict, assign_state_dict, state_dict_to_arrays
+
+        model = torch.nn.Sequential(torch.nn.Linear(4, 3), torch.nn.BatchNorm1d(3))
+        snapshot = Snapshot(self.directory, [self.checkpoint])
+        snapshot.save(state_dict_to_arrays(model.state_dict()))
+        arrays, _ = snapshot.load()
+
+        restored = torch.nn.Sequential(torch.nn.Linear(4, 3), torch.nn.BatchNorm1d(3))
+        assign_state_dict(restored, arrays_to_state_dict(arrays))
+
+        for name, tensor in restored.state_dict().items():
+            self.assertTrue(torch.equal(tensor, model.state_dict()[name]))
+        # the parameter uses the memory of the mapped array instead of a copy
+        weight = arrays["0.weight"]
+        self.assertEqual(restored[0].weight.data_ptr(), weight.__array_interface__["data"][0])
+        with self.assertRaises(RuntimeError):
+            assign_state_dict(restored, {"0.weight": torch.zeros(3, 4)})
+
+
+class EditsqlModelFilesTestCase(SimpleTestCase):
+    def test_model_files_match_default_arguments(self):
+        import sys
+        from adapters.editsql import parse_args_sparc, parse_args_spider
+        from adapters.editsql.bundle import bundle_file
+        from adapters.editsql.interface import model_files
+
+        editsql_loaded = "editsql" in sys.modules
+        files = model_files()
+        # the key of every cached translation needs the model files, they must not load editsql
+        self.assertEqual("editsql" in sys.modules, editsql_loaded)
+
+        expected = []
+        for parse_args in [parse_args_spider, parse_args_sparc]:
+            params = parse_args.interpret_args()
+            expected += [Path(params.save_file), bundle_file(params)]
+        self.assertEqual([Path(f) for f in files], expected)
+
+
+@skipUnless(importlib.util.find_spec("torch") and importlib.util.find_spec("editsql.model"), "torch or editsql is not installed")
+class EditsqlBatchEncodingTestCase(SimpleTestCase):
+    """
+    Compares the batched BERT encoding of the editsql adapter with the encoding of editsql, using a tiny BERT
+    """
+    # short enough that every schema is split into several segments
+    MAX_SEQ_LENGTH = 16
+
+    def setUp(self):
+        from types import SimpleNamespace
+        import torch
+        from editsql.model.bert import tokenization
+        from editsql.model.bert.modeling import BertConfig, BertModel
+
+        torch.manual_seed(0)
+        words = ["how", "many", "singer", "singers", "are", "there", "what", "is", "the", "name", "of", "oldest",
+                 "stadium", "age", "country", "capacity", "id", "concert", "year", "theme"]
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        vocab_file = Path(self.tmp_dir.name) / "vocab.txt"
+        vocab_file.write_text("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + words) + "\n")
+        self.tokenizer = tokenization.FullTokenizer(vocab_file=str(vocab_file), do_lower_case=True)
+        self.bert_config = BertConfig(len(words) + 5, hidden_size=8, num_hidden_layers=1, num_attention_heads=2,
+                                      intermediate_size=16, max_position_embeddings=64)
+        self.model_bert = BertModel(self.bert_config)
+        self.model_bert.eval()
+        self.torch = torch
+
+        singer = SimpleNamespace(column_names_embedder_input=["*", "singer . name", "singer . age", "singer . country",
+                                                              "singer . id", "stadium . name", "stadium . capacity"])
+        concert = SimpleNamespace(column_names_embedder_input=["*", "concert . year", "concert . theme",
+                                                               "concert . id", "stadium . id"])
+        self.questions = [("how many singers are there".split(), singer),
+                          ("what is the name of the oldest singer".split(), singer),
+                          ("what is the theme of the concert".split(), concert)]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def encode(self, input_sequence, input_schema):
+        from adapters.editsql.editsql_adapter import original_get_bert_encoding
+
+        with self.torch.no_grad():
+            return original_get_bert_encoding(self.bert_config, self.model_bert, self.tokenizer, input_sequence,
+                                              input_schema, max_seq_length=self.MAX_SEQ_LENGTH)
+
+    def assertEncodingsClose(self, encoding, expected):
+        utterance_states, schema_token_states = encoding
+        expected_utterance_states, expected_schema_token_states = expected
+        self.assertEqual(len(utterance_states), len(expected_utterance_states))
+        for state, expected_state in zip(utterance_states, expected_utterance_states):
+            self.assertTrue(self.torch.allclose(state, expected_state, atol=1e-5))
+        self.assertEqual([len(states) for states in schema_token_states],
+                         [len(states) for states in expected_schema_token_states])
+        for states, expected_states in zip(schema_token_states, expected_schema_token_states):
+            for state, expected_state in zip(states, expected_states):
+                self.assertTrue(self.torch.allclose(state, expected_state, atol=1e-5))
+
+    def test_batch_encoding_matches_single_encoding(self):
+        from editsql.model import utils_bert
+        from adapters.editsql.editsql_adapter import get_bert_encodings
+
+        for input_sequence, input_schema in self.questions:
+            segments, _ = utils_bert.prepare_input(self.tokenizer, input_sequence, input_schema, self.MAX_SEQ_LENGTH)
+            self.assertGreater(len(segments), 1)
+
+        with self.torch.no_grad():
+            encodings = get_bert_encodings(self.bert_config, self.model_bert, self.tokenizer, self.questions,
+                                           max_seq_length=self.MAX_SEQ_LENGTH)
+        self.assertEqual(len(encodings), len(self.questions))
+        for (input_sequence, input_schema), encoding in zip(self.questions, encodings):
+            self.assertEncodingsClose(encoding, self.encode(input_sequence, input_schema))
+
+    def test_batch_encoding_is_used_once(self):
+        from adapters.editsql.editsql_adapter import bert_encodings, get_bert_encoding
+
+        input_sequence, input_schema = self.questions[0]
+        batched = self.encode(input_sequence, input_schema)
+        bert_encodings.encodings = {(id(input_schema), tuple(input_sequence)): batched}
+        try:
+            self.assertIs(get_bert_encoding(self.bert_config, self.model_bert, self.tokenizer, input_sequence,
+                                            input_schema, max_seq_length=self.MAX_SEQ_LENGTH), batched)
+            # a second encoding of the same question, e.g. by a later utterance of the interaction, is computed again
+            with self.torch.no_grad():
+                encoding = get_bert_encoding(self.bert_config, self.model_bert, self.tokenizer, input_sequence,
+                                             input_schema, max_seq_length=self.MAX_SEQ_LENGTH)
+            self.assertIsNot(encoding, batched)
+            self.assertEncodingsClose(encoding, batched)
+        finally:
+            bert_encodings.encodings = None
+
+
+class TranslatorRegistryTestCase(SimpleTestCase):
+    SETUP_DURATION = 0.5
+
+    def setUp(self):
+        import sys
+        import time
+        import types
+
+        self.names = ["slow_a", "slow_b"]
+        for name in self.names:
+            module = types.ModuleType(name)
+            module.setup = lambda: time.sleep(self.SETUP_DURATION)
+            module.translate = lambda nl_question, db_id: "SELECT 1"
+            sys.modules["api.adapters.{}.interface".format(name)] = module
+
+    def tearDown(self):
+        import sys
+
+        for name in self.names:
+            del sys.modules["api.adapters.{}.interface".format(name)]
+
+    def test_load_all_sets_up_translators_concurrently(self):
+        import time
+        from api.registry import TranslatorRegistry
+
+        registry = TranslatorRegistry(self.names)
+        start = time.time()
+        registry.load_all()
+        duration = time.time() - start
+
+        self.assertTrue(all(registry.is_loaded(name) for name in self.names))
+        self.assertLess(duration, 1.8 * self.SETUP_DURATION)
+        self.assertEqual(registry.adapters_dict["slow_a"]["translate"]("question", "db"), "SELECT 1")
+        self.assertEqual(registry.int_translators, [])
+
+    def test_model_version_of_loaded_translator(self):
+        import sys
+        from api.registry import TranslatorRegistry
+
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = Path(directory) / "model.bin"
+            checkpoint.write_bytes(b"old model")
+            sys.modules["api.adapters.slow_a.interface"].model_files = lambda: [checkpoint]
+            registry = TranslatorRegistry(["slow_a"])
+            registry.ensure_loaded("slow_a")
+            loaded_version = registry.model_version("slow_a")
+
+            # replaced while the old model is still loaded
+            checkpoint.write_bytes(b"the new model")
+            self.assertEqual(registry.model_version("slow_a"), loaded_version)
+
+            registry.loaded.discard("slow_a")
+            self.assertNotEqual(registry.model_version("slow_a"), loaded_version)
+
+    def test_no_stdout_restores_stdout_of_concurrent_calls(self):
+        import sys
+        import threading
+        import time
+        from api.setup_util import no_stdout
+
+        @no_stdout
+        def noisy(delay):
+            time.sleep(delay)
+            print("translator output")
+
+        stdout = sys.stdout
+        threads = [threading.Thread(target=noisy, args=(0.05 * i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertIs(sys.stdout, stdout)
+
+
+class MappedKeyIndexTestCase(SimpleTestCase):
+    def test_rewrite_keeps_open_index(self):
+        from api.mmap_index import MappedKeyIndex, write_key_index
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path_prefix = Path(tmp_dir) / "tokens"
+            write_key_index(path_prefix, ["b", "a", "über"], [0, 1, 2])
+            index = MappedKeyIndex(path_prefix)
+
+            write_key_index(path_prefix, ["c"], [5])
+
+            # the files of the open index were replaced, not overwritten
+            self.assertEqual([index.get(key) for key in ["a", "b", "über"]], [1, 0, 2])
+            self.assertEqual(MappedKeyIndex(path_prefix).get("c"), 5)
+            self.assertNotIn("b", MappedKeyIndex(path_prefix))
+            self.assertEqual(len(list(Path(tmp_dir).iterdir())), 4)
+
+
+class ConceptGraphTestCase(SimpleTestCase):
+    def test_same_lookups_as_pickled_graph(self):
+        import pickle
+        from adapters.IRNet.concept_store import ConceptGraph, convert_graph
+
+        graph = {
+            "new_york": ["city", "state", "place"],
+            "dog": ["animal", "pet"],
+            "über": ["preposition"],
+            "empty": [],
+        }
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            source_file = Path(tmp_dir) / "graph.pkl"
+            with open(str(source_file), 'wb') as f:
+                pickle.dump(graph, f)
+            convert_graph(source_file, Path(tmp_dir) / "store")
+            store = ConceptGraph(Path(tmp_dir) / "store")
+
+            self.assertEqual(len(store), len(graph))
+            for key, targets in graph.items():
+                self.assertIn(key, store)
+                self.assertEqual(sorted(store[key]), sorted(targets))
+                for target in ["city", "animal", "pet", "preposition", "name"]:
+                    self.assertEqual(target in store[key], target in targets)
+            self.assertNotIn("cat", store)
+            with self.assertRaises(KeyError):
+                store["cat"]
+
+    def test_column_index_matches_column_scan(self):
+        import pickle
+        import random
+        from adapters.IRNet.concept_store import ColumnScan, ConceptColumnIndex, ConceptGraph, convert_graph
+
+        rng = random.Random(0)
+        columns = ["*", "name", "age", "city", "country", "name", "year"]
+        targets = columns + ["animal", "person", "place"]
+        graph = {"key{}".format(i): rng.sample(targets, rng.randint(1, 4)) for i in range(500)}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            source_file = Path(tmp_dir) / "graph.pkl"
+            with open(str(source_file), 'wb') as f:
+                pickle.dump(graph, f)
+            convert_graph(source_file, Path(tmp_dir) / "store")
+            store = ConceptGraph(Path(tmp_dir) / "store")
+
+            index = ConceptColumnIndex(store, columns)
+            scan = ColumnScan(graph, columns)
+            for key in list(graph) + ["missing"]:
+                self.assertEqual(index.get(key), scan.get(key))
+
+
+class SemQLTestCase(SimpleTestCase):
+    def test_next_actions_follow_the_productions(self):
+        from adapters.IRNet.src.rule import semQL
+
+        for Cls in [semQL.Root1, semQL.Root, semQL.N, semQL.A, semQL.Sel, semQL.Filter, semQL.Sup, semQL.Order]:
+            for id_c, production in Cls.grammar_dict.items():
+                action = Cls(id_c)
+                expected = [getattr(semQL, x) for x in production.split(' ')[1:] if x not in semQL.Keywords]
+                self.assertEqual(action.get_next_action(), expected)
+                self.assertEqual(action.get_next_action(is_sketch=True), [t for t in expected if t is not semQL.A])
+                self.assertEqual(Cls.production_id[production], id_c)
+        self.assertEqual(semQL.C(0).get_next_action(), [semQL.T])
+        self.assertEqual(semQL.T(0).get_next_action(), [])
+
+    def test_grammar_ids(self):
+        from adapters.IRNet.src.rule import semQL
+
+        grammar = semQL.Grammar()
+        self.assertEqual(len(grammar.prod2id), 46)
+        self.assertEqual(grammar.id2prod[0], 'Sel N')
+        self.assertEqual(len(semQL.Grammar(is_sketch=True).prod2id), 40)
+
+    def test_compact_actions(self):
+        from adapters.IRNet.src.rule import semQL
+
+        sel = semQL.Sel(0)
+        column = semQL.C(3)
+        self.assertEqual(sel.children, [])
+        sel.add_children(column)
+        self.assertEqual(sel.children, [column])
+        self.assertEqual([str(sel), str(column)], ["Sel(0)", "C(3)"])
+        self.assertEqual(repr([semQL.A(3), semQL.Filter(2)]), "[A(count), Filter(Filter = A)]")
+
+    def test_model_with_grammar(self):
+        import sys
+        import types
+        from adapters.IRNet.grammar import grammar_model
+        from adapters.IRNet.src.rule import semQL
+
+        # grammar module and model module as IRNet imports them
+        irnet_grammar = types.ModuleType("src.rule.semQL")
+        exec("class Sel:\n    pass\n\nclass C:\n    pass\n", vars(irnet_grammar))
+        model_module = types.ModuleType("test_irnet_model")
+        model_module.define_rule = irnet_grammar
+        model_module.Sel = irnet_grammar.Sel
+        exec("class Beams:\n"
+             "    def column(self):\n"
+             "        return define_rule.C\n"
+             "\n"
+             "class Model:\n"
+             "    def __init__(self, grammar):\n"
+             "        self.grammar = grammar\n"
+             "\n"
+             "    def parse(self):\n"
+             "        return Sel, define_rule.Sel, Beams().column()\n", vars(model_module))
+        sys.modules[model_module.__name__] = model_module
+        self.addCleanup(sys.modules.pop, model_module.__name__)
+
+        model = grammar_model(model_module.Model, semQL)("grammar")
+        self.assertIsInstance(model, model_module.Model)
+        self.assertEqual(model.grammar, "grammar")
+        self.assertEqual(model.parse(), (semQL.Sel, semQL.Sel, semQL.C))
+        # the module of IRNet is unchanged
+        self.assertEqual(model_module.Model("grammar").parse(), (irnet_grammar.Sel, irnet_grammar.Sel, irnet_grammar.C))
+        self.assertIs(model_module.define_rule, irnet_grammar)
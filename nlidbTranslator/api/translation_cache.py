@@ -0,0 +1,325 @@
+import hashlib
+import json
+import threading
+import time
+import warnings
+from collections import OrderedDict
+
+from api.analysis import schema_versions
+from api.setup_util import get_setting, translator_registry
+
+
+def normalize_question(nl_question):
+    # only whitespace is normalized, the translators may distinguish everything else (e.g. the case of values)
+    return " ".join(nl_question.split())
+
+
+def schema_version(db_schema):
+    # the version of the schema file this process loaded and translates with, see analysis.py
+    return schema_versions.get(db_schema)
+
+
+def model_version(translator):
+    # the version of the model files the translator of this process (or of the model server) was set up with
+    return translator_registry.model_version(translator)
+
+
+def translation_version(db_schema, translator):
+    """
+        Returns the versions of the loaded schema file and model files of a translation as a short string,
+        stored with the logged Translation
+    """
+    versions = [schema_version(db_schema), model_version(translator)]
+    return hashlib.sha256(json.dumps(versions).encode('utf-8')).hexdigest()[:32]
+
+
+def translation_key(nl_question, db_schema, translator):
+    """
+        Returns the cache key of a translation, it changes with the version of the schema file and of the model files
+        the translation is made with
+    """
+    return translator, db_schema, normalize_question(nl_question), schema_version(db_schema), model_version(translator)
+
+
+def interaction_key(nl_question, db_schema, translator, prev_questions, prev_predictions):
+    """
+        Returns the key of the translation of an utterance in the context of the previous utterances
+    """
+    return ("interaction",) + translation_key(nl_question, db_schema, translator) + (
+        tuple(normalize_question(q) for q in prev_questions), tuple(prev_predictions))
+
+
+class TranslationCache:
+    """
+    Thread-safe LRU cache of translations whose entries expire after a time to live
+    """
+
+    def __init__(self, max_size, ttl=None):
+        """
+        Args:
+            max_size: maximum number of entries, 0 disables the cache
+            ttl: seconds an entry is valid, None keeps entries until they are evicted
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def get(self, key):
+        """
+            Returns the cached value of key or None
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[1] > self.ttl:
+                del self.entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.entries[key] = (value, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class SharedTranslationCache:
+    """
+    Translations in a django cache that all worker processes read and write, e.g. a file based cache that also
+    outlives restarts. Size limit, eviction and timeout are configured with the cache in CACHES of the settings.
+    """
+
+    def __init__(self, alias):
+        """
+        Args:
+            alias: name of the cache in CACHES, None disables the cache
+        """
+        self.alias = alias
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.alias is not None
+
+    @property
+    def cache(self):
+        from django.core.cache import caches
+
+        return caches[self.alias]
+
+    @staticmethod
+    def cache_key(key):
+        # stable across processes, unlike hash(), and short enough for every cache backend
+        return "translation:" + hashlib.sha256(json.dumps(key).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        value = self.cache.get(self.cache_key(key))
+        with self.lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.cache.set(self.cache_key(key), value)
+
+    def add(self, key, value):
+        """
+            Store value only if key is not cached yet
+
+            Returns:
+                True if the value was stored
+        """
+        return self.cache.add(self.cache_key(key), value)
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self):
+        # the counters are those of this process, the entries are shared
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "cache": self.alias,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+            }
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs a function only once for concurrent calls with the same key, the other callers wait for its result
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.flights = dict()
+        self.coalesced = 0
+
+    def do(self, key, function):
+        """
+            Returns the result of function(), or the result of the call with the same key that is in progress.
+            An exception of the call is raised in all waiting callers as well.
+        """
+        if not self.enabled:
+            return function()
+
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = _Flight()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = function()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+        return flight.result
+
+    def stats(self):
+        with self.lock:
+            return {"in_flight": len(self.flights), "coalesced": self.coalesced}
+
+
+# translations of this process, see TRANSLATION_CACHE_SIZE and TRANSLATION_CACHE_TTL in the settings
+translation_cache = TranslationCache(max_size=get_setting("TRANSLATION_CACHE_SIZE", 1024),
+                                     ttl=get_setting("TRANSLATION_CACHE_TTL", 24 * 60 * 60))
+
+# translations of all processes, see TRANSLATION_SHARED_CACHE in the settings
+shared_translation_cache = SharedTranslationCache(get_setting("TRANSLATION_SHARED_CACHE", None))
+
+
+# identical translations that run at the same time, see TRANSLATION_SINGLE_FLIGHT in the settings
+translation_flights = SingleFlight(enabled=get_setting("TRANSLATION_SINGLE_FLIGHT", True))
+
+
+def caching_enabled():
+    return translation_cache.enabled or shared_translation_cache.enabled
+
+
+def cached_translation(key):
+    """
+        Returns the cached translation of key or None, the cache of this process is asked first
+    """
+    value = translation_cache.get(key)
+    if value is None and shared_translation_cache.enabled:
+        value = shared_translation_cache.get(key)
+        if value is not None:
+            translation_cache.put(key, value)
+    return value
+
+
+def cache_translation(key, value):
+    translation_cache.put(key, value)
+    if shared_translation_cache.enabled:
+        shared_translation_cache.put(key, value)
+
+
+def clear_translation_caches():
+    translation_cache.clear()
+    if shared_translation_cache.enabled:
+        shared_translation_cache.clear()
+
+
+def warm_translation_cache(limit=None):
+    """
+        Add the most frequent translations of the Translation log to the shared cache.
+        Only translations that were logged with the current version of the schema and the model files are used,
+        others may come from a previous model.
+
+        Args:
+            limit: number of the most frequent (question, schema, translator) combinations,
+                default TRANSLATION_CACHE_WARMUP of the settings
+
+        Returns:
+            the number of added translations
+    """
+    from django.db import DatabaseError
+    from django.db.models import Count, Max
+    from api.models import Translation
+
+    if limit is None:
+        limit = get_setting("TRANSLATION_CACHE_WARMUP", 0)
+    if not limit or not shared_translation_cache.enabled:
+        return 0
+
+    try:
+        frequent = list(Translation.objects.values('nl_question', 'db_schema', 'translator')
+                        .annotate(count=Count('id'), latest=Max('id')).order_by('-count')[:limit])
+        latest = Translation.objects.in_bulk([row['latest'] for row in frequent])
+    except DatabaseError as e:
+        warnings.warn("The translation cache is not warmed up, the Translation log is not readable: {}".format(e))
+        return 0
+
+    added = 0
+    for row in frequent:
+        if row['translator'] not in translator_registry.names:
+            continue
+        translation = latest[row['latest']]
+        if translation.version != translation_version(row['db_schema'], row['translator']):
+            continue
+        key = translation_key(row['nl_question'], row['db_schema'], row['translator'])
+        if shared_translation_cache.add(key, translation.sql_statement):
+            added += 1
+    return added
@@ -2,18 +2,25 @@ from django.urls import path
 from rest_framework.urlpatterns import format_suffix_patterns
 
 from api import views
+from api.async_views import async_view
 
 urlpatterns = [
-    path('translate', views.Translate.as_view()),
+    path('translate', async_view(views.Translate.as_view())),
+    path('translate/batch', views.TranslateBatch.as_view()),
+    path('translate/cache', views.TranslationCacheStatus.as_view()),
     path('translate/logs', views.TranslateLogList.as_view()),
     path('translate/logs/<int:n>', views.TranslateLogList.as_view()),
     path('translate/log_item/<int:pk>', views.TranslationLogDetail.as_view()),
-    path('interaction', views.StartInteraction.as_view()),
-    path('interaction/<int:int_id>', views.TranslateInteraction.as_view(), name="interaction"),
+    path('interaction', async_view(views.StartInteraction.as_view())),
+    path('interaction/<int:int_id>', async_view(views.TranslateInteraction.as_view()), name="interaction"),
     path('interaction/logs', views.InteractionLogList.as_view()),
     path('interaction/logs/<int:n>', views.InteractionLogList.as_view()),
     path('interaction/log_item/<int:int_id>', views.InteractionLogDetail.as_view()),
+    path('jobs', views.JobList.as_view()),
+    path('jobs/<int:job_id>', views.JobDetail.as_view(), name="job"),
+    path('jobs/<int:job_id>/results', views.JobResults.as_view(), name="job_results"),
     path('translators', views.TranslatorList.as_view()),
+    path('translators/status', views.TranslatorStatus.as_view()),
     path('schemas', views.SchemaList.as_view()),
     path('schemas/<str:schema_name>', views.SchemaDetail.as_view()),
 ]
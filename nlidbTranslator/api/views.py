@@ -1,16 +1,22 @@
+from django.http import StreamingHttpResponse
 from django.urls import reverse
 from rest_framework.generics import GenericAPIView
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import generics, status
 from rest_framework.permissions import IsAdminUser
+from rest_framework.exceptions import ValidationError
 
-from api.analysis import schemas, schema_column_names, translators
-from api.setup_util import int_translators
-from api.models import Translation, Interaction
+from api.analysis import schemas, schema_column_names
+from api.setup_util import enabled_translators as translators, int_translators, translator_registry
+from api.jobs import parse_job_file, create_job, job_progress, job_result_lines
+from api.models import Translation, Interaction, Job
 from api.serializers import TranslationSerializer, InteractionSerializer, UtteranceSerializer
+from api.translation_cache import translation_cache, shared_translation_cache, clear_translation_caches, \
+    translation_flights
 from api.process_request import store_translation, store_interaction, group_interaction_items, \
-    get_single_interaction_details, check_params_exist_and_not_empty, check_choices_valid
+    get_single_interaction_details, check_params_exist_and_not_empty, check_choices_valid, check_batch_items, \
+    stream_batch_translations
 
 
 class Translate(generics.CreateAPIView):
@@ -38,6 +44,68 @@ class Translate(generics.CreateAPIView):
         return Response(response_data)
 
 
+class TranslateBatch(APIView):
+    """
+        Translates a list of natural language questions to sql
+
+        Each item needs the same values as for /translate: nl_question, db_schema and translator.
+        The results are streamed as one json object per line (NDJSON) in the order they complete,
+        index is the position of the item in the list.
+    """
+    def post(self, request):
+        check_batch_items(request.data)
+
+        return StreamingHttpResponse(stream_batch_translations(request.data), content_type="application/x-ndjson")
+
+
+class JobList(APIView):
+    """
+        Queues the translation of an uploaded file of questions
+
+        The file (form field `file`) holds one json object per line with nl_question, db_schema and translator.
+        The form fields `db_schema` and `translator` may provide the values for lines without them.
+    """
+    def post(self, request):
+        if 'file' not in request.FILES:
+            raise ValidationError(detail="Missing file")
+        defaults = {name: request.data[name] for name in ['db_schema', 'translator'] if request.data.get(name)}
+        items = parse_job_file(request.FILES['file'], defaults)
+        job = create_job(items)
+
+        content = job_progress(job)
+        content["url"] = request.build_absolute_uri(reverse("job", args=[job.id]))
+        return Response(content, status=status.HTTP_201_CREATED)
+
+
+class JobDetail(APIView):
+    """
+        Show the progress of the job with id `job_id`
+    """
+    def get(self, request, job_id):
+        job = Job.objects.filter(pk=job_id).first()
+        if job is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        content = job_progress(job)
+        content["results"] = request.build_absolute_uri(reverse("job_results", args=[job.id]))
+        return Response(content)
+
+
+class JobResults(APIView):
+    """
+        Download the translations of the job with id `job_id` as one json object per line, in the order of the uploaded file.
+        Until the job is done, only the translated questions are listed.
+    """
+    def get(self, request, job_id):
+        job = Job.objects.filter(pk=job_id).first()
+        if job is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        response = StreamingHttpResponse(job_result_lines(job), content_type="application/x-ndjson")
+        response["Content-Disposition"] = 'attachment; filename="job_{}.jsonl"'.format(job.id)
+        return response
+
+
 class StartInteraction(GenericAPIView):
     """
         Start an interaction
@@ -191,6 +259,37 @@ class TranslatorList(APIView):
         return Response(content)
 
 
+class TranslatorStatus(APIView):
+    """
+        Show which translators are loaded, when they were used last and the recent load and unload events
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(translator_registry.status())
+
+
+class TranslationCacheStatus(APIView):
+    """
+        Show the size and the hits and misses of the translation cache of this process
+        and the hits and misses of the shared translation cache, DELETE empties both.
+        single_flight counts the requests that waited for an identical request instead of translating again.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        content = {
+            "process": translation_cache.stats(),
+            "shared": shared_translation_cache.stats() if shared_translation_cache.enabled else None,
+            "single_flight": translation_flights.stats(),
+        }
+        return Response(content)
+
+    def delete(self, request):
+        clear_translation_caches()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 class SchemaList(APIView):
     """
         List all available database schemas
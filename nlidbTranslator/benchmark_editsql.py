@@ -0,0 +1,67 @@
+import argparse
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from api.batching import MicroBatcher
+from adapters.editsql.constants import EVAL_REFERENCE_FILE
+from adapters.editsql.editsql_adapter import EditsqlAdapter
+
+
+def load_questions(reference_file, amount):
+    # the spider dev questions of the editsql evaluation
+    with open(str(reference_file)) as infile:
+        references = json.load(infile)
+    return [{"nl_question": " ".join(r["input_seq"]), "db_id": r["database_id"]} for r in references[:amount]]
+
+
+def run(translate, questions, concurrency):
+    """
+        Translate the questions from concurrency threads at a time
+
+        Returns:
+            the throughput in questions per second and the latency of each question in ms
+    """
+    def timed(question):
+        start = time.perf_counter()
+        translate(question["nl_question"], question["db_id"])
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(timed, questions))
+    return len(questions) / (time.perf_counter() - start), latencies
+
+
+def report(name, concurrency, throughput, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+    print("{:<8} concurrency {:3}   {:7.2f} questions/s   median {:8.1f} ms   p95 {:8.1f} ms".format(
+        name, concurrency, throughput, statistics.median(latencies), p95))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare throughput and latency of the EditSQL spider model for "
+                                                 "concurrent questions, translated directly and by the MicroBatcher")
+    parser.add_argument('--reference_file', type=str, default=str(EVAL_REFERENCE_FILE))
+    parser.add_argument('--amount', type=int, default=100, help="number of questions per measurement")
+    parser.add_argument('--concurrency', type=str, default="1,2,4,8,16", help="comma separated concurrency levels")
+    parser.add_argument('--batch_size', type=int, default=8)
+    parser.add_argument('--wait_ms', type=float, default=5)
+    args = parser.parse_args()
+
+    questions = load_questions(args.reference_file, args.amount)
+    adapter = EditsqlAdapter("spider")
+    # the first translation initializes lazily created state
+    adapter.translate(questions[0]["nl_question"], questions[0]["db_id"])
+
+    for concurrency in [int(c) for c in args.concurrency.split(",")]:
+        report("direct", concurrency, *run(adapter.translate, questions, concurrency))
+
+        batcher = MicroBatcher(adapter.translate_batch, max_size=args.batch_size, max_wait=args.wait_ms / 1000,
+                               group_key=lambda request: request[1])
+        report("batched", concurrency,
+               *run(lambda nl_question, db_id: batcher.submit((nl_question, db_id)), questions, concurrency))
+        print("{:<8} {}".format("", batcher.stats()))
+        batcher.stop()
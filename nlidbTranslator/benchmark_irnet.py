@@ -0,0 +1,128 @@
+import argparse
+import json
+import pickle
+import statistics
+import time
+
+import numpy as np
+
+from api.analysis import schemas
+from adapters.IRNet.concept_store import GRAPH_NAMES, ColumnScan, load_concept_graph, pickle_file
+from adapters.IRNet.constants import IRNET_BASE_DIR
+from adapters.IRNet.irnet_adapter import IRNetAdapter
+
+
+class PicklePreprocessing(IRNetAdapter):
+    """
+    Preprocessing as it was before the ConceptNet store: both graphs are unpickled for every question
+    and the columns of the schema are scanned for every match of a span
+    """
+
+    def __init__(self):
+        # no model is needed for the preprocessing
+        self.schemas = schemas
+        self.pickled_graphs = dict()
+
+    def concept_columns(self, name, data):
+        return ColumnScan(self.pickled_graphs[name], data['col_set'])
+
+    def preprocessData(self, data, schema):
+        for name in GRAPH_NAMES:
+            with open(str(pickle_file(name)), 'rb') as f:
+                self.pickled_graphs[name] = pickle.load(f)
+
+        return super().preprocessData(data, schema)
+
+
+class StorePreprocessing(IRNetAdapter):
+    """
+    Preprocessing with the memory-mapped ConceptNet store and the per-schema column index, as done by the IRNetAdapter
+    """
+
+    def __init__(self):
+        self.schemas = schemas
+        self.concept_graphs = {name: load_concept_graph(name) for name in GRAPH_NAMES}
+        self.prepared_schemas = dict()
+        self.header_owners = dict()
+
+
+def prepare(adapter, question):
+    # same steps as IRNetAdapter.translate() up to the preprocessing
+    data = adapter.createSqlData(question["question"], question["db_id"])
+    schema = adapter.schemas[question["db_id"]]
+    data['col_set'] = np.asarray(schema['column_names'])[:, 1].tolist()
+    data['table_names'] = schema['table_names']
+    return data, schema
+
+
+def measure(adapter, questions):
+    """
+        Returns:
+            the preprocessing time of each question in ms and the question_arg_type of each question
+    """
+    durations = []
+    results = []
+    for question in questions:
+        start = time.perf_counter()
+        data = adapter.preprocessData(*prepare(adapter, question))
+        durations.append((time.perf_counter() - start) * 1000)
+        results.append(data["question_arg_type"])
+    return durations, results
+
+
+def verify(adapter, questions):
+    """
+        Check that the column index yields the same question_arg_type as scanning the columns of the pickled graphs,
+        the graphs are unpickled only once
+
+        Returns:
+            True if the results are equal for all questions
+    """
+    pickled = PicklePreprocessing()
+    for name in GRAPH_NAMES:
+        with open(str(pickle_file(name)), 'rb') as f:
+            pickled.pickled_graphs[name] = pickle.load(f)
+
+    equal = True
+    for question in questions:
+        expected = IRNetAdapter.preprocessData(pickled, *prepare(pickled, question))["question_arg_type"]
+        actual = adapter.preprocessData(*prepare(adapter, question))["question_arg_type"]
+        if expected != actual:
+            print("difference for {}: {} != {}".format(question["question"], actual, expected))
+            equal = False
+    return equal
+
+
+def report(name, durations):
+    print("{:<8} mean {:9.2f} ms   median {:9.2f} ms   max {:9.2f} ms".format(
+        name, statistics.mean(durations), statistics.median(durations), max(durations)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the IRNet preprocessing time per request with the "
+                                                 "pickled ConceptNet graphs and with the ConceptNet store")
+    parser.add_argument('--data_file', type=str, default=str(IRNET_BASE_DIR / "data" / "dev.json"))
+    parser.add_argument('--amount', type=int, default=20, help="number of questions, 0 for all")
+    parser.add_argument('--verify', action='store_true',
+                        help="only check that the store yields the same question_arg_type as the pickled graphs")
+    args = parser.parse_args()
+
+    with open(args.data_file) as infile:
+        questions = [q for q in json.load(infile) if q["db_id"] in schemas]
+    if args.amount:
+        questions = questions[:args.amount]
+    print("{} questions".format(len(questions)))
+
+    # open the store (and convert the pickle files if necessary) before measuring
+    store = StorePreprocessing()
+
+    if args.verify:
+        print("identical question_arg_type: {}".format(verify(store, questions)))
+    else:
+        before, before_results = measure(PicklePreprocessing(), questions)
+        after, after_results = measure(store, questions)
+
+        report("before", before)
+        report("after", after)
+        print("speedup  {:.0f}x".format(statistics.mean(before) / statistics.mean(after)))
+        print("identical question_arg_type: {}".format(before_results == after_results))
@@ -0,0 +1,114 @@
+import argparse
+import importlib.util
+import re
+import timeit
+import tracemalloc
+
+from api.paths import TRANSLATORS_DIR
+from adapters.IRNet.src.rule import semQL
+
+# action sequence of a typical spider query with a nested filter
+SEQUENCE = "Root1(3) Root(3) Sel(0) N(1) A(3) C(0) T(1) A(0) C(2) T(1) Filter(11) A(0) C(5) T(1) " \
+           "Root(3) Sel(0) N(0) A(1) C(5) T(1) Filter(5) A(0) C(6) T(2)"
+
+GRAMMAR_TYPES = ["Root1", "Root", "Sel", "Filter", "Sup", "N", "Order", "A"]
+
+
+def load_module(path):
+    spec = importlib.util.spec_from_file_location("reference_semQL", str(path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def available_class(module, actions, is_sketch=False):
+    # as Beams.get_availableClass() of IRNet, replays the actions of a hypothesis at every step
+    stack = [module.Root1]
+    for action in actions:
+        infer_action = action.get_next_action(is_sketch=is_sketch)
+        infer_action.reverse()
+        if stack[-1] is type(action):
+            stack.pop()
+            stack.extend(infer_action)
+        else:
+            raise RuntimeError("Not the right action")
+    return stack[-1] if len(stack) > 0 else None
+
+
+def decode(module, grammar, sequence, beam_size):
+    """
+        Decode the action sequence the way the beam search of IRNet uses the grammar: at every step each hypothesis
+        replays its actions, scores all productions of the available class and constructs the chosen action
+
+        Returns:
+            the available class names of all steps and the actions of the hypotheses
+    """
+    steps = [(name, int(id_c)) for name, id_c in re.findall(r"(\w+)\((\d+)\)", sequence)]
+    trace = []
+    hypotheses = [[] for _ in range(beam_size)]
+    for name, id_c in steps:
+        for actions in hypotheses:
+            action_class = available_class(module, actions)
+            trace.append(action_class.__name__)
+            if action_class.__name__ in GRAMMAR_TYPES:
+                # the model looks up the id of every production to score it
+                productions = grammar.get_production(action_class)
+                prod_ids = [grammar.prod2id[p] for p in productions]
+                production = grammar.id2prod[prod_ids[id_c]]
+                action = action_class(list(action_class._init_grammar()).index(production))
+            else:
+                action = action_class(id_c)
+            actions.append(action)
+    trace.append(" ".join(str(a) for a in hypotheses[0]))
+    return trace, hypotheses
+
+
+def measure_memory(module, grammar, sequence, beam_size):
+    """
+        Returns:
+            the memory and the number of memory blocks that the actions of one hypothesis occupy
+    """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        hypotheses = decode(module, grammar, sequence, beam_size)[1]
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    differences = after.compare_to(before, 'filename')
+    size = sum(d.size_diff for d in differences)
+    blocks = sum(d.count_diff for d in differences)
+    return size / len(hypotheses), blocks / len(hypotheses)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time decoding a semQL action sequence and measure the memory of the "
+                                                 "actions with the adapter grammar and with the original grammar of IRNet")
+    parser.add_argument('--reference', type=str, default=str(TRANSLATORS_DIR / "IRNet" / "src" / "rule" / "semQL.py"),
+                        help="semQL.py with the original grammar")
+    parser.add_argument('--beam_size', type=int, default=5)
+    parser.add_argument('--number', type=int, default=200, help="decodings per measurement")
+    args = parser.parse_args()
+
+    modules = [("precompiled", semQL)]
+    try:
+        modules.insert(0, ("original", load_module(args.reference)))
+    except FileNotFoundError:
+        print("No reference grammar found in {}".format(args.reference))
+
+    results = dict()
+    for name, module in modules:
+        grammar = module.Grammar()
+        traces, _ = decode(module, grammar, SEQUENCE, args.beam_size)
+        duration = min(timeit.repeat(lambda: decode(module, grammar, SEQUENCE, args.beam_size),
+                                     number=args.number, repeat=5)) / args.number
+        results[name] = (duration, traces)
+        print("{:<12} {:8.3f} ms per decoding".format(name, duration * 1000))
+        for beam_size in range(1, args.beam_size + 1):
+            size, blocks = measure_memory(module, grammar, SEQUENCE, beam_size)
+            print("{:<12} beam size {}: {:7.0f} bytes and {:5.1f} memory blocks per hypothesis".format(
+                "", beam_size, size, blocks))
+
+    if "original" in results:
+        print("speedup      {:.1f}x".format(results["original"][0] / results["precompiled"][0]))
+        print("identical decoding: {}".format(results["original"][1] == results["precompiled"][1]))
@@ -4,9 +4,13 @@ from pathlib import Path
 import nltk
 from api.paths import TRANSLATORS_DIR, PROJECT_ROOT
 from api.adapters.editsql import parse_args_sparc, parse_args_spider
+from api.adapters.editsql.bundle import write_serving_bundle
+from api.adapters.editsql.constants import patch_atis_data
 from editsql.data_util.atis_data import ATISDataset
 from editsql.preprocess import preprocess
 
+patch_atis_data()
+
 
 def execute_preprocess(model="spider"):
     parser = argparse.ArgumentParser()
@@ -23,7 +27,10 @@ def execute_run_partially(model="spider"):
     else:
         params = parse_args_spider.interpret_args()
 
-    _ = ATISDataset(params)  # just so that all files are generated
+    data = ATISDataset(params)  # just so that all files are generated
+
+    # the adapter only needs the vocabularies and the anonymizer of the dataset
+    write_serving_bundle(params, data)
 
 
 if __name__ == '__main__':
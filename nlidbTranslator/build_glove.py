@@ -0,0 +1,56 @@
+import argparse
+import importlib
+import importlib.util
+
+import numpy as np
+from nltk.stem import WordNetLemmatizer
+
+from api.analysis import translators, schemas, schema_files
+from api.embeddings import THRESHOLD, convert_glove, collect_schema_tokens
+from api.paths import GLOVE_FILE, GLOVE_STORE_DIR, GLOVE_PRUNED_STORE_DIR, SCHEMAS_DIR
+
+
+def collect_vocabulary():
+    """
+        Compute the union of all tokens the deployed adapters can look up in the glove embeddings
+
+        Returns:
+            the set of tokens and the list of files they were computed from
+    """
+    tokens = collect_schema_tokens(schemas, lemmatize=WordNetLemmatizer().lemmatize)
+    inputs = [SCHEMAS_DIR / (schema_f + ".json") for schema_f in schema_files]
+
+    # adapters can provide their vocabulary in an optional module vocabulary.py
+    for translator in translators:
+        path = "api.adapters.{}.vocabulary".format(translator)
+        if importlib.util.find_spec(path) is None:
+            continue
+        adapter_tokens, adapter_inputs = importlib.import_module(path).embedding_vocabulary()
+        print("{}: {} tokens".format(translator, len(adapter_tokens)))
+        tokens.update(adapter_tokens)
+        inputs.extend(adapter_inputs)
+
+    return tokens, inputs
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert the GloVe text file into the binary store used at runtime")
+    parser.add_argument("--glove_file", type=str, default=str(GLOVE_FILE))
+    parser.add_argument("--store_dir", type=str, default=None)
+    parser.add_argument("--all", action='store_true', default=False,
+                        help="convert all lines instead of the first {}".format(THRESHOLD))
+    parser.add_argument("--prune", action='store_true', default=False,
+                        help="only store the tokens the adapters can look up, as float16")
+    parser.add_argument("--keep_top", type=int, default=50000,
+                        help="keep this many of the most frequent tokens in addition to the vocabulary of a pruned store, "
+                             "for the words of questions (IRNet looks up every word of a question)")
+    args = parser.parse_args()
+
+    limit = None if args.all else THRESHOLD
+    if args.prune:
+        vocabulary, inputs = collect_vocabulary()
+        count = convert_glove(args.glove_file, args.store_dir or GLOVE_PRUNED_STORE_DIR, limit=limit,
+                              dtype=np.float16, vocabulary=vocabulary, keep_top=args.keep_top, inputs=inputs)
+        print("Stored {} of {} tokens of the vocabulary".format(count, len(vocabulary)))
+    else:
+        convert_glove(args.glove_file, args.store_dir or GLOVE_STORE_DIR, limit=limit)
@@ -9,8 +9,22 @@ https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nlidbTranslator.settings')
 
-application = get_asgi_application()
+# as get_asgi_application(), but streaming responses (/translate/batch) are iterated off the event loop
+django.setup(set_prefix=False)
+from api.async_views import StreamingASGIHandler
+
+application = StreamingASGIHandler()
+
+# set up the translators before the first request if configured (EAGER_TRANSLATOR_LOADING)
+from api.setup_util import load_eager_translators
+from api.translation_cache import warm_translation_cache
+from api.jobs import job_workers
+
+load_eager_translators()
+warm_translation_cache()
+# process the queued jobs and resume those that were interrupted if JOB_WORKERS is set
+job_workers.start()
@@ -87,6 +87,33 @@ DATABASES = {
 }
 
 
+# Caches
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # translations shared by all worker processes, see TRANSLATION_SHARED_CACHE
+    'translations': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'translation_cache',
+        'TIMEOUT': 7 * 24 * 60 * 60,
+        # increase to drop all cached translations
+        'VERSION': 1,
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            # a third of the entries is deleted when MAX_ENTRIES is reached
+            'CULL_FREQUENCY': 3,
+        },
+    },
+}
+
+
+# the tests use an in-memory cache instead of the 'translations' cache above
+TEST_RUNNER = 'api.test_runner.TestRunner'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
@@ -135,3 +162,131 @@ STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 
+# Translators
+
+# names of the translators (directories in api/adapters) served by this instance, None enables all of them
+ENABLED_TRANSLATORS = None
+
+# set up all enabled translators when the server starts instead of at their first use
+EAGER_TRANSLATOR_LOADING = False
+
+# number of translators that are set up concurrently at the start, None sets up all of them at once
+TRANSLATOR_LOAD_WORKERS = None
+
+# unload translators that were not used for this many seconds, None keeps them loaded
+TRANSLATOR_IDLE_TIMEOUT = None
+
+# unload the least recently used translators while the process uses more memory (in MB), None disables the limit
+TRANSLATOR_MEMORY_LIMIT_MB = None
+
+# seconds between two checks for translators to unload
+TRANSLATOR_CHECK_INTERVAL = 60
+
+# number of threads that run /translate and /interaction requests, which are async views: under ASGI
+# further requests wait without blocking other endpoints, under WSGI each request still holds its worker thread
+TRANSLATION_EXECUTOR_WORKERS = 8
+
+# path of the unix socket (or (host, port)) of a model server started with "python manage.py model_server",
+# e.g. str(BASE_DIR / 'model_server.sock'). The translators are then loaded only in the model server and the
+# processes of the web server send their questions to it. None loads the translators in every process.
+# The server unpickles the requests of every client that knows the authkey: prefer a unix socket, use
+# (host, port) only in a trusted network and with a MODEL_SERVER_AUTHKEY that differs from the SECRET_KEY.
+MODEL_SERVER_ADDRESS = None
+
+# key the web server processes authenticate with at the model server, None uses the SECRET_KEY
+MODEL_SERVER_AUTHKEY = None
+
+# number of requests the model server passes to the translators at the same time
+MODEL_SERVER_WORKERS = 4
+
+# seconds the web server processes wait for the answer of the model server, None waits forever
+MODEL_SERVER_TIMEOUT = 300
+
+# seconds the web server processes key cached translations by the model version the model server reported last
+# (with every translation) before asking it again, e.g. after its translators were reloaded with new model files
+MODEL_SERVER_VERSION_TTL = 10
+
+# let the EditSQL spider and sparc models use one BERT encoder, as long as their fine-tuned BERT weights are equal
+EDITSQL_SHARED_BERT = True
+
+# translate concurrent EditSQL questions in batches of up to this many questions, 1 disables it
+# (BERT encodes the questions of a database in one forward pass, the decoding stays one question at a time)
+EDITSQL_BATCH_SIZE = 1
+
+# milliseconds the first question of an EditSQL batch waits for more questions
+EDITSQL_BATCH_WAIT_MS = 5
+
+# encode concurrent IRNet questions in batches of up to this many questions, 1 disables it
+IRNET_BATCH_SIZE = 1
+
+# milliseconds the first question of an IRNet batch waits for more questions
+IRNET_BATCH_WAIT_MS = 5
+
+# write the ready-to-serve state of each translator after its first setup and restore it at later starts
+TRANSLATOR_SNAPSHOTS = True
+
+# number of translations cached per process, 0 disables the cache
+# (entries are invalidated when the process loads a changed schema file or changed model files of the translator)
+TRANSLATION_CACHE_SIZE = 1024
+
+# seconds a cached translation is valid, None keeps it until it is evicted
+TRANSLATION_CACHE_TTL = 24 * 60 * 60
+
+# let identical translation requests that arrive at the same time wait for the first one instead of translating again,
+# each request is still logged
+TRANSLATION_SINGLE_FLIGHT = True
+
+# maximum number of questions of a request to /translate/batch
+TRANSLATION_BATCH_MAX_ITEMS = 1000
+
+# number of questions of /translate/batch that are passed to a translator at once
+TRANSLATION_BATCH_CHUNK_SIZE = 32
+
+# threads per web server process that translate the uploaded jobs. 0 leaves them to `manage.py process_jobs`,
+# which runs the jobs outside of the processes that answer the requests and loads the translators only once.
+# A larger number makes every web server process translate jobs next to the requests and load the translators
+JOB_WORKERS = 0
+
+# seconds between two checks of a job worker for new jobs
+JOB_POLL_INTERVAL = 5
+
+# seconds after which a running job whose worker reported no progress is resumed by another worker
+JOB_HEARTBEAT_TIMEOUT = 300
+
+# experimental, off by default: translators whose translations are also cached per question template (i.e. the
+# question without its values), the sql of a cached template is completed with the values of the question instead
+# of running the translator. The built sql is not checked against a translation of the question and the templates
+# are found by a pattern of the adapter, not by the anonymization of the translator. On the Spider dev set no
+# question hits the cache (see validate_template_cache.py and SETUP.md), only enable it for a validated workload
+TEMPLATE_CACHE_TRANSLATORS = []
+
+# number of question templates cached per process
+TEMPLATE_CACHE_SIZE = 1024
+
+# name of the cache in CACHES that all worker processes share for translations, None disables it
+TRANSLATION_SHARED_CACHE = 'translations'
+
+# number of the most frequent translations of the log that are added to the shared cache at the start, 0 disables it
+TRANSLATION_CACHE_WARMUP = 1000
+
+
+# Logging
+# report load and unload events of the translators
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
+
+
@@ -24,4 +24,9 @@ SECRET_KEY = secrets.SECRET_KEY
 SESSION_COOKIE_SECURE = True
 CSRF_COOKIE_SECURE = True
 
+### TRANSLATORS ###
+
+# load the models before the first request instead of delaying it
+EAGER_TRANSLATOR_LOADING = True
+
 
@@ -14,3 +14,20 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nlidbTranslator.settings')
 
 application = get_wsgi_application()
+
+# set up the translators before the first request if configured (EAGER_TRANSLATOR_LOADING)
+from api.setup_util import load_eager_translators
+from api.translation_cache import warm_translation_cache
+from api.jobs import job_workers
+
+load_eager_translators()
+warm_translation_cache()
+# process the queued jobs and resume those that were interrupted in every worker process if JOB_WORKERS is set
+# (by default `manage.py process_jobs` processes them): uWSGI imports this file before it forks the workers
+# (unless lazy-apps is set), the threads would not survive it
+try:
+    from uwsgidecorators import postfork
+except ImportError:
+    job_workers.start()
+else:
+    postfork(job_workers.start)
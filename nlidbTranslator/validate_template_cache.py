@@ -0,0 +1,146 @@
+import argparse
+import json
+
+from api.template_cache import to_skeleton, fill_skeleton
+from adapters.editsql.constants import EVAL_REFERENCE_FILE, CURRENT_DIR
+from adapters.editsql.templates import NUMBER, anonymize_question
+
+
+def load_questions(reference_file, amount):
+    # the reference file of the editsql evaluation holds the spider dev questions
+    with open(str(reference_file)) as infile:
+        references = json.load(infile)
+    questions = [{"nl_question": " ".join(r["input_seq"]), "db_id": r["database_id"]} for r in references]
+    return questions[:amount] if amount else questions
+
+
+def recorded_translations(reference_file):
+    """
+        Returns a translation function that looks up the predictions of standalone editsql in the reference file,
+        they are not post-processed, which does not change the values
+    """
+    with open(str(reference_file)) as infile:
+        references = json.load(infile)
+    predictions = {(" ".join(r["input_seq"]), r["database_id"]): " ".join(r["flat_prediction"]) for r in references}
+    return lambda nl_question, db_id: predictions[(nl_question, db_id)]
+
+
+def value_variant(question):
+    """
+        Returns the question with other values (numbers increased by one, " 2" appended to quoted values)
+        or None if the question has no values
+    """
+    template, values = anonymize_question(question["nl_question"])
+    if not values:
+        return None
+    variant_values = dict()
+    for placeholder, value in values.items():
+        if placeholder.startswith(NUMBER):
+            variant_values[placeholder] = str(int(value) + 1) if value.isdigit() else str(float(value) + 1)
+        else:
+            variant_values[placeholder] = value + " 2"
+    return {"nl_question": fill_skeleton(template, variant_values), "db_id": question["db_id"]}
+
+
+def with_variants(questions):
+    # spider dev has no two questions with the same template, each question with values is followed by a variant
+    result = []
+    for question in questions:
+        result.append(question)
+        variant = value_variant(question)
+        if variant is not None:
+            result.append(variant)
+    return result
+
+
+def validate(questions, translate=None):
+    """
+        Replay the questions through a template cache. For every hit the translation built from the cached skeleton
+        is compared to the translation of the model.
+
+        Args:
+            questions: list of dicts with values for nl_question and db_id
+            translate: translation function, None only counts the questions whose template was seen before
+
+        Returns:
+            the report as a dict
+    """
+    skeletons = dict()
+    seen = set()
+    repeated = 0
+    with_values = 0
+    hits = 0
+    cacheable = 0
+    differences = []
+    for question in questions:
+        template, values = anonymize_question(question["nl_question"])
+        key = (question["db_id"], template)
+        with_values += bool(values)
+        repeated += key in seen
+        seen.add(key)
+        if translate is None:
+            continue
+
+        sql = translate(question["nl_question"], question["db_id"])
+        if key in skeletons:
+            hits += 1
+            substituted = fill_skeleton(skeletons[key], values)
+            if substituted != sql:
+                differences.append({"nl_question": question["nl_question"], "db_id": question["db_id"],
+                                    "template": template, "translation": sql, "substituted": substituted})
+        else:
+            skeleton = to_skeleton(sql, values)
+            if skeleton is not None:
+                skeletons[key] = skeleton
+                cacheable += bool(values)
+
+    report = {
+        "# questions": len(questions),
+        "# questions with values": with_values,
+        "# templates": len(seen),
+        "% repeated templates": repeated * 100 / len(questions),
+    }
+    if translate is not None:
+        # the other questions with values are translated by the model every time
+        report["% cacheable questions with values"] = cacheable * 100 / with_values if with_values else None
+        report["% hits"] = hits * 100 / len(questions)
+        report["% hits with different sql"] = len(differences) * 100 / hits if hits else None
+        report["diff"] = differences
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure the hit rate of the template cache for EditSQL on the spider "
+                                                 "dev questions and how often the sql of a hit differs from the "
+                                                 "translation of the model")
+    parser.add_argument('--reference_file', type=str, default=str(EVAL_REFERENCE_FILE))
+    parser.add_argument('--amount', type=int, default=0, help="number of questions, 0 for all")
+    parser.add_argument('--variants', action='store_true',
+                        help="add a variant with other values after each question with values")
+    parser.add_argument('--templates_only', action='store_true',
+                        help="only count the repeated templates, without loading the model")
+    parser.add_argument('--recorded', action='store_true',
+                        help="use the predictions of standalone editsql in the reference file instead of the model")
+    args = parser.parse_args()
+    if args.recorded and args.variants:
+        parser.error("the reference file has no predictions for the variants")
+
+    questions = load_questions(args.reference_file, args.amount)
+    if args.variants:
+        questions = with_variants(questions)
+
+    if args.templates_only:
+        report = validate(questions)
+    elif args.recorded:
+        report = validate(questions, recorded_translations(args.reference_file))
+    else:
+        from adapters.editsql.editsql_adapter import EditsqlAdapter, write_json_log_results
+
+        report = validate(questions, EditsqlAdapter("spider").translate)
+        results_dir = CURRENT_DIR / "evaluation" / "results"
+        results_dir.mkdir(parents=True, exist_ok=True)
+        write_json_log_results(report, results_dir)
+
+    for name, value in report.items():
+        if name != "diff":
+            print("{:<36} {}".format(name, round(value, 2) if isinstance(value, float) else value))